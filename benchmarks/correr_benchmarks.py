@@ -0,0 +1,186 @@
+# Benchmarks de las funciones públicas sobre datos de datos_sinteticos.py. Cada caso se mide por tiempo (mejor y
+# mediana de varias repeticiones) y por memoria pico con tracemalloc (en una corrida aparte, porque tracemalloc
+# hace más lenta la ejecución). Los resultados se guardan como JSON y se comparan contra una base.
+#
+#   python benchmarks/correr_benchmarks.py --tamanos 10000 100000 --guardar-base
+#   python benchmarks/correr_benchmarks.py --tamanos 10000 100000 --casos cruzar tabla_pivote
+#
+# Sale con código 1 si algún caso es más lento o usa más memoria que la base por encima de --umbral.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import data_preprocessing as dp
+from datos_sinteticos import generar_datos
+
+CARPETA = Path(__file__).resolve().parent
+CARPETA_DATOS = CARPETA / ".datos"
+CARPETA_BASES = CARPETA / "bases"
+CARPETA_RESULTADOS = CARPETA / "resultados"
+
+TAMANOS = [10_000, 100_000, 1_000_000, 10_000_000]
+
+# Un caso solo cuenta como más lento si además del umbral tarda al menos esto más que la base (ruido en casos cortos)
+MINIMO_SEGUNDOS = 0.01
+
+# Cada caso recibe las rutas de los archivos y los reportes ya procesados, y regresa la función a medir
+CASOS = {
+    "procesar_reporte_general_de_usuarios": lambda rutas, datos: lambda: dp.procesar_reporte_general_de_usuarios(rutas["RGU"]),
+    "procesar_reporte_metas_y_resultados": lambda rutas, datos: lambda: dp.procesar_reporte_metas_y_resultados(rutas["RMR"][0]),
+    "procesar_shipping_list": lambda rutas, datos: lambda: dp.procesar_shipping_list(rutas["SL"]),
+    "procesar_datos": lambda rutas, datos: lambda: dp.procesar_datos(rutas["RGU"], rutas["RMR"][0], rutas["SL"]),
+    "filtrar_Y": lambda rutas, datos: lambda: dp.filtrar_Y(datos["RGU"], ("PERFIL","=","Estrella"), ("JOYAS_CANJEADOS",">",0)),
+    "filtrar_O": lambda rutas, datos: lambda: dp.filtrar_O(datos["RGU"], ("PERFIL","=","Estrella"), ("PERFIL","=","Mayorista")),
+    "filtrar_cruzado": lambda rutas, datos: lambda: dp.filtrar_cruzado(datos["SL"], "ID_UNICO_ANDREA", datos["RGU"], "ID_UNICO_ANDREA", indice=dp.indice_llaves()),
+    "tabla_pivote": lambda rutas, datos: lambda: dp.tabla_pivote(datos["SL"], "ESTADO", "PRECIO PRODUCTO", columnas="PAQUETERIA"),
+    "tabla_pivote_nunique": lambda rutas, datos: lambda: dp.tabla_pivote(datos["RGU"], "ESTADO", "ID_UNICO_ANDREA", columnas="PERFIL"),
+    "cruzar": lambda rutas, datos: lambda: dp.cruzar(datos["SL"], datos["RGU"], "ID_UNICO_ANDREA", "ID_UNICO_ANDREA", metodo_cruce="izquierda", indice=dp.indice_llaves()),
+    "top_usuarias": lambda rutas, datos: lambda: dp.top_usuarias(rutas["RMR"]),
+    "perfilar_columnas": lambda rutas, datos: lambda: dp.perfilar_columnas(datos["RGU"]),
+    "perfilar_columnas_aproximado": lambda rutas, datos: lambda: dp.perfilar_columnas(datos["RGU"], aproximado=True)
+}
+
+# Los archivos generados se reutilizan entre corridas mientras no cambien el tamaño ni la semilla
+def _datos(tamano, semilla) -> dict:
+    carpeta = CARPETA_DATOS / f"{tamano}_{semilla}"
+    rutas = {
+        "RGU": carpeta / "Reportegeneraldeusuarios.csv",
+        "RMR": [ carpeta / f"Reportedemetasyresultados_{mes}.csv" for mes in (1, 2, 3) ],
+        "SL": carpeta / "v_sl.csv"
+    }
+    if not all(ruta.exists() for ruta in [rutas["RGU"], rutas["SL"], *rutas["RMR"]]):
+        rutas = generar_datos(tamano, carpeta, semilla=semilla)
+    return rutas
+
+# Las funciones imprimen mensajes y top_usuarias escribe un Excel en el directorio actual
+@contextlib.contextmanager
+def _aislado(directorio):
+    anterior = os.getcwd()
+    os.chdir(directorio)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        os.chdir(anterior)
+
+# Cada repetición empieza sin los resultados memorizados de tabla_pivote, los índices de llaves de los cruces ni
+# los perfiles de columnas
+def _en_frio():
+    dp._PIVOTES_MEMORIZADOS.clear()
+    dp._INDICES_LLAVES.clear()
+    dp._PERFILES_COLUMNAS.clear()
+
+def medir(funcion, repeticiones=3) -> dict:
+    tiempos = []
+    with tempfile.TemporaryDirectory() as directorio, _aislado(directorio):
+        for _ in range(repeticiones):
+            _en_frio()
+            inicio = perf_counter()
+            funcion()
+            tiempos.append(perf_counter() - inicio)
+
+        _en_frio()
+        tracemalloc.start()
+        try:
+            funcion()
+            pico = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {"segundos": min(tiempos), "mediana": statistics.median(tiempos), "pico_mb": pico / 2**20}
+
+def correr(tamanos, casos=None, repeticiones=3, semilla=0) -> dict:
+    casos = list(CASOS) if casos is None else casos
+    resultados = {}
+    for tamano in tamanos:
+        rutas = _datos(tamano, semilla)
+        with _aislado(os.getcwd()):
+            datos = dict(zip(["RGU", "RMR", "SL"], dp.procesar_datos(rutas["RGU"], rutas["RMR"][0], rutas["SL"], filtrar_default=False)))
+        for caso in casos:
+            medida = resultados[f"{caso}@{tamano}"] = medir(CASOS[caso](rutas, datos), repeticiones)
+            print(f"{caso:<40}{tamano:>10}{medida['segundos']:>10.3f} s{medida['pico_mb']:>10.1f} MB")
+    return resultados
+
+def _metadatos() -> dict:
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "procesador": platform.processor()
+    }
+
+# Casos más lentos o con más memoria que la base por encima de umbral (proporción, 0.15 = 15%)
+def regresiones(resultados, base, umbral=0.15) -> list:
+    encontradas = []
+    for caso, medida in resultados.items():
+        if caso not in base:
+            continue
+        for metrica in ("segundos", "pico_mb"):
+            minimo = MINIMO_SEGUNDOS if metrica == "segundos" else 0
+            if base[caso][metrica] > 0 and medida[metrica] > base[caso][metrica] * (1 + umbral) + minimo:
+                encontradas.append((caso, metrica, base[caso][metrica], medida[metrica]))
+    return encontradas
+
+def _reporte(resultados, base) -> str:
+    lineas = [f"{'caso':<50}{'segundos':>10}{'base':>10}{'cambio':>9}{'pico MB':>10}{'base':>10}{'cambio':>9}"]
+    for caso, medida in resultados.items():
+        fila = f"{caso:<50}"
+        for metrica in ("segundos", "pico_mb"):
+            anterior = base.get(caso, {}).get(metrica)
+            cambio = f"{100 * (medida[metrica] / anterior - 1):+.1f}%" if anterior else "-"
+            fila += f"{medida[metrica]:>10.3f}{anterior if anterior is not None else float('nan'):>10.3f}{cambio:>9}"
+        lineas.append(fila)
+    return "\n".join(lineas)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks del procesamiento de reportes")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS[:2], help=f"filas por reporte, p. ej. {TAMANOS}")
+    parser.add_argument("--casos", nargs="+", choices=list(CASOS), default=None)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--base", default="base", help="nombre de la base en benchmarks/bases/")
+    parser.add_argument("--guardar-base", action="store_true", help="guarda esta corrida como la base")
+    parser.add_argument("--umbral", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    resultados = correr(args.tamanos, args.casos, args.repeticiones, args.semilla)
+    corrida = {"metadatos": _metadatos(), "resultados": resultados}
+
+    CARPETA_RESULTADOS.mkdir(exist_ok=True)
+    (CARPETA_RESULTADOS / f"{datetime.now():%Y%m%d_%H%M%S}.json").write_text(json.dumps(corrida, indent=2), encoding="utf-8")
+
+    archivo_base = CARPETA_BASES / f"{args.base}.json"
+    base = json.loads(archivo_base.read_text(encoding="utf-8"))["resultados"] if archivo_base.exists() else {}
+    print()
+    print(_reporte(resultados, base))
+
+    if args.guardar_base:
+        CARPETA_BASES.mkdir(exist_ok=True)
+        base_nueva = (json.loads(archivo_base.read_text(encoding="utf-8")) if archivo_base.exists() else {"resultados": {}})
+        base_nueva["metadatos"] = corrida["metadatos"]
+        base_nueva["resultados"].update(resultados)
+        archivo_base.write_text(json.dumps(base_nueva, indent=2), encoding="utf-8")
+        return 0
+
+    encontradas = regresiones(resultados, base, args.umbral)
+    for caso, metrica, anterior, actual in encontradas:
+        print(f"REGRESIÓN {caso} {metrica}: {anterior:.3f} -> {actual:.3f}")
+    return 1 if encontradas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# Generador de reportes sintéticos para los benchmarks: reporte general de usuarios, reportes mensuales de metas y
+# resultados y Shipping List con las columnas de los esquemas (en el orden del archivo de mapeo), acentos en
+# latin-1, precios con "$", porcentajes con "%" y los tokens de nulos de cada reporte. Con la misma semilla y el
+# mismo tamaño los archivos son idénticos.
+#
+#   python benchmarks/datos_sinteticos.py 100000 datos_100k
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import data_preprocessing as dp
+
+# Las filas se escriben por bloques para que 10M de filas no tengan que estar en memoria al mismo tiempo
+FILAS_POR_BLOQUE = 500_000
+
+ENCODINGS = {"RGU": "latin-1", "RMR": "utf-8", "SL": "latin-1"}
+
+# Proporción de valores nulos en columnas de texto, numéricas y de fecha
+PROPORCION_NULOS = 0.05
+
+NOMBRES = np.array(["María", "José", "Sofía", "Iñaki", "Ramón", "Begoña", "Ángeles", "Jesús", "Mónica", "Raúl"], dtype=object)
+APELLIDOS = np.array(["Pérez", "López", "Núñez", "Hernández", "Gómez", "Martínez", "Ibáñez", "Peña", "Vázquez", "Muñoz"], dtype=object)
+ESTADOS = np.array(["Jalisco", "Nuevo León", "Querétaro", "Ciudad de México", "Michoacán", "Yucatán", "Estado de México", "San Luis Potosí"], dtype=object)
+PERFILES = np.array(["Estrella", "Mayorista", "Invitada", "Estrellita"], dtype=object)
+
+# Valores de columnas conocidas; las demás columnas de texto toman un vocabulario propio de cada columna
+VALORES_COLUMNAS = {
+    "NOMBRE": NOMBRES,
+    "NOMBRE (S)": NOMBRES,
+    "APELLIDO_PATERNO": APELLIDOS,
+    "APELLIDO_MATERNO": APELLIDOS,
+    "APELLIDO PATERNO": APELLIDOS,
+    "APELLIDO MATERNO": APELLIDOS,
+    "ESTADO": ESTADOS,
+    "PERFIL": PERFILES,
+    "SEXO": np.array(["F", "M"], dtype=object),
+    "ESTATUS": np.array(["Activo", "Inactivo", "Baja"], dtype=object),
+    "ESTATUS DE ENTREGA": np.array(["Entregado", "En tránsito", "Devolución", "Cancelado"], dtype=object),
+    "PAQUETERIA": np.array(["Estafeta", "DHL", "FedEx", "Paquetexpress"], dtype=object),
+    "CATEGORIA": np.array(["Electrónica", "Hogar", "Belleza", "Niños", "Recargas"], dtype=object),
+    "MARCA": np.array([f"Marca {i}" for i in range(40)], dtype=object),
+    "NIVEL": np.arange(1, 6),
+    "HABILITADO": np.array([0, 1]),
+    "ACTIVADO": np.array([0, 1]),
+    "JOYAS_TOTALES_GANADAS": np.array([0, 0, 10, 250, 1000, 5000]),
+    "JOYAS_CANJEADOS": np.array([0, 0, 5, 100, 800]),
+    "CUOTA_OBJETIVO": np.array([1000.0, 5000.0, 20000.0, 50000.0]),
+    "CANTIDAD": np.arange(1, 4)
+}
+
+def _nulos(rng, valores, tokens, proporcion=PROPORCION_NULOS) -> np.ndarray:
+    valores = valores.astype(object)
+    if tokens:
+        nulos = rng.random(valores.shape[0]) < proporcion
+        valores[nulos] = rng.choice(np.array(tokens, dtype=object), nulos.sum())
+    return valores
+
+def _fechas(rng, filas, inicio, dias) -> np.ndarray:
+    fechas = np.datetime64(inicio) + rng.integers(0, dias, filas).astype("timedelta64[D]")
+    return np.datetime_as_string(fechas, unit="D").astype(object)
+
+# Un identificador por usuaria; la Shipping List también tiene canjes de ids que no están en el reporte de usuarios
+def _ids(numeros) -> np.ndarray:
+    return np.char.add("A", np.char.zfill(numeros.astype(str), 8)).astype(object)
+
+def _columna(rng, reporte, esquema, columna, filas, usuarias, mes, año) -> np.ndarray:
+    tokens = dp.NA_VALUES_REPORTES[reporte]
+
+    if columna == "ID_UNICO_ANDREA":
+        return _ids(usuarias)
+    if columna in ("USER_ID", "ID_UNICO_CANJE"):
+        return np.char.add(columna[:2] + "_", rng.integers(0, 10 * filas, filas).astype(str)).astype(object)
+    if columna == "MES":
+        return np.full(filas, mes)
+    if columna == "AÑO":
+        return np.full(filas, año)
+    if columna in esquema["fechas"]:
+        if columna == "FECHA_DE_NACIMIENTO":
+            fechas = _fechas(rng, filas, "1950-01-01", 25_000)
+        else:
+            fechas = _fechas(rng, filas, "2023-01-01", 700)
+        return _nulos(rng, fechas, esquema["na_values"])
+    if columna in esquema["limpieza"]:
+        simbolo = esquema["limpieza"][columna]
+        numeros = np.round(rng.random(filas) * (150 if simbolo == "%" else 3000), 2)
+        texto = np.char.add(numeros.astype(str), "%") if simbolo == "%" else np.char.add("$", numeros.astype(str))
+        return _nulos(rng, texto, [""] if simbolo == "%" else [])
+    if columna in VALORES_COLUMNAS:
+        valores = rng.choice(VALORES_COLUMNAS[columna], filas)
+        return valores if valores.dtype != object else _nulos(rng, valores, tokens)
+    if columna == "MONTO_DE_VENTA_NETA_ACUMULADA_AL_CIERRE_DE_MES":
+        return np.round(rng.random(filas) * 60000, 2)
+    if esquema["dtype"][columna] == "float64":
+        return _nulos(rng, np.round(rng.random(filas) * 1000, 2), [""])
+
+    vocabulario = np.array([ f"{columna[:3]}_{i}ñ" for i in range(200) ], dtype=object)
+    return _nulos(rng, rng.choice(vocabulario, filas), tokens)
+
+def _escribir_reporte(rng, reporte, archivo, filas, total_usuarias, mes=1, año=2025) -> Path:
+    esquema = dp.esquema_reporte(reporte)
+    for inicio in range(0, max(filas, 1), FILAS_POR_BLOQUE):
+        bloque = min(FILAS_POR_BLOQUE, filas - inicio)
+        if reporte == "RGU":
+            usuarias = np.arange(inicio, inicio + bloque)
+        elif reporte == "RMR":
+            usuarias = np.sort(rng.choice(total_usuarias, bloque, replace=bloque > total_usuarias))
+        else:
+            usuarias = rng.integers(0, total_usuarias + total_usuarias // 50 + 1, bloque)
+        datos = { columna: _columna(rng, reporte, esquema, columna, bloque, usuarias, mes, año) for columna in esquema["usecols"] }
+        pd.DataFrame(datos).to_csv(archivo, mode="w" if inicio == 0 else "a", header=(inicio == 0), index=False, encoding=ENCODINGS[reporte])
+    return archivo
+
+# Genera los tres reportes con filas renglones cada uno (los mensuales con 90% de las usuarias) en carpeta.
+# Regresa {"RGU": ruta, "RMR": [rutas por mes], "SL": ruta}.
+def generar_datos(filas, carpeta, semilla=0, meses=(1, 2, 3), año=2025) -> dict:
+    carpeta = Path(carpeta)
+    carpeta.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(semilla)
+
+    rutas = {"RGU": _escribir_reporte(rng, "RGU", carpeta / "Reportegeneraldeusuarios.csv", filas, filas)}
+    rutas["RMR"] = [ _escribir_reporte(rng, "RMR", carpeta / f"Reportedemetasyresultados_{mes}.csv", int(filas * 0.9), filas, mes, año) for mes in meses ]
+    rutas["SL"] = _escribir_reporte(rng, "SL", carpeta / "v_sl.csv", filas, filas)
+    return rutas
+
+if __name__ == "__main__":
+    generar_datos(int(sys.argv[1]), sys.argv[2], semilla=int(sys.argv[3]) if len(sys.argv) > 3 else 0)
@@ -1,21 +1,195 @@
 # Paqueterías
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+import operator
+import os
+import hashlib
+import codecs
+import csv
+import json
+import re
+from collections import Counter
+import importlib.util
+import inspect
+from functools import wraps
+import weakref
+import contextlib
+import logging
+import threading
+import queue
+import atexit
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from openpyxl import Workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-from time import time
+from time import time, perf_counter, process_time
+
+## Perfilado por etapas
+
+# Destinos que reciben los registros de cada etapa (funciones que reciben un dict). Sin destinos el perfilado está
+# apagado y etapa() / con_perfilado solo revisan que esta lista esté vacía.
+_DESTINOS_PERFILADO: list = []
+_PILA_ETAPAS = threading.local()
+
+def _filas_de(valor):
+    return valor.shape[0] if isinstance(valor, pd.DataFrame) else None
+
+# Memoria actual del proceso en bytes: la de tracemalloc si está activo (ver perfilar(trazar_memoria=True)) o el RSS
+# de /proc/self/statm en Linux; en otros sistemas no se mide.
+def _memoria_actual():
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class _Etapa:
+    __slots__ = ("registro", "_inicio", "_cpu", "_memoria")
+
+    def __init__(self, nombre, entrada=None, funcion=None):
+        self.registro = {"etapa": nombre, "funcion": funcion, "ruta": funcion or nombre, "filas_entrada": _filas_de(entrada), "filas_salida": None}
+
+    def __enter__(self):
+        pila = _PILA_ETAPAS.__dict__.setdefault("pila", [])
+        if pila:
+            padre = pila[-1].registro
+            self.registro["funcion"] = self.registro["funcion"] or padre["funcion"]
+            self.registro["ruta"] = padre["ruta"] + " > " + self.registro["ruta"]
+        pila.append(self)
+        self.registro["inicio"] = time()
+        self._memoria = _memoria_actual()
+        self._cpu = process_time()
+        self._inicio = perf_counter()
+        return self
+
+    # Registra las filas de salida y regresa el mismo valor, p. ej. RGU = e.salida(leer_csv(...))
+    def salida(self, valor):
+        self.registro["filas_salida"] = _filas_de(valor)
+        return valor
+
+    def __exit__(self, tipo, error, traza):
+        segundos = perf_counter() - self._inicio
+        cpu = process_time() - self._cpu
+        memoria = _memoria_actual()
+        _PILA_ETAPAS.pila.pop()
+        self.registro |= {
+            "segundos": segundos,
+            "cpu_segundos": cpu,
+            "memoria_delta_mb": None if memoria is None or self._memoria is None else (memoria - self._memoria) / 2**20,
+            "error": None if tipo is None else tipo.__name__
+        }
+        for destino in list(_DESTINOS_PERFILADO):
+            destino(dict(self.registro))
+        return False
+
+class _EtapaApagada:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def salida(self, valor):
+        return valor
+
+    def __exit__(self, tipo, error, traza):
+        return False
+
+_ETAPA_APAGADA = _EtapaApagada()
+
+# Mide una etapa: tiempo de reloj y de CPU, filas de entrada (entrada) y de salida (salida()) y cambio de memoria.
+#   with etapa("lectura") as e:
+#     RGU = e.salida(leer_csv(...))
+def etapa(nombre, entrada=None):
+    return _Etapa(nombre, entrada) if _DESTINOS_PERFILADO else _ETAPA_APAGADA
+
+# Mide una función pública completa como la etapa nombre. Las etapas internas llevan el nombre de la función en
+# "funcion" y la ruta desde la función más externa en "ruta" (p. ej. "procesar_datos > procesar_shipping_list >
+# lectura"). Las filas de entrada y salida son las del primer argumento y las del resultado.
+def con_perfilado(nombre):
+    def decorador(funcion):
+        @wraps(funcion)
+        def funcion_perfilada(*args, **kwargs):
+            if not _DESTINOS_PERFILADO:
+                return funcion(*args, **kwargs)
+            with _Etapa(nombre, args[0] if args else None, funcion.__name__) as registro:
+                return registro.salida(funcion(*args, **kwargs))
+        return funcion_perfilada
+    return decorador
+
+COLUMNAS_PERFILADO = ["ruta", "funcion", "etapa", "segundos", "cpu_segundos", "filas_entrada", "filas_salida", "memoria_delta_mb", "error", "inicio"]
+
+# Destino que guarda los registros en memoria; tabla() los regresa como dataframe
+class ColectorPerfilado:
+    def __init__(self):
+        self.registros = []
+
+    def __call__(self, registro):
+        self.registros.append(registro)
+
+    def tabla(self) -> pd.DataFrame:
+        return pd.DataFrame(self.registros, columns=COLUMNAS_PERFILADO)
+
+# Destino que escribe cada registro como JSON en un logger (por defecto el de este módulo)
+def destino_logger(logger=None, nivel=logging.INFO):
+    logger = logging.getLogger(__name__) if logger is None else logger
+    return lambda registro: logger.log(nivel, json.dumps(registro, ensure_ascii=False))
+
+# Destino que agrega cada registro como una línea JSON al archivo path
+def destino_jsonl(path):
+    candado = threading.Lock()
+    def escribir(registro):
+        with candado, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+    return escribir
+
+# Activa el perfilado dentro del bloque. Sin destinos los registros van a un ColectorPerfilado, que es lo que regresa:
+#   with perfilar() as colector:
+#     procesar_datos(...)
+#   colector.tabla()
+# Con trazar_memoria=True la memoria se mide con tracemalloc (más preciso, pero más lento). Las etapas que corren
+# en otros procesos (paralelo=True) no se registran.
+@contextlib.contextmanager
+def perfilar(*destinos, trazar_memoria=False):
+    destinos = destinos or (ColectorPerfilado(),)
+    iniciar_traza = trazar_memoria and not tracemalloc.is_tracing()
+    if iniciar_traza:
+        tracemalloc.start()
+    _DESTINOS_PERFILADO.extend(destinos)
+    try:
+        yield destinos[0]
+    finally:
+        for destino in destinos:
+            _DESTINOS_PERFILADO.remove(destino)
+        if iniciar_traza:
+            tracemalloc.stop()
+
+## Validación
+
+# Indica si un tipo de columna guarda texto (object de NumPy, string respaldado por Arrow o category de texto)
+def es_texto(dtype) -> bool:
+  if isinstance(dtype, pd.CategoricalDtype):
+    return es_texto(dtype.categories.dtype)
+  return (dtype == np.object_) or isinstance(dtype, pd.StringDtype)
 
 # Valida que los datos de un dataframe sean de cierto tipo especificado
+@con_perfilado("validación")
 def validate_dtypes(dtypes_series: pd.core.series.Series, dtype_dict: dict, date_columns: list = []) -> tuple[bool, str]:
   validation_message: str = "Successful validation"
 
+  missing = [column for column in [*dtype_dict.keys(), *date_columns] if column not in dtypes_series.index]
+  if missing:
+    validation_message = f"Columns {missing} are missing"
+    return (False, validation_message)
+
   for column in dtypes_series.index:
 
     column_type = dtypes_series[column].type
 
-    if (column in dtype_dict.keys()) and (column_type != dtype_dict[column]):
+    if (column in dtype_dict.keys()) and (dtype_dict[column] == np.object_) and es_texto(dtypes_series[column]):
+      continue
+
+    elif (column in dtype_dict.keys()) and (column_type != dtype_dict[column]):
       validation_message = f"{column} type is {dtypes_series[column]}, but the expected type is {dtype_dict[column]}"
       return (False, validation_message)
 
@@ -27,241 +201,1588 @@ def validate_dtypes(dtypes_series: pd.core.series.Series, dtype_dict: dict, date
 
 # Compara si los elementos de la columna de la tabla "izquierda" se encuentran
 # en otra columna de la tabla "derecha"
-def left_compare(left_df, left_val, right_df, right_val, indicator_name="_merge"):
+@con_perfilado("cruce")
+def left_compare(left_df, left_val, right_df, right_val, indicator_name="_merge", indice=None):
+  # pd.unique distingue None de NaN y el índice de llaves no, así que con llaves nulas se usa merge
+  indice = _indice_para(left_df, left_val, right_df, right_val, indice) if not left_df[left_val].hasnans else None
+  if indice is not None:
+    codigos_derecha = indice.codigos(right_df, right_val)
+    codigos_izquierda = pd.unique(indice.codigos(left_df, left_val))
+    izquierda, derecha = indice.parejas(codigos_izquierda, codigos_derecha, conservar=True)
+    merged = pd.DataFrame({left_val: indice.llaves.take(codigos_izquierda[izquierda])})
+    if right_val != left_val:
+      merged[right_val] = _tomar(right_df[right_val], derecha)
+    merged[indicator_name] = np.array([False, True], dtype=object)[(derecha >= 0).astype(np.int8)]
+    merged = merged.set_index(left_val)
+    assert merged.shape[0] == left_df.shape[0], f"{merged.shape[0] - left_df.shape[0]}"
+    return merged
+
   merged = pd.merge(pd.DataFrame(left_df[left_val].unique(),columns=[left_val]), right_df[right_val], left_on=left_val, right_on=right_val, how="left", indicator=indicator_name)
   merged[indicator_name] = merged[indicator_name].map({"left_only":False, "both":True})
   merged = merged.set_index(left_val)
   assert merged.shape[0] == left_df.shape[0], f"{merged.shape[0] - left_df.shape[0]}"
   return merged
 
-# Procesamiento del reporte general de usuarios
-def procesar_reporte_general_de_usuarios(path):
-  objects = [
-      "USER_ID",
-      "ID_UNICO_ANDREA",
-      "NOMBRE",
-      "APELLIDO_PATERNO",
-      "APELLIDO_MATERNO",
-      "PERFIL",
-      "CORREO_ELECTRONICO",
-      "CELULAR",
-      "ESTADO",
-      "SEXO",
-      "ESTATUS",
-      "RFC"
-  ]
-
-  floats = [
-      "NIVEL",
-      "JOYAS_TOTALES_GANADAS",
-      "JOYAS_CANJEADOS",
-      "JOYAS_DISPONIBLES",
-  ]
-
-  dates = [
-      "FECHA_DE_NACIMIENTO",
-      "FECHA_COMPLEMENTO_DATOS",
-      "ULTIMO_INGRESO_APP",
-      "FECHA_CREACIÓN_DE_USUARIO"
-  ]
-
-  na_values_list = [
-      "",
-      "null",
-      "NO UPDATE",
-      "0000-00-00"
-  ]
-
-  dtype_dict = {column:np.object_ for column in objects} | {column:np.float64 for column in floats}
-
-  RGU = pd.read_csv(
+## Columnas derivadas
+
+# Operadores de comparación aceptados en las condiciones (columna, condicion, valor)
+OPERADORES = {
+    "=": operator.eq,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "<>": operator.ne
+}
+
+# Marca el valor de una condición como el nombre de otra columna, p. ej.
+# ("VENTA_NETA_MES_1", ">=", Columna("CUOTA_OBJETIVO"))
+class Columna(str):
+    # distinto del repr de un texto, así las llaves de la caché distinguen ("A", "=", Columna("B")) de ("A", "=", "B")
+    def __repr__(self):
+        return f"Columna({str.__repr__(self)})"
+
+# Reglas de negocio de las columnas derivadas: (columna destino, condiciones, (etiqueta si se cumplen, etiqueta si no))
+# Las condiciones de una regla se combinan con "Y" y usan la misma forma que filtrar_Y / filtrar_O
+REGLAS_REPORTE_GENERAL_DE_USUARIOS = [
+    ("Ganadoras", [("JOYAS_TOTALES_GANADAS", "=", 0), ("PERFIL", "<>", "Mayorista")], ("No ganadora", "Ganadora")),
+    ("Con canje", [("JOYAS_CANJEADOS", "=", 0)], ("Sin canje", "Con canje")),
+    ("Con ingreso", [("ULTIMO_INGRESO_APP", "notnull")], ("Con ingreso", "Sin ingreso"))
+]
+
+REGLAS_REPORTE_METAS_Y_RESULTADOS = [
+    ("Logro meta", [("PORCENTAJE_DE_CUMPLIMIENTO", ">=", 100)], ("Cumplió", "No cumplió"))
+]
+
+# Evalúa una condición sobre la columna completa y regresa una máscara booleana de NumPy.
+# Los nulos cumplen solo "<>", igual que las comparaciones de NumPy con NaN.
+def mascara_condicion(dataframe, condicion) -> np.ndarray:
+    if len(condicion) == 3:
+        column, cond, val = condicion
+        if cond not in OPERADORES:
+            raise ValueError(f"No se reconoce la condición {cond}.")
+        if isinstance(val, Columna):
+            val = dataframe[val]
+        return OPERADORES[cond](dataframe[column], val).to_numpy(dtype=bool, na_value=(cond == "<>"))
+
+    elif len(condicion) == 2:
+        if condicion[1] == "notnull":
+            return dataframe[condicion[0]].notna().to_numpy()
+        elif condicion[1] == "isnull":
+            return dataframe[condicion[0]].isna().to_numpy()
+        raise ValueError(f'La segunda entrada de la condición {condicion} debe de ser: "notnull" o isnull.')
+
+    raise ValueError('Las condiciones deben de estar escritas de la forma:\n(columna, condicion, valor) o (columna, "notnull")')
+
+# Agrega al dataframe las columnas derivadas de una lista de reglas, evaluando cada regla sobre columnas completas.
+# Las etiquetas de texto se guardan como object (o category si categoricas=True) y las numéricas como enteros.
+@con_perfilado("columnas derivadas")
+def agregar_columnas_derivadas(dataframe, reglas, categoricas=False):
+    for destino, condiciones, (etiqueta_si, etiqueta_no) in reglas:
+        mask = np.ones(dataframe.shape[0], dtype=bool)
+        for condicion in condiciones:
+            mask &= mascara_condicion(dataframe, condicion)
+        codes = mask.astype(np.int8)
+
+        if isinstance(etiqueta_si, str) and categoricas:
+            dataframe[destino] = pd.Categorical.from_codes(codes, categories=[etiqueta_no, etiqueta_si])
+        elif isinstance(etiqueta_si, str):
+            dataframe[destino] = np.array([etiqueta_no, etiqueta_si], dtype=object)[codes]
+        else:
+            dataframe[destino] = np.array([etiqueta_no, etiqueta_si])[codes]
+
+    return dataframe
+
+## Motor de filtros
+
+# Debajo de esta fracción de filas candidatas, las condiciones siguientes se evalúan solo sobre esas filas
+FRACCION_EVALUACION_PARCIAL = 0.5
+
+# Evalúa una condición solo en las filas de posiciones (o en todas si posiciones es None)
+def _mascara_en_posiciones(dataframe, condicion, posiciones=None) -> np.ndarray:
+    if posiciones is None:
+        return mascara_condicion(dataframe, condicion)
+    columnas = [condicion[0]]
+    if len(condicion) == 3 and isinstance(condicion[2], Columna):
+        columnas.append(condicion[2])
+    return mascara_condicion(dataframe[list(dict.fromkeys(columnas))].take(posiciones), condicion)
+
+# Compila una lista de condiciones en una función dataframe -> máscara booleana de NumPy.
+# Con modo "Y" cada condición se evalúa solo en las filas que siguen cumpliendo y se detiene en cuanto no queda
+# ninguna; con modo "O" solo en las filas que todavía no cumplen, y se detiene cuando ya cumplen todas.
+def compilar_filtro(condiciones, modo="Y"):
+    assert modo in ("Y", "O"), 'El modo debe de ser "Y" u "O".'
+    condiciones = tuple(condiciones)
+
+    def filtro(dataframe) -> np.ndarray:
+        n = dataframe.shape[0]
+        FILTER = np.full(n, modo == "Y", dtype=bool)
+        pendientes = None
+        for condicion in condiciones:
+            if pendientes is not None and pendientes.size == 0:
+                break
+            mask = _mascara_en_posiciones(dataframe, condicion, pendientes)
+            if pendientes is None:
+                FILTER = FILTER & mask if modo == "Y" else FILTER | mask
+            else:
+                FILTER[pendientes] = mask if modo == "Y" else FILTER[pendientes] | mask
+            restantes = np.flatnonzero(FILTER if modo == "Y" else ~FILTER)
+            pendientes = restantes if restantes.size < FRACCION_EVALUACION_PARCIAL * n else None
+        return FILTER
+
+    return filtro
+
+# Separa las condiciones válidas de filtrar_Y / filtrar_O. Las inválidas se reportan y se ignoran.
+AVISO_OPERADORES_Y = '"="(igual), ">"(mayor), ">="(mayor o igual), "<"(menor), "<="(menor o igual) o "<>"(diferente)'
+AVISO_OPERADORES_O = '"="(igual), ">"(mayor), ">="(mayor o igual), "<"(menor), "<="(menor o igual), "<>"(diferente).'
+
+def _condiciones_validas(condiciones, aviso_operadores) -> list:
+    validas = []
+    for condicion in condiciones:
+        assert isinstance(condicion, tuple), 'Las condiciones deben de estar escritas de la forma:\n(columna, condicion, valor) o (columna, "notnull")'
+        if len(condicion) == 3:
+            if condicion[1] in OPERADORES:
+                validas.append(condicion)
+            else:
+                print(f"No se reconoce la condición {condicion[1]}.")
+                print(f'La segunda entrada de la condición {condicion} debe de ser: {aviso_operadores}')
+        elif len(condicion) == 2:
+            if condicion[1] in ("notnull", "isnull"):
+                validas.append(condicion)
+            else:
+                print(f'La segunda entrada de la condición {condicion} debe de ser: "notnull" o isnull.')
+    return validas
+
+# Envuelve un dataframe que se va a filtrar muchas veces. La primera vez que se filtra una columna por "=" se construye
+# un índice hash (posiciones agrupadas por valor) y la primera vez que se filtra por rango un índice ordenado; los
+# filtros siguientes sobre esas columnas cuestan O(coincidencias) en vez de O(filas).
+# El dataframe no debe modificarse mientras se use el envoltorio, porque los índices no se actualizan.
+class FrameIndexado:
+
+    def __init__(self, dataframe):
+        self.dataframe = dataframe
+        self._indices_hash = {}
+        self._indices_ordenados = {}
+
+    def __len__(self):
+        return self.dataframe.shape[0]
+
+    # valores únicos, posiciones ordenadas por valor y frontera de cada valor dentro de esas posiciones
+    def _indice_hash(self, column):
+        if column not in self._indices_hash:
+            codes, uniques = pd.factorize(self.dataframe[column])
+            validos = np.flatnonzero(codes >= 0)
+            orden = validos[np.argsort(codes[validos], kind="stable")]
+            fronteras = np.concatenate(([0], np.cumsum(np.bincount(codes[validos], minlength=len(uniques)))))
+            self._indices_hash[column] = (pd.Index(uniques), orden, fronteras)
+        return self._indices_hash[column]
+
+    # valores no nulos ordenados y sus posiciones
+    def _indice_ordenado(self, column):
+        if column not in self._indices_ordenados:
+            serie = self.dataframe[column]
+            if serie.dtype.kind == "M":
+                valores = serie.to_numpy()
+            else:
+                valores = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+            validos = np.flatnonzero(~pd.isna(valores))
+            orden = validos[np.argsort(valores[validos], kind="stable")]
+            self._indices_ordenados[column] = (valores[orden], orden)
+        return self._indices_ordenados[column]
+
+    # Posiciones (sin ordenar) que cumplen la condición usando un índice, o None si la condición no es indexable
+    def _posiciones_indexadas(self, condicion):
+        if len(condicion) != 3 or isinstance(condicion[2], Columna) or condicion[0] not in self.dataframe.columns:
+            return None
+        column, cond, val = condicion
+        dtype = self.dataframe[column].dtype
+        es_numero = isinstance(val, (int, float, np.number)) and not isinstance(val, (bool, np.bool_))
+        es_numerica = dtype.kind in "iuf" and not isinstance(dtype, pd.CategoricalDtype)
+
+        if cond == "=" and ((es_texto(dtype) and isinstance(val, str)) or (es_numerica and es_numero)):
+            uniques, orden, fronteras = self._indice_hash(column)
+            code = uniques.get_indexer([val])[0]
+            if code < 0:
+                return np.empty(0, dtype=np.intp)
+            return orden[fronteras[code]:fronteras[code + 1]]
+
+        if cond in (">", ">=", "<", "<="):
+            if es_numerica and es_numero:
+                val = np.float64(val)
+            elif isinstance(dtype, np.dtype) and dtype.kind == "M" and (isinstance(val, (str, np.datetime64)) or hasattr(val, "year")):
+                val = np.datetime64(pd.Timestamp(val).as_unit("ns"))
+            else:
+                return None
+            valores, orden = self._indice_ordenado(column)
+            if cond in (">", ">="):
+                return orden[np.searchsorted(valores, val, side="right" if cond == ">" else "left"):]
+            return orden[:np.searchsorted(valores, val, side="left" if cond == "<" else "right")]
+
+        return None
+
+    # Posiciones ordenadas de las filas que cumplen las condiciones, usando los índices cuando es posible
+    def posiciones(self, condiciones, modo="Y") -> np.ndarray:
+        indexadas = [ (condicion, self._posiciones_indexadas(condicion)) for condicion in condiciones ]
+
+        if modo == "Y":
+            con_indice = [ (posiciones.size, i) for i, (_, posiciones) in enumerate(indexadas) if posiciones is not None ]
+            if not con_indice:
+                return np.flatnonzero(compilar_filtro(condiciones, "Y")(self.dataframe))
+            # se parte de la condición indexada más selectiva y las demás se evalúan solo sobre esas filas
+            _, mejor = min(con_indice)
+            posiciones = np.sort(indexadas[mejor][1])
+            for i, (condicion, _) in enumerate(indexadas):
+                if i == mejor or posiciones.size == 0:
+                    continue
+                posiciones = posiciones[_mascara_en_posiciones(self.dataframe, condicion, posiciones)]
+            return posiciones
+
+        # sin condiciones válidas ninguna fila cumple el "O", como en filtrar_O sobre el dataframe
+        if not indexadas:
+            return np.empty(0, dtype=np.intp)
+        if any(posiciones is None for _, posiciones in indexadas):
+            return np.flatnonzero(compilar_filtro(condiciones, "O")(self.dataframe))
+        if len(indexadas) == 1:
+            return np.sort(indexadas[0][1])
+        return np.unique(np.concatenate([ posiciones for _, posiciones in indexadas ]))
+
+    def mascara(self, condiciones, modo="Y") -> np.ndarray:
+        FILTER = np.zeros(len(self), dtype=bool)
+        FILTER[self.posiciones(condiciones, modo)] = True
+        return FILTER
+
+    def filtrar(self, condiciones, modo="Y") -> pd.DataFrame:
+        return self.dataframe.take(self.posiciones(condiciones, modo))
+
+def indexar(dataframe) -> FrameIndexado:
+    return dataframe if isinstance(dataframe, FrameIndexado) else FrameIndexado(dataframe)
+
+## Tablas pivote
+
+# Resultados de tabla_pivote(memorizar=True) ya calculados, por dataframe, columnas usadas y argumentos (se descartan
+# los más viejos; las entradas de un dataframe se borran cuando el dataframe deja de existir)
+MAX_PIVOTES_MEMORIZADOS = 32
+_PIVOTES_MEMORIZADOS = {}
+
+# Identidad de una columna sin recorrer sus datos: el arreglo que la respalda (con referencia débil) y la posición,
+# forma y pasos de la columna dentro de él. Cambia si la columna se reasigna (df[col] = ..., astype, un dataframe
+# nuevo), pero no con escrituras dentro del mismo arreglo (df.loc[fila, col] = ...).
+def _huella_columna(serie) -> tuple:
+    if isinstance(serie.dtype, np.dtype):
+        valores = serie.to_numpy(copy=False)
+        base = valores
+        while isinstance(base.base, np.ndarray):
+            base = base.base
+        return weakref.ref(base), (valores.__array_interface__["data"][0], valores.shape, valores.strides, valores.dtype.str)
+    return weakref.ref(serie.array), (str(serie.dtype), len(serie.array))
+
+def _misma_columna(huella, serie) -> bool:
+    actual = _huella_columna(serie)
+    return huella[0]() is not None and huella[0]() is actual[0]() and huella[1] == actual[1]
+
+# Huella del contenido de una columna: cambia si la columna se reasigna y también si se escribe en el mismo arreglo
+# (df.loc[...] = ...). Cuesta una pasada de hash sobre la columna, menos que factorizarla o agruparla.
+def _huella_contenido(serie) -> tuple:
+    if isinstance(serie.dtype, np.dtype) and serie.dtype != np.object_:
+        datos = np.ascontiguousarray(serie.to_numpy(copy=False)).view(np.uint8)
+    else:
+        datos = pd.util.hash_pandas_object(serie, index=False, categorize=False).to_numpy()
+    return (str(serie.dtype), serie.shape[0], hashlib.blake2b(datos, digest_size=16).hexdigest())
+
+def _como_lista(columnas) -> list:
+    if columnas is None:
+        return []
+    return list(columnas) if isinstance(columnas, (list, tuple)) else [columnas]
+
+# Las category con orden (generación, de pd.cut) conservan todas sus categorías en las tablas, aunque no aparezcan.
+# Las category sin orden son las de compactar_dataframe y las etiquetas con categoricas=True, que reemplazan columnas
+# de texto, así que se agrupan solo por los valores que aparecen, igual que sin categoricas=True.
+def _categorias_completas(dtype) -> bool:
+    return isinstance(dtype, pd.CategoricalDtype) and dtype.ordered
+
+# Conteo de distintos por grupo con códigos factorizados, equivalente a pd.pivot_table(aggfunc="nunique", observed=True).
+# Los pares (grupo, valor) se deduplican una sola vez ordenando sus códigos, y los márgenes por fila, por columna y el
+# total salen de esos mismos pares. Con valores=None cuenta filas. Regresa None si la tabla no se puede calcular así.
+def _pivote_nunique(dataframe, filas, valores, columnas, margins, margins_name):
+    filas = _como_lista(filas)
+    columnas = _como_lista(columnas)
+    llaves = filas + columnas
+    if not filas or len(columnas) > 1 or len(set(llaves)) != len(llaves) or valores in llaves or dataframe.shape[0] == 0:
+        return None
+
+    codigos, unicos = [], []
+    try:
+        for llave in llaves:
+            codes, uniques = pd.factorize(dataframe[llave], sort=True)
+            codigos.append(codes)
+            unicos.append(uniques)
+    except TypeError:
+        return None
+    tamanos = [ max(len(uniques), 1) for uniques in unicos ]
+
+    if valores is None:
+        valor_codes, n_valores = np.arange(dataframe.shape[0]), dataframe.shape[0]
+    else:
+        valor_codes, valor_uniques = pd.factorize(dataframe[valores])
+        n_valores = max(len(valor_uniques), 1)
+    if int(np.prod(tamanos, dtype=object)) * n_valores >= 2**62:
+        return None
+
+    validos = np.logical_and.reduce([ codes >= 0 for codes in codigos ])
+    if not validos.any():
+        return None
+    grupo = np.ravel_multi_index([ codes[validos] for codes in codigos ], tamanos)
+    grupos = np.unique(grupo)
+    valor_codes = valor_codes[validos]
+    pares = np.unique(grupo[valor_codes >= 0] * n_valores + valor_codes[valor_codes >= 0])
+    par_grupo, par_valor = pares // n_valores, pares % n_valores
+
+    def etiquetas(codes_por_llave, nombres):
+        arrays = [ unicos[llaves.index(nombre)].take(codes) for nombre, codes in zip(nombres, codes_por_llave) ]
+        if len(arrays) == 1:
+            return pd.Index(arrays[0], name=nombres[0])
+        return pd.MultiIndex.from_arrays(arrays, names=nombres)
+
+    def distintos(grupos_pares, grupos_tabla):
+        return np.bincount(np.searchsorted(grupos_tabla, np.unique(grupos_pares * n_valores + par_valor) // n_valores), minlength=len(grupos_tabla))
+
+    nombre_margen = (margins_name,) + ("",) * (len(filas) - 1) if len(filas) > 1 else margins_name
+    total = np.unique(par_valor).size
+
+    if not columnas:
+        index = etiquetas(np.unravel_index(grupos, tamanos), filas)
+        tabla = pd.DataFrame({valores: distintos(par_grupo, grupos)}, index=index)
+        if margins:
+            margen = pd.DataFrame({valores: [total]}, index=pd.Index([nombre_margen]) if len(filas) == 1 else pd.MultiIndex.from_tuples([nombre_margen]))
+            tabla = pd.concat([tabla, margen])
+            tabla.index.names = filas
+        return tabla
+
+    # La tabla se arma con unstack, igual que pd.pivot_table, para conservar su orden de filas y sus tipos (enteros
+    # salvo que falte alguna combinación). En los márgenes, los grupos sin ningún valor no nulo quedan como NaN.
+    n_columnas = tamanos[-1]
+    grupos_fila, grupos_columna = np.unique(grupos // n_columnas), np.unique(grupos % n_columnas)
+    conteos = pd.Series(
+        distintos(par_grupo, grupos),
+        index=pd.MultiIndex(levels=[ pd.Index(uniques) for uniques in unicos ], codes=list(np.unravel_index(grupos, tamanos)), names=llaves)
+    )
+    tabla = conteos.unstack(columnas[0]).sort_index(axis=1)
+    if margins:
+        def margen(conteos):
+            return conteos if conteos.all() else np.where(conteos > 0, conteos, np.nan)
+        tabla[margins_name] = pd.Series(
+            margen(distintos(par_grupo // n_columnas, grupos_fila)),
+            index=etiquetas(np.unravel_index(grupos_fila, tamanos[:-1]), filas)
+        )
+        # cada celda del margen conserva su propio tipo, como en pd.pivot_table: entero, o NaN si la columna no tiene
+        # valores; el total general siempre es entero
+        conteos_columna = [ conteo if conteo > 0 else np.nan for conteo in distintos(par_grupo % n_columnas, grupos_columna) ]
+        fila_margen = pd.DataFrame(
+            { columna: [conteo] for columna, conteo in zip(tabla.columns, [ *conteos_columna, total ]) },
+            index=pd.Index([nombre_margen]) if len(filas) == 1 else pd.MultiIndex.from_tuples([nombre_margen])
+        )
+        tabla = pd.concat([tabla, fila_margen])
+        tabla.index.names = filas
+        tabla.columns.names = columnas
+    return tabla
+
+# pd.pivot_table (o _pivote_nunique si aggfunc es "nunique"). Con memorizar=True el resultado se guarda por
+# dataframe, columnas usadas y argumentos, y se reutiliza mientras esas columnas no se reasignen (ver _huella_columna)
+def _pivote(dataframe, filas, valores, columnas, aggfunc, margins, margins_name, memorizar=False) -> pd.DataFrame:
+    origen = dataframe
+    usadas = list(dict.fromkeys(_como_lista(filas) + _como_lista(columnas) + _como_lista(valores)))
+    llave = (id(dataframe), tuple(usadas), repr((filas, valores, columnas, aggfunc, margins, margins_name)))
+    if memorizar:
+        memorizado = _PIVOTES_MEMORIZADOS.pop(llave, None)
+        if memorizado is not None and memorizado[0]() is dataframe and all( _misma_columna(huella, dataframe[columna]) for huella, columna in zip(memorizado[1], usadas) ):
+            _PIVOTES_MEMORIZADOS[llave] = memorizado
+            return memorizado[2].copy()
+        huellas = [ _huella_columna(dataframe[columna]) for columna in usadas ]
+
+    pivot_table = None
+    llaves = _como_lista(filas) + _como_lista(columnas)
+    completas = any( _categorias_completas(dataframe[llave].dtype) for llave in llaves )
+    if aggfunc == "nunique" and (valores is None or isinstance(valores, str)) and not completas:
+        pivot_table = _pivote_nunique(dataframe, filas, valores, columnas, margins, margins_name)
+    if pivot_table is None:
+        if completas:
+            # observed=False aplica a todas las llaves; las category compactadas se agrupan por sus valores
+            compactadas = { llave: dataframe[llave].astype(dataframe[llave].cat.categories.dtype) for llave in llaves if isinstance(dataframe[llave].dtype, pd.CategoricalDtype) and not _categorias_completas(dataframe[llave].dtype) }
+            dataframe = dataframe[usadas].assign(**compactadas) if compactadas else dataframe
+        if valores is None:
+            dataframe = dataframe[usadas].assign(aux_column=np.arange(dataframe.shape[0]))
+            valores = "aux_column"
+        pivot_table = pd.pivot_table(
+            dataframe,
+            index=filas,
+            values=valores,
+            columns=columnas,
+            aggfunc=aggfunc,
+            margins=margins,
+            margins_name=margins_name,
+            observed=not completas
+        )
+
+    if not memorizar:
+        return pivot_table
+    _PIVOTES_MEMORIZADOS[llave] = (weakref.ref(origen, lambda _, llave=llave: _PIVOTES_MEMORIZADOS.pop(llave, None)), huellas, pivot_table)
+    while len(_PIVOTES_MEMORIZADOS) > MAX_PIVOTES_MEMORIZADOS:
+        _PIVOTES_MEMORIZADOS.pop(next(iter(_PIVOTES_MEMORIZADOS)))
+    return pivot_table.copy()
+
+# Descarta las tablas memorizadas de dataframe (o todas). Hace falta después de escribir dentro de sus columnas
+# (df.loc[fila, col] = ...), porque eso no cambia su huella.
+def olvidar_pivotes(dataframe=None) -> None:
+    for llave in [ llave for llave in _PIVOTES_MEMORIZADOS if dataframe is None or llave[0] == id(dataframe) ]:
+        _PIVOTES_MEMORIZADOS.pop(llave, None)
+
+## Cruces por llave
+
+# Columna por la que se cruzan los reportes
+LLAVE_USUARIA = "ID_UNICO_ANDREA"
+
+# Diccionario de llaves compartido entre dataframes: cada valor distinto recibe un código entero que no cambia
+# aunque se agreguen llaves nuevas, así que los códigos de un dataframe siguen sirviendo para cruzarlo con otros.
+# Los códigos de cada (dataframe, columna) se calculan una vez y se reutilizan mientras la columna no se reasigne
+# (ver _huella_columna). Después de escribir dentro de una columna llave (df.loc[fila, col] = ...) hay que llamar
+# a olvidar(df) para que sus códigos se vuelvan a calcular.
+#
+#   indice = indice_llaves()
+#   filtrar_cruzado(SL, "ID_UNICO_ANDREA", RGU, indice=indice)
+#   cruzar(RMR, RGU, "ID_UNICO_ANDREA", "ID_UNICO_ANDREA", indice=indice)
+class IndiceLlaves:
+
+    def __init__(self):
+        self.llaves = pd.Index([], dtype=object)
+        self._codigos = {}
+
+    def __len__(self):
+        return len(self.llaves)
+
+    def codigos(self, dataframe, columna) -> np.ndarray:
+        llave = (id(dataframe), columna)
+        guardado = self._codigos.get(llave)
+        if guardado is not None and guardado[0]() is dataframe and _misma_columna(guardado[1], dataframe[columna]):
+            return guardado[2]
+        huella = _huella_columna(dataframe[columna])
+
+        codes, uniques = pd.factorize(dataframe[columna], use_na_sentinel=False)
+        indexer = self.llaves.get_indexer(uniques)
+        nuevas = indexer < 0
+        if nuevas.any():
+            indexer[nuevas] = np.arange(len(self.llaves), len(self.llaves) + nuevas.sum())
+            self.llaves = self.llaves.append(pd.Index(uniques[nuevas], dtype=object))
+        codigos = indexer[codes]
+
+        self._codigos[llave] = (weakref.ref(dataframe, lambda _, llave=llave: self._codigos.pop(llave, None)), huella, codigos)
+        return codigos
+
+    # Descarta los códigos calculados de dataframe (o de todos); las llaves ya registradas conservan su código
+    def olvidar(self, dataframe=None) -> None:
+        for llave in [ llave for llave in self._codigos if dataframe is None or llave[0] == id(dataframe) ]:
+            self._codigos.pop(llave, None)
+
+    # Máscara de las filas de dataframe_1 cuya llave aparece en dataframe_2 (como Series.isin). En el índice todos los
+    # nulos comparten código, igual que en merge; isin distingue None de NaN, así que esas filas se revisan aparte.
+    def contenidas(self, dataframe_1, columna_1, dataframe_2, columna_2) -> np.ndarray:
+        codigos_1 = self.codigos(dataframe_1, columna_1)
+        codigos_2 = self.codigos(dataframe_2, columna_2)
+        presentes = np.zeros(len(self.llaves), dtype=bool)
+        presentes[codigos_2] = True
+        mask = presentes[codigos_1]
+
+        nulos = self.llaves.get_indexer([np.nan])[0]
+        if nulos >= 0 and mask.any():
+            filas_nulas = np.flatnonzero(codigos_1 == nulos)
+            if filas_nulas.size:
+                columna_2 = dataframe_2[columna_2]
+                mask[filas_nulas] = dataframe_1[columna_1].take(filas_nulas).isin(columna_2[columna_2.isna()]).to_numpy()
+        return mask
+
+    # Posiciones de las parejas de filas con la misma llave: por cada fila de la izquierda, en orden, sus
+    # coincidencias de la derecha en orden. Con conservar=True las filas sin coincidencia quedan con -1.
+    def parejas(self, codigos_izquierda, codigos_derecha, conservar=False) -> tuple:
+        orden = np.argsort(codigos_derecha, kind="stable")
+        conteos = np.bincount(codigos_derecha, minlength=len(self.llaves))
+        inicios = np.concatenate(([0], np.cumsum(conteos)[:-1]))
+
+        por_fila = conteos[codigos_izquierda]
+        repeticiones = np.maximum(por_fila, 1) if conservar else por_fila
+        izquierda = np.repeat(np.arange(len(codigos_izquierda)), repeticiones)
+        desplazamiento = np.arange(len(izquierda)) - np.repeat(np.cumsum(repeticiones) - repeticiones, repeticiones)
+        derecha = orden[np.minimum(np.repeat(inicios[codigos_izquierda], repeticiones) + desplazamiento, len(orden) - 1)] if len(orden) else np.zeros(len(izquierda), dtype=np.intp)
+        if conservar:
+            derecha = np.where(np.repeat(por_fila, repeticiones) > 0, derecha, -1)
+        return izquierda, derecha
+
+_INDICES_LLAVES = {}
+
+# Un índice compartido con más llaves que esto se descarta y se empieza otro
+MAX_LLAVES_INDICE = 5_000_000
+
+# Índice compartido para una columna llave (por defecto ID_UNICO_ANDREA). Cuando ya no quedan dataframes vivos con
+# códigos calculados, o cuando pasa de MAX_LLAVES_INDICE llaves, se cambia por uno vacío, así en un proceso que
+# corre muchos lotes el diccionario no acumula todas las llaves que ha visto.
+def indice_llaves(columna=LLAVE_USUARIA) -> IndiceLlaves:
+    indice = _INDICES_LLAVES.get(columna)
+    if indice is None or (len(indice) and not indice._codigos) or len(indice) > MAX_LLAVES_INDICE:
+        indice = _INDICES_LLAVES[columna] = IndiceLlaves()
+    return indice
+
+def limpiar_indices_llaves() -> None:
+    _INDICES_LLAVES.clear()
+
+# Índice a usar para cruzar dos columnas: el que se pasó (por ejemplo indice_llaves()), o None para usar pandas.
+# Columnas de tipos distintos se dejan a pandas, que tiene sus propias reglas para compararlas.
+def _indice_para(dataframe_1, columna_1, dataframe_2, columna_2, indice=None):
+    if indice is None or dataframe_1[columna_1].dtype != dataframe_2[columna_2].dtype:
+        return None
+    return indice
+
+# Las columnas de NumPy se toman del ndarray (pandas deprecó pasar su NumpyExtensionArray a take)
+def _tomar(serie, posiciones) -> np.ndarray:
+    valores = serie.to_numpy(copy=False) if isinstance(serie.dtype, np.dtype) else serie.array
+    return pd.api.extensions.take(valores, posiciones, allow_fill=True)
+
+# Filas de dataframe en las posiciones dadas (-1 es una fila de nulos), con índice 0..n-1
+def _filas(dataframe, posiciones) -> pd.DataFrame:
+    if (posiciones < 0).any():
+        dataframe = dataframe.copy(deep=False)
+        dataframe.index = pd.RangeIndex(dataframe.shape[0])
+        parte = dataframe.reindex(posiciones)
+    else:
+        parte = dataframe.take(posiciones)
+    parte.index = pd.RangeIndex(len(posiciones))
+    return parte
+
+# Equivalente de dataframe1.merge(dataframe2, left_on, right_on, how="inner"/"left"/"right") a partir de las
+# posiciones de las parejas; sigue las mismas reglas de merge para nombrar columnas repetidas.
+def _cruce_por_posiciones(dataframe1, dataframe2, columna1, columna2, izquierda, derecha, sufijos, derecha_manda):
+    misma_llave = columna1 == columna2
+    columnas_derecha = [ columna for columna in dataframe2.columns if not (misma_llave and columna == columna2) ]
+    repetidas = set(dataframe1.columns) & set(columnas_derecha)
+    sufijo_izquierda, sufijo_derecha = ("_x", "_y") if sufijos is None else sufijos
+
+    parte_izquierda = _filas(dataframe1, izquierda)
+    if misma_llave and derecha_manda:
+        # la llave sale de la izquierda cuando hay coincidencia y de la derecha cuando no
+        faltan = izquierda < 0
+        if faltan.any():
+            llave = _tomar(dataframe1[columna1], np.where(faltan, 0, izquierda)) if dataframe1.shape[0] else _tomar(dataframe2[columna2], derecha)
+            llave[faltan] = _tomar(dataframe2[columna2], derecha[faltan])
+            parte_izquierda[columna1] = llave
+    parte_derecha = _filas(dataframe2[columnas_derecha], derecha)
+
+    parte_izquierda.columns = [ f"{columna}{sufijo_izquierda}" if columna in repetidas else columna for columna in parte_izquierda.columns ]
+    parte_derecha.columns = [ f"{columna}{sufijo_derecha}" if columna in repetidas else columna for columna in parte_derecha.columns ]
+    return pd.concat([parte_izquierda, parte_derecha], axis=1, copy=False)
+
+## Perfil de columnas
+
+# Precisión del sketch HyperLogLog: 2**14 registros, con error relativo típico de 1.04 / sqrt(2**14) ≈ 0.8%
+PRECISION_HLL = 14
+
+# En modo aproximado una columna es de alta cardinalidad si en una muestra de FILAS_MUESTRA_CARDINALIDAD filas más de
+# UMBRAL_CARDINALIDAD de los valores no nulos son distintos (ids, correos, teléfonos)
+FILAS_MUESTRA_CARDINALIDAD = 10_000
+UMBRAL_CARDINALIDAD = 0.5
+
+# Registros HyperLogLog de los valores no nulos de una serie: los primeros bits del hash eligen el registro y el
+# registro guarda la mayor posición del primer bit encendido en el resto del hash
+def _registros_hll(serie, precision=PRECISION_HLL) -> np.ndarray:
+    # sin categorize: factorizar antes de hashear no conviene cuando casi todos los valores son distintos
+    hashes = pd.util.hash_pandas_object(serie.dropna(), index=False, categorize=False).to_numpy()
+    bits = 64 - precision
+    registro = (hashes >> np.uint64(bits)).astype(np.intp)
+    resto = hashes & np.uint64((1 << bits) - 1)
+    # resto < 2**50 cabe exacto en float64 y frexp da su número de bits (0 para resto == 0)
+    posicion = bits + 1 - np.frexp(resto.astype(np.float64))[1]
+    registros = np.zeros(2**precision, dtype=np.uint8)
+    np.maximum.at(registros, registro, posicion.astype(np.uint8))
+    return registros
+
+def _estimar_hll(registros) -> int:
+    m = registros.size
+    estimacion = 0.7213 / (1 + 1.079 / m) * m**2 / np.exp2(-registros.astype(np.float64)).sum()
+    vacios = np.count_nonzero(registros == 0)
+    if estimacion <= 2.5 * m and vacios:
+        estimacion = m * np.log(m / vacios)
+    return int(round(estimacion))
+
+def _alta_cardinalidad(serie) -> bool:
+    muestra = serie.sample(min(FILAS_MUESTRA_CARDINALIDAD, serie.shape[0]), random_state=0).dropna()
+    return muestra.shape[0] > 0 and muestra.nunique() > UMBRAL_CARDINALIDAD * muestra.shape[0]
+
+# Distribución de valores, nulos y distintos de cada columna de un dataframe, calculados con una sola pasada de
+# value_counts por columna. Con aproximado=True (o una lista de columnas) las columnas de alta cardinalidad solo
+# guardan un conteo aproximado de distintos con HyperLogLog y no su distribución.
+# Revisar que una columna no cambió cuesta una pasada de hash (_huella_contenido), que solo es más barata que volver a
+# contar en las columnas de NumPy (object incluido) de alta cardinalidad o aproximadas; las demás se perfilan pero
+# conteo_distintivo y porcentaje_valores_dist las calculan directo.
+class PerfilColumnas:
+
+    def __init__(self, dataframe, columnas=None, aproximado=False):
+        self.filas = dataframe.shape[0]
+        self.conteos = {}
+        self.nulos = {}
+        self.distintos = {}
+        self.aproximadas = set()
+        self.tipos = {}
+        self._huellas = {}
+
+        for columna in (dataframe.columns if columnas is None else columnas):
+            serie = dataframe[columna]
+            self.tipos[columna] = str(serie.dtype)
+            self.nulos[columna] = int(serie.isna().sum())
+
+            if aproximado is True:
+                aproximar = _alta_cardinalidad(serie)
+            else:
+                aproximar = bool(aproximado) and columna in aproximado
+            if aproximar:
+                self.aproximadas.add(columna)
+                self.conteos[columna] = None
+                self.distintos[columna] = _estimar_hll(_registros_hll(serie))
+            else:
+                # sin nulos, como value_counts() en porcentaje_valores_dist; las categorías sin filas quedan con 0
+                self.conteos[columna] = serie.value_counts()
+                self.distintos[columna] = int((self.conteos[columna] > 0).sum())
+
+            alta = aproximar or self.distintos[columna] > UMBRAL_CARDINALIDAD * (self.filas - self.nulos[columna])
+            if isinstance(serie.dtype, np.dtype) and alta:
+                self._huellas[columna] = _huella_contenido(serie)
+
+    # True si columna se perfiló, conviene tomarla del perfil y su contenido en dataframe no ha cambiado (ni
+    # reasignada ni escrita en su lugar)
+    def vigente(self, dataframe, columna) -> bool:
+        guardada = self._huellas.get(columna)
+        return (guardada is not None) and (dataframe.shape[0] == self.filas) and (guardada == _huella_contenido(dataframe[columna]))
+
+    # Proporciones como value_counts(normalize=True); None para columnas aproximadas
+    def proporciones(self, columna):
+        conteos = self.conteos[columna]
+        return None if conteos is None else conteos / conteos.sum()
+
+    def tabla(self) -> pd.DataFrame:
+        filas = []
+        for columna, conteos in self.conteos.items():
+            frecuente = conteos is not None and conteos.shape[0] > 0
+            filas.append({
+                "columna": columna,
+                "tipo": self.tipos[columna],
+                "nulos": self.nulos[columna],
+                "% nulos": round(100 * self.nulos[columna] / self.filas, 2) if self.filas else 0.0,
+                "distintos": self.distintos[columna],
+                "aproximado": columna in self.aproximadas,
+                "más frecuente": conteos.index[0] if frecuente else None,
+                "frecuencia": int(conteos.iloc[0]) if frecuente else None
+            })
+        return pd.DataFrame(filas, columns=["columna", "tipo", "nulos", "% nulos", "distintos", "aproximado", "más frecuente", "frecuencia"])
+
+# Último perfil de cada dataframe vivo; conteo_distintivo y porcentaje_valores_dist lo usan mientras siga vigente
+# (conteo_distintivo da el conteo aproximado en las columnas aproximadas del perfil)
+_PERFILES_COLUMNAS = {}
+
+# Perfila las columnas de dataframe (todas por defecto) y deja el perfil disponible para conteo_distintivo y
+# porcentaje_valores_dist. Con guardar_como se guarda la tabla resumen del perfil.
+@con_perfilado("conteo")
+def perfilar_columnas(dataframe, columnas=None, aproximado=False, guardar_como=None) -> PerfilColumnas:
+    perfil = PerfilColumnas(dataframe, columnas, aproximado)
+    llave = id(dataframe)
+    _PERFILES_COLUMNAS[llave] = (weakref.ref(dataframe, lambda _, llave=llave: _PERFILES_COLUMNAS.pop(llave, None)), perfil)
+    if guardar_como is not None:
+        _guardar(perfil.tabla(), guardar_como, index=False)
+    return perfil
+
+def _perfil_vigente(dataframe, columna):
+    guardado = _PERFILES_COLUMNAS.get(id(dataframe))
+    if guardado is None or guardado[0]() is not dataframe or not isinstance(columna, str) or columna not in dataframe.columns:
+        return None
+    return guardado[1] if guardado[1].vigente(dataframe, columna) else None
+
+## Caché de reportes procesados
+
+# Directorio y tamaño máximo de la caché en disco de los dataframes procesados
+CACHE_DIR = Path(".cache_reportes")
+CACHE_MAX_BYTES = 5 * 1024**3
+
+# Cambiar cuando cambie la lógica de algún procesar_* para que las entradas anteriores dejen de usarse
+VERSION_PROCESAMIENTO = "2"
+
+_HASHES_ARCHIVOS: dict = {}
+
+# Identifica una versión de un archivo por (ruta, tamaño, fecha de modificación)
+def _llave_archivo(path) -> tuple:
+    path = Path(path).resolve()
+    stat = path.stat()
+    return (str(path), stat.st_size, stat.st_mtime_ns)
+
+# Hash del contenido de un archivo. Se recuerda por versión del archivo para no releerlo.
+def hash_archivo(path) -> str:
+    llave = _llave_archivo(path)
+    path = llave[0]
+    if llave not in _HASHES_ARCHIVOS:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                digest.update(bloque)
+        _HASHES_ARCHIVOS[llave] = digest.hexdigest()
+    return _HASHES_ARCHIVOS[llave]
+
+def _hay_pyarrow() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+# Escribe un dataframe en formato columnar (Feather/Arrow IPC sin compresión, para poder leerlo con memory-map).
+# Sin pyarrow se usa pickle.
+def _escribir_frame(dataframe, destino) -> Path:
+    destino = Path(destino)
+    temporal = destino.with_name(destino.name + ".tmp")
+    if _hay_pyarrow():
+        from pyarrow import feather
+        feather.write_feather(dataframe, temporal, compression="uncompressed")
+    else:
+        dataframe.to_pickle(temporal)
+    os.replace(temporal, destino)
+    return destino
+
+# Arrow regresa los nulos de las columnas object como None; se restauran a NaN como los deja read_csv,
+# porque isin, fillna o == no tratan igual a None y a NaN.
+def _nulos_como_nan(dataframe) -> pd.DataFrame:
+    for columna in dataframe.columns[dataframe.dtypes == object]:
+        valores = dataframe[columna].to_numpy()
+        nulos = pd.isna(valores)
+        if nulos.any():
+            valores = valores.copy()
+            valores[nulos] = np.nan
+            dataframe[columna] = valores
+    return dataframe
+
+def _leer_frame(origen) -> pd.DataFrame:
+    if _hay_pyarrow():
+        from pyarrow import feather
+        return _nulos_como_nan(feather.read_table(origen, memory_map=True).to_pandas())
+    return pd.read_pickle(origen)
+
+def _extension_cache() -> str:
+    return ".feather" if _hay_pyarrow() else ".pkl"
+
+def _archivos_cache() -> list:
+    if not CACHE_DIR.exists():
+        return []
+    return [archivo for archivo in CACHE_DIR.iterdir() if archivo.suffix in (".feather", ".pkl")]
+
+# Elimina las entradas menos usadas recientemente hasta que la caché quede debajo de CACHE_MAX_BYTES
+def _podar_cache() -> None:
+    archivos = sorted(_archivos_cache(), key=lambda archivo: archivo.stat().st_mtime)
+    total = sum(archivo.stat().st_size for archivo in archivos)
+    while archivos and total > CACHE_MAX_BYTES:
+        archivo = archivos.pop(0)
+        total -= archivo.stat().st_size
+        archivo.unlink(missing_ok=True)
+
+# Borra de la caché las entradas de un archivo fuente, o toda la caché si no se indica archivo
+def invalidar_cache(path=None) -> int:
+    archivos = _archivos_cache()
+    if path is not None:
+        prefijo = hash_archivo(path) + "_"
+        archivos = [archivo for archivo in archivos if archivo.name.startswith(prefijo)]
+    for archivo in archivos:
+        archivo.unlink(missing_ok=True)
+    return len(archivos)
+
+# Representación estable de un parámetro para la llave de la caché (el repr de pandas se trunca)
+def _huella_parametro(valor) -> str:
+    if isinstance(valor, np.ndarray):
+        valor = pd.Series(valor.ravel())
+    if isinstance(valor, (pd.DataFrame, pd.Series, pd.Index)):
+        return hashlib.blake2b(pd.util.hash_pandas_object(valor, index=False).values.tobytes(), digest_size=16).hexdigest()
+    return repr(valor)
+
+# Agrega el parámetro usar_cache a un procesar_*. La llave de la caché es el hash del contenido del archivo,
+# el nombre del procesador, VERSION_PROCESAMIENTO, todos los demás parámetros (posicionales o con nombre, con
+# sus valores por defecto; así procesar_shipping_list(path, "pyarrow") y motor="pyarrow" comparten entrada) y el
+# esquema del reporte junto con el hash del archivo de mapeo, así un cambio en el mapeo, LIMPIEZA_COLUMNAS,
+# NA_VALUES_REPORTES o FORMATOS_FECHA no sirve resultados leídos con la especificación anterior.
+def con_cache(reporte):
+  def decorador(procesador):
+    firma = inspect.signature(procesador)
+
+    @wraps(procesador)
+    def procesador_con_cache(path, *args, usar_cache=False, **kwargs):
+        if not usar_cache:
+            return procesador(path, *args, **kwargs)
+
+        argumentos = firma.bind(path, *args, **kwargs)
+        argumentos.apply_defaults()
+        parametros = [ (nombre, _huella_parametro(valor)) for nombre, valor in list(argumentos.arguments.items())[1:] ]
+        hash_fuente = hash_archivo(path)
+        esquema = (hash_archivo(ARCHIVO_MAPEO), esquema_reporte(reporte))
+        opciones = repr((procesador.__name__, VERSION_PROCESAMIENTO, parametros, esquema))
+        llave = hashlib.blake2b(opciones.encode("utf-8"), digest_size=8).hexdigest()
+        entrada = CACHE_DIR / f"{hash_fuente}_{llave}{_extension_cache()}"
+
+        if entrada.exists():
+            os.utime(entrada)
+            return _leer_frame(entrada)
+
+        dataframe = procesador(path, *args, **kwargs)
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _escribir_frame(dataframe, entrada)
+        _podar_cache()
+        return dataframe
+
+    return procesador_con_cache
+  return decorador
+
+## Detección de encoding
+
+# Encodings ya detectados por versión de archivo, para reutilizarlos en lecturas posteriores
+ENCODINGS_DETECTADOS: dict = {}
+BYTES_MUESTRA_ENCODING = 1 << 20
+
+# Detecta el encoding de un CSV leyendo solo el encabezado y una muestra acotada de bytes:
+# utf-8 si la muestra es utf-8 válido (los encabezados de los reportes tienen acentos), latin-1 si no.
+def detectar_encoding(path) -> str:
+    llave = _llave_archivo(path)
+    if llave not in ENCODINGS_DETECTADOS:
+        with open(llave[0], "rb") as f:
+            muestra = f.readline()
+            muestra += f.read(max(BYTES_MUESTRA_ENCODING - len(muestra), 0))
+
+        if muestra.startswith(codecs.BOM_UTF8):
+            encoding = "utf-8-sig"
+        else:
+            try:
+                codecs.getincrementaldecoder("utf-8")().decode(muestra, final=False)
+                encoding = "utf-8"
+            except UnicodeDecodeError:
+                encoding = "latin-1"
+        ENCODINGS_DETECTADOS[llave] = encoding
+    return ENCODINGS_DETECTADOS[llave]
+
+## Compactación de memoria
+
+# Columnas de baja cardinalidad de cada reporte que se pueden guardar como category
+COLUMNAS_CATEGORICAS = {
+    "RGU": ["PERFIL", "ESTADO", "SEXO", "ESTATUS", "Ganadoras", "Con canje", "Con ingreso"],
+    "RMR": ["PERFIL", "Logro meta"],
+    "SL": ["PERFIL", "CATEGORIA", "MARCA", "PAQUETERIA", "ESTATUS DE ENTREGA", "ESTADO"]
+}
+
+# Una columna solo se convierte a category si tiene a lo más esta proporción de valores distintos
+PROPORCION_MAXIMA_CATEGORIAS = 0.5
+
+# Memoria en bytes de cada columna (incluye el contenido de los strings)
+def reporte_memoria(dataframe) -> pd.Series:
+    return dataframe.memory_usage(deep=True, index=False)
+
+# Un float64 pasa a float32 solo si todos sus valores son enteros y la suma de sus valores absolutos es menor que
+# 2**24: así cada valor y cada suma parcial es un entero que float32 representa exactamente, y las sumas de
+# tabla_pivote y suma no pierden precisión (con decimales no basta: 2**-10 + 2**23 ya no cabe en float32).
+def _float32_sin_perdida(serie) -> bool:
+    valores = serie.to_numpy()
+    finitos = valores[~np.isnan(valores)]
+    return np.array_equal(finitos, np.trunc(finitos)) and (np.abs(finitos).sum() < 2**24)
+
+# Convierte a category las columnas de texto de baja cardinalidad y reduce los float64 a float32 cuando no hay pérdida.
+# Los bytes por columna antes y después quedan en dataframe.attrs["reporte_memoria"] (ver reporte_compactacion).
+@con_perfilado("compactación")
+def compactar_dataframe(dataframe, columnas_categoricas=None) -> pd.DataFrame:
+    antes = reporte_memoria(dataframe)
+    columnas_categoricas = [column for column in (columnas_categoricas or []) if column in dataframe.columns]
+
+    for column in columnas_categoricas:
+        serie = dataframe[column]
+        if es_texto(serie.dtype) and not isinstance(serie.dtype, pd.CategoricalDtype) and (serie.nunique() <= PROPORCION_MAXIMA_CATEGORIAS * serie.shape[0]):
+            dataframe[column] = serie.astype("category")
+
+    for column in dataframe.columns[dataframe.dtypes == np.float64]:
+        if _float32_sin_perdida(dataframe[column]):
+            dataframe[column] = dataframe[column].astype(np.float32)
+
+    despues = reporte_memoria(dataframe)
+    dataframe.attrs["reporte_memoria"] = {"antes": antes.to_dict(), "despues": despues.to_dict()}
+    return dataframe
+
+# Después de filtrar, las category compactadas (sin orden) dejan de listar los valores que ya no aparecen, como las
+# columnas de texto que reemplazan; así value_counts y las tablas no muestran, por ejemplo, "Estrellita 0".
+def _quitar_categorias_sin_uso(dataframe) -> pd.DataFrame:
+    compactadas = [ column for column in dataframe.columns if isinstance(dataframe[column].dtype, pd.CategoricalDtype) and not _categorias_completas(dataframe[column].dtype) ]
+    if not compactadas:
+        return dataframe
+    dataframe = dataframe.copy(deep=False)
+    for column in compactadas:
+        dataframe[column] = dataframe[column].cat.remove_unused_categories()
+    return dataframe
+
+# Tabla con la memoria por columna antes y después de compactar_dataframe
+def reporte_compactacion(dataframe) -> pd.DataFrame:
+    reporte = pd.DataFrame(dataframe.attrs["reporte_memoria"])
+    reporte["ahorro %"] = round(100 * (1 - reporte["despues"] / reporte["antes"]), 2)
+    return reporte
+
+## Lectura de CSV
+
+# Motores de lectura: "c" es el parser por defecto de pandas (un hilo, columnas de NumPy) y "pyarrow"
+# lee con varios hilos a columnas de Arrow
+MOTORES_LECTURA = ["c", "pyarrow"]
+
+# Con motor="pyarrow" el texto se queda en Arrow (string[pyarrow]) y los números y fechas pasan a NumPy,
+# que es lo que esperan validate_dtypes, pd.cut y las operaciones aritméticas.
+def _columnas_arrow_a_numpy(dataframe) -> pd.DataFrame:
+    import pyarrow as pa
+
+    for column in dataframe.columns:
+        dtype = dataframe[column].dtype
+        if not isinstance(dtype, pd.ArrowDtype):
+            continue
+        tipo = dtype.pyarrow_dtype
+        serie = dataframe[column]
+        if pa.types.is_string(tipo) or pa.types.is_large_string(tipo):
+            dataframe[column] = serie.astype(pd.StringDtype("pyarrow"))
+        elif pa.types.is_integer(tipo) and not serie.hasnans:
+            dataframe[column] = serie.to_numpy(dtype=np.int64)
+        elif pa.types.is_integer(tipo) or pa.types.is_floating(tipo):
+            dataframe[column] = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+        elif pa.types.is_date(tipo) or pa.types.is_timestamp(tipo):
+            dataframe[column] = serie.astype("datetime64[ns]").to_numpy()
+        elif pa.types.is_boolean(tipo):
+            dataframe[column] = serie.to_numpy(dtype=object if serie.hasnans else bool, na_value=np.nan)
+    return dataframe
+
+# Lee un CSV con el encoding detectado. Solo si la muestra no fue representativa (bytes inválidos
+# después de la muestra) se vuelve a leer en latin-1, y se registra para las siguientes lecturas.
+@con_perfilado("lectura")
+def leer_csv(path, motor="c", **kwargs) -> pd.DataFrame:
+    assert (motor in MOTORES_LECTURA), f"El parámetro 'motor' debe coincidir con alguna de las siguientes opciones: {MOTORES_LECTURA}."
+
+    if motor == "pyarrow":
+        if "dtype" in kwargs:
+            kwargs["dtype"] = {column: (pd.StringDtype("pyarrow") if tipo == np.object_ else tipo) for column, tipo in kwargs["dtype"].items()}
+        kwargs |= {"engine": "pyarrow", "dtype_backend": "pyarrow"}
+
+    encoding = detectar_encoding(path)
+    try:
+        dataframe = pd.read_csv(path, encoding=encoding, **kwargs)
+    except UnicodeDecodeError:
+        # el encabezado ya se decodificó bien con la muestra; se conserva en lugar de releerlo en latin-1
+        encabezado = {"header": 0, "names": leer_encabezado(path)}
+        ENCODINGS_DETECTADOS[_llave_archivo(path)] = "latin-1"
+        dataframe = pd.read_csv(path, encoding="latin-1", **encabezado, **kwargs)
+
+    if motor == "pyarrow":
+        dataframe = _columnas_arrow_a_numpy(dataframe)
+    return dataframe
+
+# Lee un CSV por bloques de tamano_bloque filas con el parser de C, así la memoria no depende del tamaño del archivo.
+# Si aparecen bytes inválidos después de la muestra del encoding, se continúa en latin-1 desde la fila donde se quedó,
+# con los nombres del encabezado ya leído y un número de filas a saltar (un range de skiprows se vuelve un set con
+# todas las filas ya leídas).
+def leer_csv_en_bloques(path, tamano_bloque, **kwargs):
+    filas_leidas = 0
+    encoding = detectar_encoding(path)
+    reinicio = {}
+    while True:
+        try:
+            inicio = filas_leidas
+            with pd.read_csv(path, encoding=encoding, chunksize=tamano_bloque, **reinicio, **kwargs) as bloques:
+                for bloque in bloques:
+                    bloque.index += inicio
+                    filas_leidas += bloque.shape[0]
+                    yield bloque
+            return
+        except UnicodeDecodeError:
+            if encoding == "latin-1":
+                raise
+            reinicio = {"header": None, "names": leer_encabezado(path), "skiprows": filas_leidas + 1}
+            encoding = "latin-1"
+            ENCODINGS_DETECTADOS[_llave_archivo(path)] = encoding
+
+## Registro de esquemas
+
+# Archivo de mapeo con las columnas, tipos y longitudes de los tres reportes
+ARCHIVO_MAPEO = Path(__file__).with_name("Información Mapeo Origen-Destino.xlsx")
+
+# Tipo de lectura de cada tipo del mapeo. Los enteros se leen como float64 para admitir nulos.
+TIPOS_MAPEO = {
+    "string": "object",
+    "int": "float64",
+    "float": "float64"
+}
+
+# Columnas numéricas que vienen como texto con un símbolo que hay que quitar
+LIMPIEZA_COLUMNAS = {
+    "RMR": {"PORCENTAJE_DE_CUMPLIMIENTO": "%"},
+    "SL": {"PRECIO PRODUCTO": "$"}
+}
+
+# Valores nulos de cada reporte que no aparecen en los comentarios del mapeo ("X" == null)
+NA_VALUES_REPORTES = {
+    "RGU": ["", "null"],
+    "RMR": [],
+    "SL": ["", "NA", "s/n"]
+}
+
+# Formatos explícitos de las columnas de fecha, {reporte: {columna: formato}}
+FORMATOS_FECHA: dict = {}
+
+# Lo que sale del archivo de mapeo por reporte; LIMPIEZA_COLUMNAS, NA_VALUES_REPORTES y FORMATOS_FECHA se aplican
+# cada vez que se pide un esquema, así cambiarlos tiene efecto aunque el mapeo ya esté compilado
+_MAPEOS: dict = {}
+
+# Lee del archivo de mapeo las columnas, tipos, longitudes y nulos declarados de cada reporte (RGU, RMR, SL)
+def compilar_mapeo(archivo_mapeo=None) -> dict:
+    from openpyxl import load_workbook
+
+    archivo_mapeo = ARCHIVO_MAPEO if archivo_mapeo is None else archivo_mapeo
+    wb = load_workbook(archivo_mapeo, read_only=True, data_only=True)
+    fuentes = list(wb["Información Fuentes"].iter_rows(values_only=True))
+    mapeo = list(wb["Mapeo Origen - Destino"].iter_rows(min_row=2, values_only=True))
+    wb.close()
+
+    # Tabla destino de cada archivo fuente (la más frecuente en el mapeo) y nulos declarados en los comentarios
+    destinos: dict = {}
+    nulos: dict = {}
+    for origen, _, _, _, destino, _, _, comentario in mapeo:
+        if origen is None or destino is None:
+            continue
+        origen = origen.removesuffix(".csv")
+        destinos.setdefault(origen, Counter())[destino] += 1
+        coincidencia = re.fullmatch(r'\s*"?(.*?)"?\s*==\s*null\s*', comentario or "")
+        if coincidencia:
+            nulos.setdefault(destino, []).append(coincidencia.group(1))
+
+    mapeos = {}
+    for offset in range(0, len(fuentes[0]), 4):
+        archivo = fuentes[0][offset + 1]
+        if archivo is None:
+            continue
+        reporte = destinos[archivo.removesuffix(".csv")].most_common(1)[0][0]
+
+        columnas, tipos, longitudes = [], {}, {}
+        for fila in fuentes[4:]:
+            columna, tipo, longitud = fila[offset:offset + 3]
+            if columna is None:
+                continue
+            columnas.append(columna)
+            tipos[columna] = tipo
+            if longitud is not None:
+                longitudes[columna] = longitud
+
+        mapeos[reporte] = {"archivo": archivo, "usecols": columnas, "tipos": tipos, "nulos": nulos.get(reporte, []), "longitudes": longitudes}
+    return mapeos
+
+# Especificación de lectura de un reporte a partir de su mapeo y la configuración actual del módulo
+def _esquema(reporte, mapeo) -> dict:
+    limpieza = dict(LIMPIEZA_COLUMNAS.get(reporte, {}))
+    fechas = [ columna for columna, tipo in mapeo["tipos"].items() if tipo == "date" ]
+    dtype = { columna: "object" if columna in limpieza else TIPOS_MAPEO[tipo] for columna, tipo in mapeo["tipos"].items() if tipo != "date" }
+    return {
+        "archivo": mapeo["archivo"],
+        "usecols": list(mapeo["usecols"]),
+        "dtype": dtype,
+        "fechas": fechas,
+        "formatos_fecha": dict(FORMATOS_FECHA.get(reporte, {})),
+        "na_values": NA_VALUES_REPORTES.get(reporte, []) + mapeo["nulos"],
+        "limpieza": limpieza,
+        "longitudes": dict(mapeo["longitudes"])
+    }
+
+# Compila el archivo de mapeo en especificaciones de lectura por reporte (RGU, RMR, SL)
+def compilar_esquemas(archivo_mapeo=None) -> dict:
+    return { reporte: _esquema(reporte, mapeo) for reporte, mapeo in compilar_mapeo(archivo_mapeo).items() }
+
+# Mapeo compilado. Se lee una vez del archivo de mapeo y, si CACHE_DIR ya existe (la crea usar_cache=True), se
+# guarda ahí como JSON, así las siguientes ejecuciones no vuelven a abrir el archivo mientras no cambie.
+def cargar_mapeos() -> dict:
+    if not _MAPEOS:
+        compilado = CACHE_DIR / f"mapeo_{hash_archivo(ARCHIVO_MAPEO)}_{VERSION_PROCESAMIENTO}.json"
+        if compilado.exists():
+            mapeos = json.loads(compilado.read_text(encoding="utf-8"))
+        else:
+            mapeos = compilar_mapeo()
+            if CACHE_DIR.is_dir():
+                compilado.write_text(json.dumps(mapeos, ensure_ascii=False), encoding="utf-8")
+        _MAPEOS.update(mapeos)
+    return _MAPEOS
+
+def cargar_esquemas() -> dict:
+    return { reporte: _esquema(reporte, mapeo) for reporte, mapeo in cargar_mapeos().items() }
+
+def esquema_reporte(reporte) -> dict:
+    return _esquema(reporte, cargar_mapeos()[reporte])
+
+# Diccionario de tipos de NumPy de un esquema. Con final=True las columnas con limpieza quedan como float64.
+def esquema_dtypes(esquema, final=False, columnas=None) -> dict:
+    dtypes = {columna: np.dtype(tipo).type for columna, tipo in esquema["dtype"].items() if columnas is None or columna in columnas}
+    if final:
+        dtypes |= {columna: np.float64 for columna in esquema["limpieza"] if columnas is None or columna in columnas}
+    return dtypes
+
+# Lee solo la fila de encabezado de un CSV (se decodifica solo esa línea, así un byte inválido más adelante en el
+# archivo no impide leerla)
+def leer_encabezado(path) -> list:
+    with open(path, "rb") as f:
+        linea = f.readline().decode(detectar_encoding(path))
+    return next(csv.reader([linea]), [])
+
+# Valida que el encabezado de un archivo contenga todas las columnas del esquema
+def validate_header(columns: list, esquema: dict) -> tuple[bool, str]:
+    validation_message: str = "Successful validation"
+    missing = [column for column in esquema["usecols"] if column not in columns]
+    if missing:
+        validation_message = f"Columns {missing} from {esquema['archivo']} are missing in the header"
+        return (False, validation_message)
+    return (True, validation_message)
+
+## Conversión de columnas de texto
+
+# Las columnas de fecha y las numéricas con símbolo repiten unos pocos miles de textos en millones de filas, así que
+# cada valor distinto se convierte una sola vez y el resultado se reparte a las filas con los códigos de factorize.
+def _convertir_valores_unicos(serie, convertir, nulo) -> np.ndarray:
+    codigos, unicos = pd.factorize(serie)
+    convertidos = np.asarray(convertir(unicos))
+    return np.append(convertidos, np.array([nulo], dtype=convertidos.dtype))[codigos]
+
+# Fechas con el formato del esquema; sin formato se usa el que pandas infiere del primer valor, y si los valores no
+# comparten un solo formato cada valor distinto se interpreta por separado (como astype("datetime64[ns]"))
+def convertir_fechas(serie, formato=None) -> pd.Series:
+    if serie.dtype.kind == "M":
+        return serie.astype("datetime64[ns]")
+
+    def convertir(unicos):
+        try:
+            fechas = pd.to_datetime(unicos, format=formato)
+        except ValueError:
+            if formato is not None:
+                raise
+            fechas = pd.to_datetime(unicos, format="mixed")
+        return fechas.to_numpy(dtype="datetime64[ns]")
+
+    return pd.Series(_convertir_valores_unicos(serie, convertir, np.datetime64("NaT", "ns")), index=serie.index, name=serie.name)
+
+# Números escritos con un símbolo ("$2335.33", "116.35%") a float64; los nulos quedan como NaN
+def limpiar_numerico(serie, simbolo) -> pd.Series:
+    convertir = lambda unicos: unicos.astype(str).str.replace(simbolo, "", regex=False).astype(np.float64)
+    return pd.Series(_convertir_valores_unicos(serie, convertir, np.nan), index=serie.index, name=serie.name)
+
+# Convierte las columnas de fecha y de limpieza del esquema que estén en el dataframe
+@con_perfilado("conversión")
+def convertir_columnas(dataframe, esquema) -> pd.DataFrame:
+    for columna in esquema["fechas"]:
+        if columna in dataframe.columns:
+            dataframe[columna] = convertir_fechas(dataframe[columna], esquema["formatos_fecha"].get(columna))
+    for columna, simbolo in esquema["limpieza"].items():
+        if columna in dataframe.columns:
+            dataframe[columna] = limpiar_numerico(dataframe[columna], simbolo)
+    return dataframe
+
+## Lectura selectiva
+
+# Reglas de columnas derivadas y columnas calculadas de cada reporte, con las columnas de las que dependen
+REGLAS_REPORTES = {
+    "RGU": REGLAS_REPORTE_GENERAL_DE_USUARIOS,
+    "RMR": REGLAS_REPORTE_METAS_Y_RESULTADOS,
+    "SL": []
+}
+
+DEPENDENCIAS_CALCULADAS = {
+    "RGU": {"generación": ["FECHA_DE_NACIMIENTO"]},
+    "RMR": {"Crecimiento sobre la renta": ["MONTO_DE_VENTA_NETA_ACUMULADA_AL_CIERRE_DE_MES", "CUOTA_OBJETIVO"]},
+    "SL": {}
+}
+
+def _columnas_condiciones(condiciones) -> list:
+    columnas = []
+    for condicion in condiciones:
+        columnas.append(condicion[0])
+        if len(condicion) == 3 and isinstance(condicion[2], Columna):
+            columnas.append(condicion[2])
+    return columnas
+
+# Columnas del archivo que hay que leer para producir columnas y evaluar filtros, y columnas derivadas o calculadas
+# que hay que generar (las derivadas pueden depender de otras derivadas). Con columnas=None se lee y genera todo.
+def plan_lectura(reporte, columnas=None, filtros=None) -> tuple:
+    if columnas is None:
+        return None, None
+    dependencias = { destino: _columnas_condiciones(condiciones) for destino, condiciones, _ in REGLAS_REPORTES[reporte] }
+    dependencias |= DEPENDENCIAS_CALCULADAS[reporte]
+
+    pendientes = list(columnas) + [ columna for _, condiciones in (filtros or []) for columna in _columnas_condiciones(condiciones) ]
+    lectura, generadas = set(), set()
+    while pendientes:
+        columna = pendientes.pop()
+        if columna in dependencias:
+            if columna not in generadas:
+                generadas.add(columna)
+                pendientes.extend(dependencias[columna])
+        else:
+            lectura.add(columna)
+    return lectura, generadas
+
+# Separa los filtros (modo, condiciones) que se pueden evaluar sobre las columnas tal como se leen del archivo
+# (no son fechas ni se limpian después) de los que se evalúan al final, sobre las columnas ya convertidas
+def _separar_filtros(filtros, esquema) -> tuple:
+    convertidas = set(esquema["fechas"]) | set(esquema["limpieza"])
+    al_leer, al_final = [], []
+    for modo, condiciones in (filtros or []):
+        columnas = _columnas_condiciones(condiciones)
+        if all(columna in esquema["dtype"] and columna not in convertidas for columna in columnas):
+            al_leer.append((modo, condiciones))
+        else:
+            al_final.append((modo, condiciones))
+    return al_leer, al_final
+
+def _aplicar_filtros(dataframe, filtros) -> pd.DataFrame:
+    if not filtros:
+        return dataframe
+    with etapa("filtro", dataframe) as registro:
+        mask = np.ones(dataframe.shape[0], dtype=bool)
+        for modo, condiciones in filtros:
+            mask &= compilar_filtro(condiciones, modo)(dataframe)
+        return registro.salida(dataframe.take(np.flatnonzero(mask)))
+
+def _usecols(encabezado, lectura):
+    return None if lectura is None else [ columna for columna in encabezado if columna in lectura ]
+
+def _proyectar(dataframe, columnas) -> pd.DataFrame:
+    return dataframe if columnas is None else dataframe[[ columna for columna in dataframe.columns if columna in columnas ]]
+
+# Procesamiento del reporte general de usuarios.
+# Con columnas solo se leen las columnas necesarias para producirlas, y con filtros [(modo, condiciones), ...]
+# ("Y"/"O" y condiciones como en filtrar_Y / filtrar_O) las filas se descartan antes de convertir las fechas.
+# Las fechas se leen como texto y se convierten con convertir_fechas.
+@con_perfilado("procesamiento")
+@con_cache("RGU")
+def procesar_reporte_general_de_usuarios(path, motor="c", categoricas=False, columnas=None, filtros=None):
+  esquema = esquema_reporte("RGU")
+  encabezado = leer_encabezado(path)
+  header_validation = validate_header(encabezado, esquema)
+  assert header_validation[0], header_validation[1]
+
+  lectura, generadas = plan_lectura("RGU", columnas, filtros)
+  filtros_lectura, filtros_finales = _separar_filtros(filtros, esquema)
+  usecols = _usecols(encabezado, lectura)
+  dtype_dict = esquema_dtypes(esquema, columnas=usecols)
+  dates = [ date for date in esquema["fechas"] if usecols is None or date in usecols ]
+
+  RGU = leer_csv(
       path,
-      encoding="latin-1",
+      motor=motor,
       dtype=dtype_dict,
-      na_values=na_values_list,
-      parse_dates=dates
+      na_values=esquema["na_values"],
+      usecols=usecols
   )
+  RGU = convertir_columnas(_aplicar_filtros(RGU, filtros_lectura), esquema)
 
   dtypes_validation = validate_dtypes(RGU.dtypes, dtype_dict, dates)
   assert dtypes_validation[0], dtypes_validation[1]
 
-  RGU["Ganadoras"] = RGU.apply(lambda x: "No ganadora" if (x["JOYAS_TOTALES_GANADAS"]==0 and x["PERFIL"]!="Mayorista") else "Ganadora", axis=1)
-  RGU["Con canje"] = RGU["JOYAS_CANJEADOS"].apply(lambda x: "Sin canje" if x==0 else "Con canje")
-  RGU["Con ingreso"] = [np.nan] * RGU.shape[0]
-  RGU.loc[pd.isnull(RGU["ULTIMO_INGRESO_APP"]), "Con ingreso"] = "Sin ingreso"
-  RGU.loc[pd.notnull(RGU["ULTIMO_INGRESO_APP"]), "Con ingreso"] = "Con ingreso"
+  agregar_columnas_derivadas(RGU, [ regla for regla in REGLAS_REPORTE_GENERAL_DE_USUARIOS if generadas is None or regla[0] in generadas ], categoricas=categoricas)
 
-  generaciones_bins_dates = [
-      "1/1/1900",
-      "12/31/1964",
-      "12/31/1976",
-      "12/31/1995",
-      "12/31/2050"
-  ]
+  if generadas is None or "generación" in generadas:
+    generaciones_bins_dates = [
+        "1/1/1900",
+        "12/31/1964",
+        "12/31/1976",
+        "12/31/1995",
+        "12/31/2050"
+    ]
+
+    generaciones_bins = pd.Series(generaciones_bins_dates,dtype="datetime64[ns]")
 
-  generaciones_bins = pd.Series(generaciones_bins_dates,dtype="datetime64[ns]")
+    generaciones_labels = [
+        "Baby boomer",
+        "Generacion X",
+        "Millenial",
+        "Z y otra"
+    ]
 
-  generaciones_labels = [
-      "Baby boomer",
-      "Generacion X",
-      "Millenial",
-      "Z y otra"
-  ]
+    with etapa("columnas derivadas", RGU):
+      RGU["generación"] = pd.cut( RGU["FECHA_DE_NACIMIENTO"], bins=generaciones_bins, labels=generaciones_labels )
 
-  RGU["generación"] = pd.cut( RGU["FECHA_DE_NACIMIENTO"], bins=generaciones_bins, labels=generaciones_labels )
+  RGU = _proyectar(_aplicar_filtros(RGU, filtros_finales), columnas)
 
+  if categoricas:
+    compactar_dataframe(RGU, COLUMNAS_CATEGORICAS["RGU"])
   return RGU
 
-# Procesamiento del reporte de metas y resultados
-def procesar_reporte_metas_y_resultados(path, reporte_general_de_usuarios=None):
-  objects = [
-      "ID_UNICO_ANDREA",
-      "NOMBRE",
-      "APELLIDO_PATERNO",
-      "APELLIDO_MATERNO",
-      "PERFIL",
-      "PORCENTAJE_DE_CUMPLIMIENTO"
-  ]
-
-  floats = [
-      "NIVEL",
-      "HABILITADO",
-      "ACTIVADO",
-      "MES",
-      "AÑO",
-      "CUOTA_OBJETIVO",
-      "MONTO_DE_VENTA_NETA_ACUMULADA_AL_CIERRE_DE_MES",
-      "JOYAS_TOTALES_GANADAS_POR_COMPRAS"
-  ]
-
-  dtype_dict = {column:np.object_ for column in objects} | {column:np.float64 for column in floats}
-
-  try:
-
-      RMR = pd.read_csv(
-          path,
-          encoding="utf-8",
-          dtype=dtype_dict
-      )
-  except UnicodeDecodeError:
-      RMR = pd.read_csv(
-          path,
-          encoding="latin-1",
-          dtype=dtype_dict
-      )
+# Procesamiento del reporte de metas y resultados (columnas y filtros como en procesar_reporte_general_de_usuarios)
+@con_perfilado("procesamiento")
+@con_cache("RMR")
+def procesar_reporte_metas_y_resultados(path, reporte_general_de_usuarios=None, motor="c", categoricas=False, columnas=None, filtros=None):
+  esquema = esquema_reporte("RMR")
+  encabezado = leer_encabezado(path)
+  header_validation = validate_header(encabezado, esquema)
+  assert header_validation[0], header_validation[1]
+
+  lectura, generadas = plan_lectura("RMR", columnas, filtros)
+  filtros_lectura, filtros_finales = _separar_filtros(filtros, esquema)
+  usecols = _usecols(encabezado, lectura)
+  dtype_dict = esquema_dtypes(esquema, columnas=usecols)
+
+  RMR = leer_csv(
+      path,
+      motor=motor,
+      dtype=dtype_dict,
+      na_values=esquema["na_values"],
+      usecols=usecols
+  )
+  RMR = _aplicar_filtros(RMR, filtros_lectura)
 
   dtypes_validation = validate_dtypes(RMR.dtypes, dtype_dict)
   assert dtypes_validation[0], dtypes_validation[1]
 
-  
-  RMR["PORCENTAJE_DE_CUMPLIMIENTO"] = pd.to_numeric(RMR["PORCENTAJE_DE_CUMPLIMIENTO"].apply(lambda x: x.replace("%","") if isinstance(x,str) else x))
+  RMR = convertir_columnas(RMR, esquema)
+
+  agregar_columnas_derivadas(RMR, [ regla for regla in REGLAS_REPORTE_METAS_Y_RESULTADOS if generadas is None or regla[0] in generadas ], categoricas=categoricas)
+
+  if generadas is None or "Crecimiento sobre la renta" in generadas:
+    with etapa("columnas derivadas", RMR):
+      RMR["Crecimiento sobre la renta"] = RMR["MONTO_DE_VENTA_NETA_ACUMULADA_AL_CIERRE_DE_MES"] - RMR["CUOTA_OBJETIVO"]
 
-  RMR["Logro meta"] = RMR["PORCENTAJE_DE_CUMPLIMIENTO"].apply(lambda x: "Cumplió" if x >= 100 else "No cumplió")
+  RMR = _proyectar(_aplicar_filtros(RMR, filtros_finales), columnas)
 
-  RMR["Crecimiento sobre la renta"] = RMR["MONTO_DE_VENTA_NETA_ACUMULADA_AL_CIERRE_DE_MES"] - RMR["CUOTA_OBJETIVO"]
+  if categoricas:
+    compactar_dataframe(RMR, COLUMNAS_CATEGORICAS["RMR"])
 
   #return pd.merge(RMR, left_compare(RMR, "ID_UNICO_ANDREA", reporte_general_de_usuarios, "ID_UNICO_ANDREA", indicator_name="Participa"), on="ID_UNICO_ANDREA")
-  return RMR 
-
-# Procesamiento de datos de Shipping List
-def procesar_shipping_list(path):
-  objects = [
-      "ID_UNICO_CANJE",
-      "PEDIDO EREWARD",
-      "EREWARD CANJE ID",
-      "NOMBRE (S)",
-      "APELLIDO PATERNO",
-      "APELLIDO MATERNO",
-      "ID_UNICO_ANDREA",
-      "PERFIL",
-      "CELULAR CANJE",
-      "CORREO CANJE",
-      "CORREO REGISTRADO",
-      "CATEGORIA",
-      "CLASIFICACION DE PRODUCTO",
-      "NOMBRE CORTO",
-      "SKU",
-      "CODIGO PMR",
-      "MARCA",
-      "TELEFONO_DE_RECARGA",
-      "COMPAÑÍA RECARGA",
-      "PAQUETERIA",
-      "LIGA_POD",
-      "CALLE",
-      "REFERENCIAS",
-      "COLONIA",
-      "MUNICIPIO",
-      "ESTADO",
-      "RFC MONEDERO",
-      "NOMBRE COMPLETO MONEDERO",
-      "LUGAR DE CANJE",
-      "GUIA",
-      "ESTATUS DE ENTREGA",
-      "ID_ARTICULO_SAP",
-      "QUIEN RECIBIO",
-      "NÚMERO EXTERIOR",
-      "NÚMERO INTERIOR"
-  ]
-
-  floats = [
-      "PEDIDO",
-      "PUNTOS",
-      "CANTIDAD",
-      "CODIGO POSTAL",
-      "PRECIO LOGISTICA",
-      "FEE",
-      "PRECIO VENTA INTEGRADO",
-      "PRECIO DE VENTA MAS AJUSTE",
-      "MONTO DE DISPERSION",
-      "COMISION PROVEEDOR",
-      "PRECIO PLASTICO"
-  ]
-
-  dates = [
-      "FECHA_DE_CANJE",
-      "FECHA DE CORTE",
-      "FECHA ESTIMADA DE ENTREGA",
-      "FECHA DE RECEPCIÓN"
-  ]
-
-  na_values_list = ["", "NA", "s/n", np.nan, np.float64("nan")]
-
-  dtype_dict = {column:np.object_ for column in objects} | {column:np.float64 for column in floats}
-
-  try:
-    SL = pd.read_csv(
-        path,
-        encoding="latin-1",
-        dtype=dtype_dict,
-        na_values=na_values_list,
-    )
-    SL[dates] = SL[dates].astype("datetime64[ns]")
-  except KeyError:
-    SL = pd.read_csv(
+  return RMR
+
+# Conversión de tipos y limpieza de la Shipping List, aplicable al archivo completo o a un bloque
+def _transformar_shipping_list(SL, esquema, usecols=None):
+  dates = [ date for date in esquema["fechas"] if usecols is None or date in usecols ]
+  SL = convertir_columnas(SL, esquema)
+
+  dtypes_validation = validate_dtypes(SL.dtypes, esquema_dtypes(esquema, final=True, columnas=usecols), dates)
+  assert dtypes_validation[0], dtypes_validation[1]
+  return SL
+
+# Procesamiento de datos de Shipping List.
+# Con ids solo se conservan los canjes cuyo ID_UNICO_ANDREA está en ids; con tamano_bloque el archivo
+# se lee por bloques y cada bloque se filtra antes de convertirse, así la memoria queda acotada por el bloque.
+# columnas y filtros como en procesar_reporte_general_de_usuarios; los filtros también se aplican por bloque.
+@con_perfilado("procesamiento")
+@con_cache("SL")
+def procesar_shipping_list(path, motor="c", ids=None, tamano_bloque=None, categoricas=False, columnas=None, filtros=None):
+  assert (tamano_bloque is None) or (motor == "c"), "La lectura por bloques solo está disponible con motor='c'."
+
+  esquema = esquema_reporte("SL")
+  encabezado = leer_encabezado(path)
+  header_validation = validate_header(encabezado, esquema)
+  assert header_validation[0], header_validation[1]
+
+  lectura, _ = plan_lectura("SL", columnas, filtros)
+  if (lectura is not None) and (ids is not None):
+    lectura.add("ID_UNICO_ANDREA")
+  filtros_lectura, filtros_finales = _separar_filtros(filtros, esquema)
+  usecols = _usecols(encabezado, lectura)
+  dtype_dict = esquema_dtypes(esquema, columnas=usecols)
+  ids_index = None if ids is None else pd.Index(pd.unique(np.asarray(ids, dtype=object)))
+
+  def seleccionar_filas(SL):
+    if ids_index is not None:
+      with etapa("filtro", SL) as registro:
+        SL = registro.salida(SL.take(np.flatnonzero(ids_index.get_indexer(SL["ID_UNICO_ANDREA"]) >= 0)))
+    return _aplicar_filtros(SL, filtros_lectura)
+
+  if tamano_bloque is None:
+    SL = leer_csv(
         path,
-        encoding="utf-8",
+        motor=motor,
         dtype=dtype_dict,
-        na_values=na_values_list,
+        na_values=esquema["na_values"],
+        usecols=usecols
     )
-    SL[dates] = SL[dates].astype("datetime64[ns]")
-      
-  SL["PRECIO PRODUCTO"] = SL["PRECIO PRODUCTO"].apply(lambda x: x.replace("$", "")).astype("float64")
+    SL = _transformar_shipping_list(seleccionar_filas(SL), esquema, usecols)
 
-  dtypes_validation = validate_dtypes(SL.dtypes, dtype_dict, dates)
-  assert dtypes_validation[0], dtypes_validation[1]
+  else:
+    bloques = []
+    for bloque in leer_csv_en_bloques(path, tamano_bloque, dtype=dtype_dict, na_values=esquema["na_values"], usecols=usecols):
+      bloques.append(_transformar_shipping_list(seleccionar_filas(bloque), esquema, usecols))
+
+    if bloques:
+      SL = pd.concat(bloques)
+    else:
+      SL = _transformar_shipping_list(leer_csv(path, dtype=dtype_dict, na_values=esquema["na_values"], usecols=usecols, nrows=0), esquema, usecols)
+
+  SL = _proyectar(_aplicar_filtros(SL, filtros_finales), columnas)
+
+  if categoricas:
+    compactar_dataframe(SL, COLUMNAS_CATEGORICAS["SL"])
   return SL
 
+## Exportación
+
+# Nombre de la hoja cuando una sola tabla se guarda como .xlsx
+HOJA_EXCEL = "Hoja1"
+
+def _valor_excel(value):
+  if (value is pd.NA) or (value is pd.NaT) or (isinstance(value, float) and np.isnan(value)):
+    return None
+  return value
+
+# Escribe uno o varios dataframes ({nombre de hoja: dataframe} o pares (nombre, dataframe)) en un .xlsx con el modo write-only de openpyxl:
+# cada fila se agrega completa y se escribe al archivo, sin construir el libro en memoria.
+@con_perfilado("exportación")
+def exportar_excel(hojas: dict, archivo, index=False, estilo_encabezado=False) -> None:
+  from openpyxl import Workbook
+  from openpyxl.cell import WriteOnlyCell
+  from openpyxl.styles import Font, PatternFill
+  from openpyxl.utils.dataframe import dataframe_to_rows
+
+  wb = Workbook(write_only=True)
+  for nombre_hoja, dataframe in (hojas.items() if isinstance(hojas, dict) else hojas):
+    ws = wb.create_sheet(nombre_hoja)
+    if isinstance(dataframe, pd.Series):
+      dataframe = dataframe.to_frame()
+    filas_encabezado = dataframe.columns.nlevels + (1 if index else 0)
+
+    for row_idx, row in enumerate( dataframe_to_rows( dataframe, header=True, index=index ) ):
+      row = [ _valor_excel(value) for value in row ]
+      if estilo_encabezado and row_idx < filas_encabezado:
+        celdas = []
+        for value in row:
+          celda = WriteOnlyCell(ws, value=value)
+          celda.font = Font(bold=True)
+          celda.fill = PatternFill("solid", fgColor="DDEBF7")
+          celdas.append(celda)
+        row = celdas
+      ws.append(row)
+
+  wb.save(archivo)
+
+# Formato de exportación según la extensión del archivo; sin una extensión conocida se guarda como CSV
+EXTENSIONES_EXPORTACION = {
+    ".csv.gz": "csv.gz",
+    ".csv.zst": "csv.zst",
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".xlsx": "xlsx"
+}
+
+# Con True, _guardar (guardar_como de los helpers, guardar_tabla y procesar_datos(guardar=...)) deja las tablas en la
+# cola del exportador en segundo plano y regresa de inmediato; esperar_exportaciones() espera a que se escriban.
+EXPORTACION_EN_SEGUNDO_PLANO = False
+
+def formato_exportacion(destino) -> str:
+  nombre = str(destino).lower()
+  return next((formato for extension, formato in EXTENSIONES_EXPORTACION.items() if nombre.endswith(extension)), "csv")
+
+# Parquet solo acepta nombres de columna de texto; las columnas de las tablas pivote (tuplas) se unen con espacios
+def _tabla_parquet(tabla) -> pd.DataFrame:
+  tabla = tabla.to_frame() if isinstance(tabla, pd.Series) else tabla
+  if not all(isinstance(column, str) for column in tabla.columns):
+    tabla = tabla.copy(deep=False)
+    tabla.columns = [ " ".join(map(str, column)).strip() if isinstance(column, tuple) else str(column) for column in tabla.columns ]
+  return tabla
+
+# Escribe una tabla como CSV, CSV comprimido (.csv.gz, .csv.zst), Parquet o Excel según la extensión de destino.
+# Los CSV y Parquet se escriben a un archivo temporal y se renombran, así nunca queda un archivo a medias.
+# .csv.zst usa zstandard si está instalado y si no el compresor zstd de pyarrow.
+@con_perfilado("exportación")
+def escribir_tabla(tabla, destino, index=False, encoding="latin-1") -> None:
+  formato = formato_exportacion(destino)
+  if formato == "xlsx":
+    exportar_excel({HOJA_EXCEL: tabla}, destino, index=index)
+    return
+
+  destino = Path(destino)
+  temporal = destino.with_name(destino.name + ".tmp")
+  if formato == "parquet":
+    _tabla_parquet(tabla).to_parquet(temporal, index=index)
+  elif formato == "csv.zst" and importlib.util.find_spec("zstandard") is None:
+    import pyarrow as pa
+
+    with pa.CompressedOutputStream(str(temporal), "zstd") as f:
+      tabla.to_csv(f, encoding=encoding, index=index, mode="wb")
+  else:
+    tabla.to_csv(temporal, encoding=encoding, index=index, compression={"csv.gz": "gzip", "csv.zst": "zstd"}.get(formato))
+  os.replace(temporal, destino)
+
+# Hilo que escribe las tablas de su cola una por una para que el análisis siga mientras se exporta. La cola está
+# acotada (max_pendientes) para que las tablas en espera no crezcan sin límite en memoria. Se guarda una copia
+# superficial de cada tabla: agregar o reemplazar columnas después de enviarla no cambia lo que se escribe, pero
+# modificar valores en su lugar (p. ej. con .loc) antes de esperar() sí puede llegar al archivo.
+class ExportadorEnSegundoPlano:
+  def __init__(self, max_pendientes=8):
+    self._cola = queue.Queue(maxsize=max_pendientes)
+    self._condicion = threading.Condition()
+    self._pendientes = 0
+    self._errores = []
+    self._hilo = None
+
+  def enviar(self, tabla, destino, index=False, encoding="latin-1") -> None:
+    with self._condicion:
+      self._pendientes += 1
+      if (self._hilo is None) or (not self._hilo.is_alive()):
+        self._hilo = threading.Thread(target=self._trabajar, name="exportador", daemon=True)
+        self._hilo.start()
+    # la ruta se resuelve al enviar, por si el directorio actual cambia antes de que se escriba
+    self._cola.put((tabla.copy(deep=False), os.path.abspath(destino), index, encoding))
+
+  def _trabajar(self):
+    while True:
+      tabla, destino, index, encoding = self._cola.get()
+      try:
+        escribir_tabla(tabla, destino, index=index, encoding=encoding)
+      except Exception as error:
+        with self._condicion:
+          self._errores.append((str(destino), error))
+      finally:
+        with self._condicion:
+          self._pendientes -= 1
+          self._condicion.notify_all()
+
+  @property
+  def pendientes(self) -> int:
+    return self._pendientes
+
+  # Espera a que se escriba todo lo enviado (a lo más timeout segundos) y regresa los errores [(destino, excepción)]
+  # acumulados desde la última llamada
+  def esperar(self, timeout=None) -> list:
+    with self._condicion:
+      self._condicion.wait_for(lambda: self._pendientes == 0, timeout)
+      errores, self._errores = self._errores, []
+    return errores
+
+_EXPORTADOR = ExportadorEnSegundoPlano()
+
+def esperar_exportaciones(timeout=None) -> list:
+  return _EXPORTADOR.esperar(timeout)
+
+# Al salir de Python se terminan de escribir las tablas pendientes
+@atexit.register
+def _esperar_exportaciones_al_salir():
+  for destino, error in _EXPORTADOR.esperar():
+    print(f"No se pudo exportar {destino}: {error!r}")
+
+# Guarda una tabla de resultados con el formato de la extensión de guardar_como (ver escribir_tabla)
+def _guardar(tabla, guardar_como, index=False, encoding="latin-1") -> None:
+  if EXPORTACION_EN_SEGUNDO_PLANO:
+    _EXPORTADOR.enviar(tabla, guardar_como, index=index, encoding=encoding)
+  else:
+    escribir_tabla(tabla, guardar_como, index=index, encoding=encoding)
+
+@con_perfilado("conteo")
 def conteo_distintivo(dataframe, column, count_name="COUNT",guardar_como=None):
   print(column,end="\n\n")
-  distinct_count_df = pd.DataFrame([dataframe[column].nunique()], columns=[count_name])
+  perfil = _perfil_vigente(dataframe, column)
+  distintos = dataframe[column].nunique() if perfil is None else perfil.distintos[column]
+  distinct_count_df = pd.DataFrame([distintos], columns=[count_name])
   if guardar_como is not None:
-    distinct_count_df.to_csv(guardar_como, encoding="latin-1", index=False)
+    _guardar(distinct_count_df, guardar_como, index=False)
   return distinct_count_df
 
+@con_perfilado("conteo")
 def porcentaje_valores_dist(dataframe, column, decimals=2, plot_percentages=False, plot_type=None, guardar_como=None):
-  count_df = round(dataframe[column].value_counts(1)*100, decimals)
+  perfil = _perfil_vigente(dataframe, column)
+  proporciones = None if perfil is None else perfil.proporciones(column)
+  count_df = round((dataframe[column].value_counts(1) if proporciones is None else proporciones)*100, decimals)
 
   if plot_percentages:
+    import matplotlib.pyplot as plt
+
     if plot_type == None:
       plot_type = "bar"
 
@@ -283,186 +1804,228 @@ def porcentaje_valores_dist(dataframe, column, decimals=2, plot_percentages=Fals
 
   count_df = count_df.rename("Porcentaje %")
   if guardar_como is not None:
-      count_df.to_csv(guardar_como, encoding="latin-1", index=True)
+      _guardar(count_df, guardar_como, index=True)
   return count_df
 
 def mostrar_tabla(dataframe):
   with pd.option_context('display.max_rows', None, 'display.max_columns', None):
     print(dataframe)
 
-def tabla_pivote(dataframe, filas, valores=None, columnas=None, margins=True, margins_name="Total", aggfunc=None, rename_cols=None, return_=False, guardar_como=None):
+# Con memorizar=True la misma tabla pedida otra vez sobre el mismo dataframe sale de la memoria (ver olvidar_pivotes)
+@con_perfilado("pivote")
+def tabla_pivote(dataframe, filas, valores=None, columnas=None, margins=True, margins_name="Total", aggfunc=None, rename_cols=None, return_=False, guardar_como=None, memorizar=False):
   if valores is None:
     if columnas is None:
       frame_to_return = dataframe[valores].describe()
-      if guardar_como is not None: frame_to_return.to_csv(guardar_como, encoding="latin-1", index=True)
+      if guardar_como is not None: _guardar(frame_to_return, guardar_como, index=True)
       return frame_to_return
     else:
-      if (dataframe[columnas].dtypes.name == "object") or (dataframe[columnas].dtypes.name == "datetime64[ns]"):
-        dataframe_copy = dataframe[[valores,columnas]].copy()
-        dataframe_copy["aux_column"] = range( dataframe_copy.shape[0] )
-        pivot_table = pd.pivot_table(
-            dataframe_copy,
-            index=filas,
-            values="aux_column",
-            columns=columnas,
-            aggfunc="nunique",
-            margins=margins,
-            margins_name=margins_name
-        )
+      if es_texto(dataframe[columnas].dtypes) or (dataframe[columnas].dtypes.name == "datetime64[ns]"):
+        pivot_table = _pivote(dataframe, filas, None, columnas, "nunique", margins, margins_name, memorizar)
         if guardar_como is not None:
-            pivot_table.to_csv(guardar_como, encoding="latin-1", index=True)
+            _guardar(pivot_table, guardar_como, index=True)
         return pivot_table
         
       else:
         raise TypeError("Las columnas deben de contener solo valores categóricos, no numéricos.")
 
   if not aggfunc:
-      if dataframe[valores].dtypes.name == "object":
-          aggfunc = "nunique"
-      elif (dataframe[valores].dtypes.name == "float64") or (dataframe[valores].dtypes.name == "int64"):
-          aggfunc = "sum"
-      elif isinstance(valores, list):
+      if isinstance(valores, list):
         aggfunc = {}
         for column in valores:
-            if (dataframe[column].dtypes.name == "object") or (dataframe[column].dtypes.name == "datetime64[ns]"): aggfunc[column] = "nunique"
+            if es_texto(dataframe[column].dtypes) or (dataframe[column].dtypes.name == "datetime64[ns]"): aggfunc[column] = "nunique"
             else: aggfunc[column] = "sum"
+      elif es_texto(dataframe[valores].dtypes):
+          aggfunc = "nunique"
+      elif pd.api.types.is_numeric_dtype(dataframe[valores].dtype) and not pd.api.types.is_bool_dtype(dataframe[valores].dtype):
+          aggfunc = "sum"
                 
   elif isinstance(aggfunc,dict):
       for valor in valores:
           if valor not in aggfunc.keys():
-              if (dataframe[valor].dtypes.name == "object") or (dataframe[valor].dtypes.name == "datetime64[ns]"): aggfunc[valor] = "nunique"
+              if es_texto(dataframe[valor].dtypes) or (dataframe[valor].dtypes.name == "datetime64[ns]"): aggfunc[valor] = "nunique"
               else: aggfunc[valor] = "sum"
 
-  pivot_table = pd.pivot_table(
-        dataframe,
-        index=filas,
-        values=valores,
-        columns=columnas,
-        aggfunc=aggfunc,
-        margins=margins,
-        margins_name=margins_name
-    )
+  pivot_table = _pivote(dataframe, filas, valores, columnas, aggfunc, margins, margins_name, memorizar)
 
   if rename_cols:
     pivot_table = pivot_table.rename(columns=rename_cols)
 
   if guardar_como is not None:
-      pivot_table.to_csv(guardar_como, encoding="latin-1", index=True)
+      _guardar(pivot_table, guardar_como, index=True)
   return pivot_table
 
+# Con un FrameIndexado (ver indexar) los filtros repetidos sobre el mismo dataframe usan índices por columna
+@con_perfilado("filtro")
 def filtrar_Y(dataframe, *condiciones, guardar_como=None):
-  filtered_dataframe = dataframe
-  FILTER = [True] * dataframe.shape[0]
-  for condicion in condiciones:
-    assert isinstance(condicion, tuple), 'Las condiciones deben de estar escritas de la forma:\n(columna, condicion, valor)'
-    if len(condicion) == 3:
-        column, cond, val = condicion
-        if cond == "=":
-          FILTER &= ( filtered_dataframe[column]==val ).values
-    
-        elif cond == ">":
-          FILTER &= ( filtered_dataframe[column]>val ).values
-    
-        elif cond == ">=":
-          FILTER &= ( filtered_dataframe[column]>=val ).values
-    
-        elif cond == "<":
-          FILTER &= ( filtered_dataframe[column]<val ).values
-    
-        elif cond == "<=":
-          FILTER &= ( filtered_dataframe[column]<=val ).values
-    
-        elif cond == "<>":
-          FILTER &= ( filtered_dataframe[column]!=val ).values
+  condiciones = _condiciones_validas(condiciones, AVISO_OPERADORES_Y)
+  if isinstance(dataframe, FrameIndexado):
+    filtered_dataframe = dataframe.filtrar(condiciones, "Y")
+  else:
+    filtered_dataframe = dataframe[compilar_filtro(condiciones, "Y")(dataframe)]
 
-        else:
-            print(f"No se reconoce la condición {cond}.")
-            print(f'La segunda entrada de la condición {condicion} debe de ser: "="(igual), ">"(mayor), ">="(mayor o igual), "<"(menor), "<="(menor o igual) o "<>"(diferente)')
-    elif len(condicion)==2:
-        if condicion[1] == "notnull":
-          FILTER &= ( pd.notnull(filtered_dataframe[ condicion[0] ]) ).values
-        elif condicion[1] == "isnull":
-          FILTER &= pd.isnull(filtered_dataframe[ condicion[0] ])
-        else:
-          print(f'La segunda entrada de la condición {condicion} debe de ser: "notnull" o isnull.')
-
-  if guardar_como is not None: filtered_dataframe[FILTER].to_csv(guardar_como, encoding="latin-1", index=False)
-  return filtered_dataframe[FILTER]
+  if guardar_como is not None: _guardar(filtered_dataframe, guardar_como, index=False)
+  return filtered_dataframe
 
+@con_perfilado("filtro")
 def filtrar_O(dataframe, *condiciones, guardar_como=None):
-  filtered_dataframe = dataframe
-  FILTER = [False] * dataframe.shape[0]
-  for condicion in condiciones:
-    assert isinstance(condicion, tuple), 'Las condiciones deben de estar escritas de la forma:\n(columna, condicion, valor) o (columna, "notnull")'
-    if len(condicion) == 3:
-        column, cond, val = condicion
-        if cond == "=":
-          FILTER |= ( filtered_dataframe[column]==val ).values
-    
-        elif cond == ">":
-          FILTER |= ( filtered_dataframe[column]>val ).values
-    
-        elif cond == ">=":
-          FILTER |= ( filtered_dataframe[column]>=val ).values
-    
-        elif cond == "<":
-          FILTER |= ( filtered_dataframe[column]<val ).values
-    
-        elif cond == "<=":
-          FILTER |= ( filtered_dataframe[column]<=val ).values
-    
-        elif cond == "<>":
-          FILTER |= ( filtered_dataframe[column]!=val ).values
-            
-        else:
-            print(f"No se reconoce la condición {cond}.")
-            print(f'La segunda entrada de la condición {condicion} debe de ser: "="(igual), ">"(mayor), ">="(mayor o igual), "<"(menor), "<="(menor o igual), "<>"(diferente).')
-    elif len(condicion) == 2:
-        if condicion[1] == "notnull":
-          FILTER |= ( pd.notnull(filtered_dataframe[ condicion[0] ]) ).values
-        elif condicion[1] == "isnull":
-          FILTER |= pd.isnull(filtered_dataframe[ condicion[0] ])
-        else:
-          print(f'La segunda entrada de la condición {condicion} debe de ser: "notnull" o isnull.')
-
-  if guardar_como is not None: filtered_dataframe[FILTER].to_csv(guardar_como, encoding="latin-1", index=False)
-  return filtered_dataframe[FILTER]
-
-def filtrar_cruzado(dataframe_1, column_1, dataframe_2, column_2=None, guardar_como=None):
+  condiciones = _condiciones_validas(condiciones, AVISO_OPERADORES_O)
+  if isinstance(dataframe, FrameIndexado):
+    filtered_dataframe = dataframe.filtrar(condiciones, "O")
+  else:
+    filtered_dataframe = dataframe[compilar_filtro(condiciones, "O")(dataframe)]
+
+  if guardar_como is not None: _guardar(filtered_dataframe, guardar_como, index=False)
+  return filtered_dataframe
+
+# Con indice (un IndiceLlaves, ver indice_llaves) el cruce se resuelve con los códigos enteros del índice de llaves
+@con_perfilado("filtro")
+def filtrar_cruzado(dataframe_1, column_1, dataframe_2, column_2=None, guardar_como=None, indice=None):
   if column_2 is None: column_2 = column_1
-  dataframe_to_return = dataframe_1[dataframe_1[column_1].isin( dataframe_2[column_2] )]
-  if guardar_como is not None: dataframe_to_return.to_csv( guardar_como, encoding="latin-1", index=True )
+  indice = _indice_para(dataframe_1, column_1, dataframe_2, column_2, indice)
+  if indice is not None:
+    dataframe_to_return = dataframe_1[indice.contenidas(dataframe_1, column_1, dataframe_2, column_2)]
+  else:
+    dataframe_to_return = dataframe_1[dataframe_1[column_1].isin( dataframe_2[column_2] )]
+  if guardar_como is not None: _guardar(dataframe_to_return, guardar_como, index=True)
   return dataframe_to_return
 
+@con_perfilado("agregación")
 def suma(dataframe, *columnas, guardar_como=None):
   dataframe_to_return = pd.DataFrame({f"suma total de {columna}":[dataframe[columna].sum()] for columna in columnas})
-  if guardar_como is not None: dataframe_to_return.to_csv( guardar_como, encoding="latin-1", index=False )
+  if guardar_como is not None: _guardar(dataframe_to_return, guardar_como, index=False)
   return dataframe_to_return
 
-def procesar_datos(reporte_general_de_usuarios, reporte_de_metas_y_resultados, reporte_SL, filtrar_default=True, guardar=False):
-    RGU = procesar_reporte_general_de_usuarios(reporte_general_de_usuarios)
-    RMR = procesar_reporte_metas_y_resultados(reporte_de_metas_y_resultados, RGU)
-    SL = procesar_shipping_list(reporte_SL)
-    
+## Procesamiento en paralelo
+
+# Pool de procesos reutilizable por procesar_datos y top_usuarias
+def crear_executor(max_workers=None) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+# Los dataframes viajan del proceso hijo al padre como un stream de Arrow IPC (bytes contiguos por columna)
+# en lugar de hacer pickle de columnas object valor por valor. Sin pyarrow se regresa el dataframe tal cual.
+def _frame_a_columnar(dataframe):
+    if not _hay_pyarrow():
+        return dataframe
+    import pyarrow as pa
+
+    tabla = pa.Table.from_pandas(dataframe)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, tabla.schema) as writer:
+        writer.write_table(tabla)
+    return sink.getvalue().to_pybytes()
+
+def _columnar_a_frame(resultado) -> pd.DataFrame:
+    if isinstance(resultado, pd.DataFrame):
+        return resultado
+    import pyarrow as pa
+
+    return _nulos_como_nan(pa.ipc.open_stream(resultado).read_pandas())
+
+# Se ejecuta en el proceso hijo
+def _ejecutar_en_proceso(funcion, *args, **kwargs):
+    return _frame_a_columnar(funcion(*args, **kwargs))
+
+def _enviar(executor, funcion, *args, **kwargs):
+    return executor.submit(_ejecutar_en_proceso, funcion, *args, **kwargs)
+
+def _recibir(future) -> pd.DataFrame:
+    return _columnar_a_frame(future.result())
+
+# Con paralelo=True (o un executor de crear_executor) los tres reportes se leen y procesan al mismo tiempo en un
+# pool de procesos. Con tamano_bloque (y filtrar_default) la Shipping List se lee por bloques y solo se conservan
+# los canjes de las usuarias Estrella/Mayorista, en lugar de cargar el archivo completo y filtrarlo al final.
+# guardar=True guarda los tres reportes procesados como CSV en latin-1; guardar="parquet", "csv.gz" o "csv.zst" los
+# guarda en ese formato (en segundo plano con EXPORTACION_EN_SEGUNDO_PLANO).
+@con_perfilado("procesamiento")
+def procesar_datos(reporte_general_de_usuarios, reporte_de_metas_y_resultados, reporte_SL, filtrar_default=True, guardar=False, usar_cache=False, motor="c", tamano_bloque=None, categoricas=False, paralelo=False, executor=None):
+    opciones = {"usar_cache": usar_cache, "categoricas": categoricas}
+    SL_por_bloques = filtrar_default and (tamano_bloque is not None)
+
+    if paralelo or (executor is not None):
+        executor_propio = executor is None
+        executor = crear_executor(max_workers=3) if executor_propio else executor
+        try:
+            futuro_RGU = _enviar(executor, procesar_reporte_general_de_usuarios, reporte_general_de_usuarios, motor=motor, **opciones)
+            futuro_RMR = _enviar(executor, procesar_reporte_metas_y_resultados, reporte_de_metas_y_resultados, motor=motor, **opciones)
+            if not SL_por_bloques:
+                futuro_SL = _enviar(executor, procesar_shipping_list, reporte_SL, motor=motor, tamano_bloque=tamano_bloque, **opciones)
+
+            RGU = _recibir(futuro_RGU)
+            if filtrar_default:
+                RGU = filtrar_O(RGU, ("PERFIL","=","Estrella"), ("PERFIL","=","Mayorista"))
+            if SL_por_bloques:
+                futuro_SL = _enviar(executor, procesar_shipping_list, reporte_SL, ids=RGU["ID_UNICO_ANDREA"].to_numpy(), tamano_bloque=tamano_bloque, **opciones)
+
+            RMR = _recibir(futuro_RMR)
+            SL = _recibir(futuro_SL)
+        finally:
+            if executor_propio:
+                executor.shutdown()
+
+        if filtrar_default:
+            RMR = filtrar_O(RMR, ("PERFIL","=","Estrella"), ("PERFIL","=","Mayorista"))
+            if not SL_por_bloques:
+                SL = filtrar_cruzado(SL, "ID_UNICO_ANDREA", RGU, "ID_UNICO_ANDREA")
 
-    print("\n¡PROCESAMIENTO DE DATOS EXITOSO!")
+    else:
+        RGU = procesar_reporte_general_de_usuarios(reporte_general_de_usuarios, motor=motor, **opciones)
+        RMR = procesar_reporte_metas_y_resultados(reporte_de_metas_y_resultados, RGU, motor=motor, **opciones)
+
+        if filtrar_default:
+            RGU = filtrar_O(RGU, ("PERFIL","=","Estrella"), ("PERFIL","=","Mayorista"))
+            RMR = filtrar_O(RMR, ("PERFIL","=","Estrella"), ("PERFIL","=","Mayorista"))
+
+        if SL_por_bloques:
+            SL = procesar_shipping_list(reporte_SL, ids=RGU["ID_UNICO_ANDREA"], tamano_bloque=tamano_bloque, **opciones)
+        else:
+            SL = procesar_shipping_list(reporte_SL, motor=motor, tamano_bloque=tamano_bloque, **opciones)
+            if filtrar_default:
+                SL = filtrar_cruzado(SL, "ID_UNICO_ANDREA", RGU, "ID_UNICO_ANDREA")
 
     if filtrar_default:
-        RGU = filtrar_O(RGU, ("PERFIL","=","Estrella"), ("PERFIL","=","Mayorista"))
-        RMR = filtrar_O(RMR, ("PERFIL","=","Estrella"), ("PERFIL","=","Mayorista"))
-        SL = filtrar_cruzado(SL, "ID_UNICO_ANDREA", RGU, "ID_UNICO_ANDREA")
+        RGU, RMR, SL = (_quitar_categorias_sin_uso(reporte) for reporte in (RGU, RMR, SL))
+
+    print("\n¡PROCESAMIENTO DE DATOS EXITOSO!")
 
     if guardar:
-        RGU.to_csv("Reportegeneraldeusuarios_procesado.csv",encoding="latin-1", index=False)
-        RMR.to_csv("Reportedemetasyresultados_procesado.csv", encoding="latin-1", index=False)
-        SL.to_csv("v_sl_procesado.csv", encoding="latin-1", index=False)
+        _guardar_procesados(RGU, RMR, SL, guardar)
 
     return RGU, RMR, SL
 
-def cruzar( dataframe1, dataframe2, col_tabla_izquierda, col_tabla_derecha, sufijos=None, metodo_cruce="ambas" ):
+# Guarda los tres reportes procesados en carpeta (por defecto el directorio actual); guardar es True (CSV) o una extensión
+def _guardar_procesados(RGU, RMR, SL, guardar, carpeta=None) -> None:
+    extension = "csv" if guardar is True else guardar
+    assert (f".{extension}" in EXTENSIONES_EXPORTACION), f"El parámetro 'guardar' debe ser True o alguna de las siguientes extensiones: {[ extension[1:] for extension in EXTENSIONES_EXPORTACION ]}."
+    carpeta = Path(".") if carpeta is None else Path(carpeta)
+    carpeta.mkdir(parents=True, exist_ok=True)
+    _guardar(RGU, carpeta / f"Reportegeneraldeusuarios_procesado.{extension}", index=False)
+    _guardar(RMR, carpeta / f"Reportedemetasyresultados_procesado.{extension}", index=False)
+    _guardar(SL, carpeta / f"v_sl_procesado.{extension}", index=False)
+
+@con_perfilado("cruce")
+def cruzar( dataframe1, dataframe2, col_tabla_izquierda, col_tabla_derecha, sufijos=None, metodo_cruce="ambas", indice=None ):
     how_options =  ["ambas","izquierda","derecha","izq-der"]
     how_dict = {"ambas":"inner","izquierda":"left","derecha":"right","izq-der":"outer"}
     assert (metodo_cruce in how_options), f"El parámetro 'metodo_cruce' debe coincidir con alguna de las siguientes opciones: {how_options}."
+
+    # El cruce "izq-der" (outer) ordena las llaves y se deja a pandas, igual que los cruces con llaves nulas (merge
+    # las empareja entre sí y las acomoda en otro orden)
+    if indice is not None and (metodo_cruce == "izq-der" or dataframe1[col_tabla_izquierda].hasnans or dataframe2[col_tabla_derecha].hasnans):
+        indice = None
+    indice = _indice_para(dataframe1, col_tabla_izquierda, dataframe2, col_tabla_derecha, indice)
+    if indice is not None:
+        codigos1 = indice.codigos(dataframe1, col_tabla_izquierda)
+        codigos2 = indice.codigos(dataframe2, col_tabla_derecha)
+        if metodo_cruce == "derecha":
+            derecha, izquierda = indice.parejas(codigos2, codigos1, conservar=True)
+        else:
+            izquierda, derecha = indice.parejas(codigos1, codigos2, conservar=(metodo_cruce == "izquierda"))
+        # si el cruce "ambas" da tantas filas como la izquierda sin ser uno a uno, merge las regresa en otro orden
+        if metodo_cruce == "ambas" and len(izquierda) == len(codigos1) and not np.array_equal(izquierda, np.arange(len(codigos1))):
+            indice = None
+    if indice is not None:
+        return _cruce_por_posiciones(dataframe1, dataframe2, col_tabla_izquierda, col_tabla_derecha, izquierda, derecha, sufijos, metodo_cruce == "derecha")
         
     if sufijos is not None:
         return dataframe1.merge( dataframe2, left_on=col_tabla_izquierda, right_on=col_tabla_derecha, suffixes=sufijos, how=how_dict[metodo_cruce] )
@@ -478,68 +2041,673 @@ def seleccionar(dataframe, *columnas):
 def concatenar( *dataframes_list ):
     return pd.concat( list(dataframes_list) )
 
+# Si nombre_tabla termina en alguna de EXTENSIONES_EXPORTACION la tabla se guarda en ese formato; si no, como CSV
 def guardar_tabla(tabla: pd.DataFrame, nombre_tabla: str, guardar_en=None) -> None:
-    whole_name = nombre_tabla if nombre_tabla.endswith(".csv") else nombre_tabla + ".csv"
+    whole_name = nombre_tabla if nombre_tabla.lower().endswith(tuple(EXTENSIONES_EXPORTACION)) else nombre_tabla + ".csv"
     if guardar_en is not None:
         whole_name = guardar_en + whole_name
-    tabla.to_csv(whole_name, encoding="utf-8", index=False)
+    _guardar(tabla, whole_name, index=False, encoding="utf-8")
+
+## Consultas diferidas
+
+PROCESADORES = {
+    "RGU": procesar_reporte_general_de_usuarios,
+    "RMR": procesar_reporte_metas_y_resultados,
+    "SL": procesar_shipping_list
+}
+
+# Cadena diferida de filtrar_Y / filtrar_O / seleccionar / cruzar / filtrar_cruzado / tabla_pivote sobre un reporte.
+# Cada método regresa una consulta nueva y nada se lee hasta pedir resultado(). Al ejecutarse, las columnas que usa la
+# cadena se recorren de atrás hacia adelante para leer del CSV solo esas columnas (y generar solo las columnas
+# derivadas que hacen falta), y los filtros del inicio de la cadena se evalúan al leer, antes de convertir fechas
+# y por bloque si el reporte se lee por bloques. Un filtrar_cruzado de la Shipping List por ID_UNICO_ANDREA se
+# resuelve con el parámetro ids de procesar_shipping_list.
+# Con categoricas=True las filas descartadas ya no cuentan para decidir qué columnas se vuelven category.
+#
+#   RGU = Consulta.reporte("RGU", "Reportegeneraldeusuarios.csv").filtrar_O(("PERFIL","=","Estrella"), ("PERFIL","=","Mayorista"))
+#   SL = Consulta.reporte("SL", "v_sl.csv").filtrar_cruzado("ID_UNICO_ANDREA", RGU)
+#   SL.cruzar(RGU, "ID_UNICO_ANDREA", "ID_UNICO_ANDREA").tabla_pivote("ESTADO_y", "PRECIO PRODUCTO").resultado()
+class Consulta:
+    def __init__(self, fuente, pasos=()):
+        self._fuente = fuente
+        self._pasos = tuple(pasos)
+        self._resultados = {}
+
+    # fuente: nombre del reporte ("RGU", "RMR" o "SL") y la ruta del CSV; opciones se pasan al procesar_* del reporte
+    @classmethod
+    def reporte(cls, reporte, path, **opciones):
+        assert (reporte in PROCESADORES), f"El parámetro 'reporte' debe coincidir con alguna de las siguientes opciones: {list(PROCESADORES)}."
+        return cls((reporte, path, opciones))
+
+    # fuente: un dataframe ya cargado (solo se proyecta a las columnas que usa la cadena)
+    @classmethod
+    def dataframe(cls, dataframe):
+        return cls(dataframe)
+
+    def _agregar(self, *paso):
+        return Consulta(self._fuente, self._pasos + (paso,))
+
+    def filtrar_Y(self, *condiciones):
+        return self._agregar("filtro", "Y", tuple(_condiciones_validas(condiciones, AVISO_OPERADORES_Y)))
+
+    def filtrar_O(self, *condiciones):
+        return self._agregar("filtro", "O", tuple(_condiciones_validas(condiciones, AVISO_OPERADORES_O)))
+
+    def seleccionar(self, *columnas):
+        return self._agregar("seleccionar", list(columnas))
+
+    def seleccionar_list(self, lista_columnas):
+        return self.seleccionar(*lista_columnas)
+
+    def cruzar(self, otra, col_tabla_izquierda, col_tabla_derecha, sufijos=None, metodo_cruce="ambas"):
+        return self._agregar("cruzar", _como_consulta(otra), col_tabla_izquierda, col_tabla_derecha, sufijos, metodo_cruce)
+
+    def filtrar_cruzado(self, column_1, otra, column_2=None):
+        return self._agregar("filtrar_cruzado", _como_consulta(otra), column_1, column_1 if column_2 is None else column_2)
+
+    def tabla_pivote(self, filas, valores=None, columnas=None, margins=True, margins_name="Total", aggfunc=None, rename_cols=None):
+        return self._agregar("tabla_pivote", dict(filas=filas, valores=valores, columnas=columnas, margins=margins, margins_name=margins_name, aggfunc=aggfunc, rename_cols=rename_cols))
+
+    # funcion(dataframe) -> dataframe; columnas son las que lee funcion (None si puede usar cualquiera)
+    def aplicar(self, funcion, columnas=None):
+        return self._agregar("aplicar", funcion, None if columnas is None else list(columnas))
+
+    # Columnas que necesita cada paso a su entrada, de atrás hacia adelante a partir de las que se piden al final
+    def _necesarias(self, requeridas) -> list:
+        necesarias = [requeridas]
+        for paso in reversed(self._pasos):
+            despues = necesarias[0]
+            if paso[0] == "filtro":
+                antes = None if despues is None else despues | set(_columnas_condiciones(paso[2]))
+            elif paso[0] == "seleccionar":
+                antes = set(paso[1])
+            elif paso[0] == "cruzar":
+                antes = _necesarias_cruce(despues, paso)[0]
+            elif paso[0] == "filtrar_cruzado":
+                antes = None if despues is None else despues | {paso[2]}
+            elif paso[0] == "tabla_pivote":
+                antes = { columna for llave in ("filas", "valores", "columnas") for columna in _como_lista(paso[1][llave]) }
+            else:
+                antes = None if (despues is None or paso[2] is None) else despues | set(paso[2])
+            necesarias.insert(0, antes)
+        return necesarias
+
+    # Filtros que se evalúan al leer el reporte, cruce de la Shipping List que se resuelve con ids y posiciones de los
+    # pasos restantes. Solo se adelantan los filtros del inicio de la cadena (antes del primer cruce, pivote o aplicar).
+    def _empuje(self) -> tuple:
+        filtros, cruce_ids, restantes = [], None, list(range(len(self._pasos)))
+        if isinstance(self._fuente, pd.DataFrame):
+            return filtros, cruce_ids, restantes
+        for posicion, paso in enumerate(self._pasos):
+            if paso[0] == "filtro":
+                filtros.append((paso[1], paso[2]))
+            elif paso[0] == "filtrar_cruzado" and cruce_ids is None and self._fuente[0] == "SL" and paso[2] == LLAVE_USUARIA:
+                cruce_ids = paso
+            elif paso[0] != "seleccionar":
+                break
+            if paso[0] != "seleccionar":
+                restantes.remove(posicion)
+        return filtros, cruce_ids, restantes
+
+    def _ejecutar(self, requeridas=None) -> pd.DataFrame:
+        llave = None if requeridas is None else frozenset(requeridas)
+        if llave not in self._resultados:
+            necesarias = self._necesarias(llave)
+            filtros, cruce_ids, restantes = self._empuje()
+
+            if isinstance(self._fuente, pd.DataFrame):
+                dataframe = _proyectar(self._fuente, necesarias[0])
+            else:
+                reporte, path, opciones = self._fuente
+                opciones = dict(opciones, columnas=necesarias[0], filtros=filtros or None)
+                if cruce_ids is not None:
+                    opciones["ids"] = cruce_ids[1]._ejecutar({cruce_ids[3]})[cruce_ids[3]].to_numpy()
+                dataframe = PROCESADORES[reporte](path, **opciones)
+
+            for posicion in restantes:
+                dataframe = _ejecutar_paso(dataframe, self._pasos[posicion], necesarias[posicion + 1])
+            self._resultados[llave] = dataframe
+        return self._resultados[llave]
+
+    # Ejecuta la cadena (una sola vez; las llamadas siguientes regresan el mismo resultado)
+    def resultado(self, guardar_como=None) -> pd.DataFrame:
+        dataframe = self._ejecutar()
+        if guardar_como is not None: _guardar(dataframe, guardar_como, index=bool(self._pasos) and self._pasos[-1][0] == "tabla_pivote")
+        return dataframe
+
+    # Descripción de lo que se va a leer y ejecutar, para revisar la consulta sin correrla
+    def plan(self, requeridas=None, sangria="") -> str:
+        necesarias = self._necesarias(None if requeridas is None else frozenset(requeridas))
+        filtros, cruce_ids, restantes = self._empuje()
+        fuente = "dataframe" if isinstance(self._fuente, pd.DataFrame) else f"{self._fuente[0]} {self._fuente[1]}"
+        columnas = "todas" if necesarias[0] is None else sorted(necesarias[0])
+        lineas = [f"{sangria}{fuente}", f"{sangria}  columnas: {columnas}"]
+        lineas += [ f"{sangria}  filtro al leer ({modo}): {list(condiciones)}" for modo, condiciones in filtros ]
+        if cruce_ids is not None:
+            lineas.append(f"{sangria}  ids de {cruce_ids[3]}:")
+            lineas.append(cruce_ids[1].plan({cruce_ids[3]}, sangria + "    "))
+        for posicion in restantes:
+            paso, despues = self._pasos[posicion], necesarias[posicion + 1]
+            lineas.append(f"{sangria}  {paso[0]}")
+            if paso[0] == "cruzar":
+                lineas.append(paso[1].plan(_necesarias_cruce(despues, paso)[1], sangria + "    "))
+            elif paso[0] == "filtrar_cruzado":
+                lineas.append(paso[1].plan({paso[3]}, sangria + "    "))
+        return "\n".join(lineas)
+
+def _como_consulta(otra) -> Consulta:
+    return otra if isinstance(otra, Consulta) else Consulta.dataframe(otra)
+
+# Columnas que necesita cada lado de un cruce para producir despues. Una columna con sufijo puede venir de cualquiera
+# de los dos lados sin sufijo, y el sufijo solo aparece si la columna está en ambos, así que se piden en los dos.
+def _necesarias_cruce(despues, paso) -> tuple:
+    _, _, col_izquierda, col_derecha, sufijos, _ = paso
+    if despues is None:
+        return None, None
+    sufijos = sufijos or ("_x", "_y")
+    nombres = set(despues)
+    for columna in despues:
+        for sufijo in sufijos:
+            if sufijo and columna.endswith(sufijo):
+                nombres.add(columna[:-len(sufijo)])
+    return nombres | {col_izquierda}, nombres | {col_derecha}
+
+def _ejecutar_paso(dataframe, paso, despues) -> pd.DataFrame:
+    if paso[0] == "filtro":
+        return (filtrar_Y if paso[1] == "Y" else filtrar_O)(dataframe, *paso[2])
+    if paso[0] == "seleccionar":
+        return seleccionar_list(dataframe, paso[1])
+    if paso[0] == "cruzar":
+        _, otra, col_izquierda, col_derecha, sufijos, metodo_cruce = paso
+        return cruzar(dataframe, otra._ejecutar(_necesarias_cruce(despues, paso)[1]), col_izquierda, col_derecha, sufijos=sufijos, metodo_cruce=metodo_cruce)
+    if paso[0] == "filtrar_cruzado":
+        return filtrar_cruzado(dataframe, paso[2], paso[1]._ejecutar({paso[3]}), paso[3])
+    if paso[0] == "tabla_pivote":
+        opciones = dict(paso[1])
+        if isinstance(opciones["aggfunc"], dict):
+            opciones["aggfunc"] = dict(opciones["aggfunc"])
+        return tabla_pivote(dataframe, **opciones)
+    return paso[1](dataframe)
+
+# Las tres consultas de procesar_datos sin ejecutar: con filtrar_default, RGU y RMR quedan filtradas por PERFIL al
+# leerse y la Shipping List se lee solo con los canjes de esas usuarias
+def consultas_datos(reporte_general_de_usuarios, reporte_de_metas_y_resultados, reporte_SL, filtrar_default=True, **opciones) -> tuple:
+    RGU = Consulta.reporte("RGU", reporte_general_de_usuarios, **opciones)
+    RMR = Consulta.reporte("RMR", reporte_de_metas_y_resultados, **opciones)
+    SL = Consulta.reporte("SL", reporte_SL, **opciones)
+    if filtrar_default:
+        RGU = RGU.filtrar_O(("PERFIL","=","Estrella"), ("PERFIL","=","Mayorista"))
+        RMR = RMR.filtrar_O(("PERFIL","=","Estrella"), ("PERFIL","=","Mayorista"))
+        SL = SL.filtrar_cruzado("ID_UNICO_ANDREA", RGU)
+    return RGU, RMR, SL
+
+## Lote de campañas
+
+COLUMNAS_MANIFIESTO = ["reporte_general_de_usuarios", "reporte_de_metas_y_resultados", "reporte_SL"]
+
+# Campañas de un manifiesto: una lista de tripletas (usuarios, metas, shipping list[, nombre]) o de dicts con las
+# COLUMNAS_MANIFIESTO (y "nombre" opcional), o la ruta de un .json con esa lista o de un .csv con esas columnas.
+# Las rutas relativas de un archivo de manifiesto son relativas a la carpeta del manifiesto.
+def leer_manifiesto(manifiesto) -> list:
+    if isinstance(manifiesto, (str, Path)):
+        archivo = Path(manifiesto)
+        if archivo.suffix.lower() == ".json":
+            entradas = json.loads(archivo.read_text(encoding="utf-8"))
+        else:
+            entradas = pd.read_csv(archivo, dtype=str, encoding=detectar_encoding(archivo)).to_dict("records")
+        base = archivo.resolve().parent
+    else:
+        entradas, base = list(manifiesto), Path.cwd()
+
+    campanas = []
+    for numero, entrada in enumerate(entradas, start=1):
+        if not isinstance(entrada, dict):
+            entrada = dict(zip(COLUMNAS_MANIFIESTO + ["nombre"], entrada))
+        faltantes = [ columna for columna in COLUMNAS_MANIFIESTO if pd.isna(entrada.get(columna)) ]
+        assert not faltantes, f"A la campaña {numero} del manifiesto le faltan las columnas {faltantes}."
+        nombre = entrada.get("nombre")
+        campana = {"nombre": f"campaña_{numero}" if pd.isna(nombre) else str(nombre)}
+        campanas.append(campana | { columna: (base / entrada[columna]).resolve() for columna in COLUMNAS_MANIFIESTO })
+    return campanas
+
+# Los ids de las usuarias filtradas se comparten con los procesos del pool en un bloque de memoria compartida con
+# un stream de Arrow IPC, en lugar de mandar el arreglo por pickle con cada tarea. Sin pyarrow se mandan tal cual.
+def _compartir_ids(ids) -> tuple:
+    if not _hay_pyarrow():
+        return None, ids
+    from multiprocessing import shared_memory
+
+    datos = _frame_a_columnar(pd.DataFrame({LLAVE_USUARIA: ids}))
+    memoria = shared_memory.SharedMemory(create=True, size=max(len(datos), 1))
+    memoria.buf[:len(datos)] = datos
+    return memoria, (memoria.name, len(datos))
+
+def _leer_ids_compartidos(referencia) -> np.ndarray:
+    if isinstance(referencia, np.ndarray):
+        return referencia
+    from multiprocessing import shared_memory
+
+    nombre, tamano = referencia
+    memoria = shared_memory.SharedMemory(name=nombre)
+    try:
+        return _columnar_a_frame(bytes(memoria.buf[:tamano]))[LLAVE_USUARIA].to_numpy()
+    finally:
+        memoria.close()
+
+# Se ejecutan en los procesos del pool
+def _procesar_metas_lote(path, filtrar_default=True, **opciones):
+    RMR = procesar_reporte_metas_y_resultados(path, **opciones)
+    if filtrar_default:
+        RMR = _quitar_categorias_sin_uso(filtrar_O(RMR, ("PERFIL","=","Estrella"), ("PERFIL","=","Mayorista")))
+    return RMR
+
+def _procesar_shipping_list_lote(path, ids=None, **opciones):
+    return procesar_shipping_list(path, ids=None if ids is None else _leer_ids_compartidos(ids), **opciones)
+
+# procesar_datos sobre las campañas de un manifiesto (ver leer_manifiesto). Cada reporte de usuarios distinto se
+# procesa una sola vez en este proceso y sus ids filtrados se comparten por memoria compartida; los reportes de
+# metas y las Shipping List (también una vez por archivo distinto) se procesan en paralelo en el pool. Una campaña
+# que falla no detiene a las demás: su resultado queda con el error.
+# Regresa una lista con un dict por campaña: nombre, rutas, RGU, RMR y SL (None con conservar_tablas=False),
+# filas de cada reporte y error (None si no falló). Con guardar (True o una extensión, como en procesar_datos) los
+# reportes procesados de cada campaña se guardan en salida/<nombre>.
+@con_perfilado("procesamiento")
+def procesar_lote(manifiesto, filtrar_default=True, guardar=False, salida=None, conservar_tablas=True, usar_cache=False, motor="c", tamano_bloque=None, categoricas=False, max_workers=None, executor=None) -> list:
+    campanas = leer_manifiesto(manifiesto)
+    opciones = {"usar_cache": usar_cache, "categoricas": categoricas}
+    opciones_SL = opciones | ({"motor": motor} if tamano_bloque is None else {"tamano_bloque": tamano_bloque})
+    salida = Path(".") if salida is None else Path(salida)
+
+    executor_propio = executor is None
+    executor = crear_executor(max_workers=max_workers) if executor_propio else executor
+    memorias, usuarios, futuros = [], {}, {}
+    try:
+        for path in dict.fromkeys(campana["reporte_general_de_usuarios"] for campana in campanas):
+            try:
+                RGU = procesar_reporte_general_de_usuarios(path, motor=motor, **opciones)
+                ids = None
+                if filtrar_default:
+                    RGU = _quitar_categorias_sin_uso(filtrar_O(RGU, ("PERFIL","=","Estrella"), ("PERFIL","=","Mayorista")))
+                    memoria, ids = _compartir_ids(RGU[LLAVE_USUARIA].to_numpy())
+                    if memoria is not None:
+                        memorias.append(memoria)
+                usuarios[path] = (RGU, ids, None)
+            except Exception as error:
+                usuarios[path] = (None, None, error)
+
+        for campana in campanas:
+            RGU, ids, error = usuarios[campana["reporte_general_de_usuarios"]]
+            if error is not None:
+                continue
+            llave_RMR = ("RMR", campana["reporte_de_metas_y_resultados"])
+            if llave_RMR not in futuros:
+                futuros[llave_RMR] = _enviar(executor, _procesar_metas_lote, llave_RMR[1], filtrar_default=filtrar_default, motor=motor, **opciones)
+            llave_SL = ("SL", campana["reporte_SL"], campana["reporte_general_de_usuarios"] if filtrar_default else None)
+            if llave_SL not in futuros:
+                futuros[llave_SL] = _enviar(executor, _procesar_shipping_list_lote, llave_SL[1], ids=ids, **opciones_SL)
+
+        resultados = []
+        for campana in campanas:
+            resultado = {"nombre": campana["nombre"], "rutas": campana, "RGU": None, "RMR": None, "SL": None, "filas": None, "error": None}
+            try:
+                RGU, _, error = usuarios[campana["reporte_general_de_usuarios"]]
+                if error is not None:
+                    raise error
+                RMR = _recibir(futuros[("RMR", campana["reporte_de_metas_y_resultados"])])
+                SL = _recibir(futuros[("SL", campana["reporte_SL"], campana["reporte_general_de_usuarios"] if filtrar_default else None)])
+                if guardar:
+                    _guardar_procesados(RGU, RMR, SL, guardar, salida / campana["nombre"])
+                resultado["filas"] = {"RGU": RGU.shape[0], "RMR": RMR.shape[0], "SL": SL.shape[0]}
+                if conservar_tablas:
+                    resultado |= {"RGU": RGU, "RMR": RMR, "SL": SL}
+                print(f"{campana['nombre']}: ¡PROCESAMIENTO DE DATOS EXITOSO!")
+            except Exception as error:
+                resultado["error"] = error
+                print(f"{campana['nombre']}: falló el procesamiento ({type(error).__name__}: {error})")
+            resultados.append(resultado)
+    finally:
+        if executor_propio:
+            executor.shutdown()
+        for memoria in memorias:
+            memoria.close()
+            memoria.unlink()
+    return resultados
+
+# Una fila por campaña de procesar_lote con las filas de cada reporte y el error, si hubo
+def resumen_lote(resultados) -> pd.DataFrame:
+    filas = []
+    for resultado in resultados:
+        conteos = resultado["filas"] or {}
+        filas.append({
+            "nombre": resultado["nombre"],
+            "estado": "error" if resultado["error"] is not None else "ok",
+            "filas RGU": conteos.get("RGU"),
+            "filas RMR": conteos.get("RMR"),
+            "filas SL": conteos.get("SL"),
+            "error": None if resultado["error"] is None else f"{type(resultado['error']).__name__}: {resultado['error']}"
+        })
+    return pd.DataFrame(filas)
 
 ## Top usuarias
 
-def top_usuarias(every_csv_file):
-    start = time()
-    reports: list[pd.DataFrame] = []
-    columns_to_keep: list[str] = [
+COLUMNAS_TOP_USUARIAS: list[str] = [
     "MONTO_DE_VENTA_NETA_ACUMULADA_AL_CIERRE_DE_MES",
     "NIVEL",
     "PERFIL",
     "CUOTA_OBJETIVO",
     "ID_UNICO_ANDREA",
     "MES"
-    ]
-    
-    months = []
-    for file_ in every_csv_file:
-        encoding_method = "utf-8"
-        try:
-            report = pd.read_csv(file_, encoding=encoding_method)
-        except UnicodeDecodeError:
-            encoding_method = "latin-1"
-            report = pd.read_csv(file_, encoding=encoding_method)
-        month = str( int( report["MES"].unique()[0] ) )
-        months.append(month)
-        rename_columns: dict[str:str] = {"MONTO_DE_VENTA_NETA_ACUMULADA_AL_CIERRE_DE_MES":f"VENTA_NETA_MES_{month}"}
-    
-        report_copy = report.loc[report["PERFIL"]=="Estrella", columns_to_keep].rename(columns=rename_columns)
-        reports.append(report_copy)
-    
-    raw_selling_details: pd.DataFrame = pd.concat( reports ).fillna(0).drop(["PERFIL","MES"], axis=1)
-    
-    users_selling_details = raw_selling_details.groupby( "ID_UNICO_ANDREA" ).agg( {f"VENTA_NETA_MES_{i+1}":"sum" for i in range(3)}|{"CUOTA_OBJETIVO":"mean", "NIVEL":"mean"} )
-    for month in months:
-        users_selling_details.loc[:,f"SUPERO_CUOTA_OBJETIVO_MES_{month}_check"] = users_selling_details.apply( lambda x: 1 if x[f"VENTA_NETA_MES_{month}"]>= x["CUOTA_OBJETIVO"] else 0, axis=1 )
-    
+]
+
+# Almacén con el resumen mensual por usuaria (una fila por ID_UNICO_ANDREA, AÑO y MES)
+ALMACEN_TOP_USUARIAS = Path("almacen_top_usuarias" + _extension_cache())
+
+COLUMNAS_ALMACEN_TOP_USUARIAS: list[str] = [
+    "ID_UNICO_ANDREA",
+    "AÑO",
+    "MES",
+    "VENTA_NETA",
+    "CUOTA_SUMA",
+    "NIVEL_SUMA",
+    "FILAS"
+]
+
+# Lee un reporte mensual de metas y conserva las columnas de las usuarias Estrella. El mes y el año quedan en attrs.
+def _leer_mes_top_usuarias(file_, motor="c") -> pd.DataFrame:
+    report = leer_csv(file_, motor=motor)
+    report_copy = report.loc[mascara_condicion(report, ("PERFIL","=","Estrella")), COLUMNAS_TOP_USUARIAS]
+    report_copy.attrs["MES"] = str( int( report["MES"].unique()[0] ) )
+    report_copy.attrs["AÑO"] = str( int( report["AÑO"].unique()[0] ) ) if "AÑO" in report.columns else "0"
+    return report_copy
+
+def _leer_meses_top_usuarias(every_csv_file, motor="c", executor=None) -> list:
+    if executor is not None:
+        futures = [ _enviar(executor, _leer_mes_top_usuarias, file_, motor=motor) for file_ in every_csv_file ]
+        return [ _recibir(future) for future in futures ]
+    return [ _leer_mes_top_usuarias(file_, motor=motor) for file_ in every_csv_file ]
+
+# Resume un reporte mensual a una fila por usuaria. Se guardan sumas y número de filas (no promedios) para que
+# la cuota y el nivel promedio de cualquier ventana de meses salgan igual que promediando los renglones originales.
+@con_perfilado("resumen")
+def _resumir_mes_top_usuarias(report) -> pd.DataFrame:
+    report = report.fillna(0)
+    summary = report.groupby( "ID_UNICO_ANDREA" ).agg(
+        VENTA_NETA=("MONTO_DE_VENTA_NETA_ACUMULADA_AL_CIERRE_DE_MES", "sum"),
+        CUOTA_SUMA=("CUOTA_OBJETIVO", "sum"),
+        NIVEL_SUMA=("NIVEL", "sum"),
+        FILAS=("NIVEL", "size")
+    ).reset_index()
+    summary.insert(1, "AÑO", int(report.attrs["AÑO"]))
+    summary.insert(2, "MES", int(report.attrs["MES"]))
+    return summary
+
+def cargar_almacen_top_usuarias(almacen=None) -> pd.DataFrame:
+    almacen = ALMACEN_TOP_USUARIAS if almacen is None else Path(almacen)
+    if almacen.exists():
+        store = _leer_frame(almacen)
+        # los almacenes anteriores también guardaban SUPERO_CUOTA_MES, que se recalcula sobre la ventana de meses
+        archivos = store.attrs.get("archivos", {})
+        store = store[COLUMNAS_ALMACEN_TOP_USUARIAS]
+        store.attrs["archivos"] = archivos
+        return store
+    store = pd.DataFrame(columns=COLUMNAS_ALMACEN_TOP_USUARIAS)
+    store.attrs["archivos"] = {}
+    return store
+
+# Agrega al almacén los reportes mensuales que aún no contiene. Los archivos ya ingeridos (mismo hash) no se vuelven
+# a leer; si llega otro archivo de un mes que ya está en el almacén (o dos del mismo mes), ese mes se reemplaza por
+# el último.
+def actualizar_almacen_top_usuarias(every_csv_file, almacen=None, motor="c", executor=None) -> pd.DataFrame:
+    return _actualizar_almacen_top_usuarias(every_csv_file, almacen=almacen, motor=motor, executor=executor)[0]
+
+# Regresa también el (año, mes) de cada archivo recibido, aunque otro archivo del mismo mes lo haya reemplazado
+def _actualizar_almacen_top_usuarias(every_csv_file, almacen=None, motor="c", executor=None) -> tuple:
+    almacen = ALMACEN_TOP_USUARIAS if almacen is None else Path(almacen)
+    store = cargar_almacen_top_usuarias(almacen)
+    archivos = dict(store.attrs.get("archivos", {}))
+    hashes = [ hash_archivo(file_) for file_ in every_csv_file ]
+    periodos = [ tuple(archivos[hash_]) if hash_ in archivos else None for hash_ in hashes ]
+
+    nuevos = { hash_: file_ for hash_, file_ in zip(hashes, every_csv_file) if hash_ not in archivos }
+    if not nuevos:
+        return store, periodos
+
+    summaries = {}
+    for hash_, report in zip(nuevos, _leer_meses_top_usuarias(list(nuevos.values()), motor=motor, executor=executor)):
+        periodo = (int(report.attrs["AÑO"]), int(report.attrs["MES"]))
+        periodos = [ periodo if hash_recibido == hash_ else anterior for hash_recibido, anterior in zip(hashes, periodos) ]
+        store = store[ (store["AÑO"] != periodo[0]) | (store["MES"] != periodo[1]) ]
+        archivos = { hash_anterior: mes for hash_anterior, mes in archivos.items() if mes != list(periodo) }
+        archivos[hash_] = list(periodo)
+        summaries[periodo] = _resumir_mes_top_usuarias(report)
+
+    store = pd.concat( [store] + list(summaries.values()) ) if store.shape[0] else pd.concat(summaries.values())
+    store = store.sort_values(["AÑO", "MES", "ID_UNICO_ANDREA"]).reset_index(drop=True)
+    store.attrs["archivos"] = archivos
+    _escribir_frame(store, almacen)
+    return store, periodos
+
+# Calcula las hojas TOP_NIVEL_* sobre una ventana de meses del almacén: meses=[(año, mes), ...] en el orden de las
+# columnas, o los ultimos_meses más recientes (por defecto todos los meses del almacén).
+@con_perfilado("cálculo")
+def calcular_top_usuarias(store, meses=None, ultimos_meses=None, top=10) -> tuple[list, list]:
+    if meses is None:
+        meses = sorted( set( zip(store["AÑO"].astype(int), store["MES"].astype(int)) ) )
+        if ultimos_meses is not None:
+            meses = meses[-ultimos_meses:]
+    meses = [ (int(año), int(mes)) for año, mes in meses ]
+
+    numeros_mes = [ mes for _, mes in meses ]
+    months = [ str(mes) if numeros_mes.count(mes) == 1 else f"{mes}_{año}" for año, mes in meses ]
+
+    periodos = store["AÑO"].to_numpy(dtype=np.int64) * 100 + store["MES"].to_numpy(dtype=np.int64)
+    en_ventana = np.isin(periodos, [ año * 100 + mes for año, mes in meses ])
+    window = store[en_ventana]
+    window_periods = periodos[en_ventana]
+    totals = window.groupby( "ID_UNICO_ANDREA" )[["CUOTA_SUMA", "NIVEL_SUMA", "FILAS"]].sum()
+
+    users_selling_details = pd.DataFrame(index=totals.index)
+    for (año, mes), month in zip(meses, months):
+        monthly = window[ window_periods == año * 100 + mes ].groupby( "ID_UNICO_ANDREA" )["VENTA_NETA"].sum()
+        users_selling_details[f"VENTA_NETA_MES_{month}"] = monthly.reindex(totals.index, fill_value=0).astype(np.float64)
+    users_selling_details["CUOTA_OBJETIVO"] = totals["CUOTA_SUMA"] / totals["FILAS"]
+    users_selling_details["NIVEL"] = totals["NIVEL_SUMA"] / totals["FILAS"]
+
+    reglas_cuota = [ (f"SUPERO_CUOTA_OBJETIVO_MES_{month}_check", [(f"VENTA_NETA_MES_{month}", ">=", Columna("CUOTA_OBJETIVO"))], (1, 0)) for month in months ]
+    agregar_columnas_derivadas(users_selling_details, reglas_cuota)
+
     users_selling_details.loc[:,"VENTA_TOT"] = users_selling_details[[f"VENTA_NETA_MES_{month}" for month in months]].sum(axis=1)
-    
+
     users_selling_details.loc[:,"TOT_PARTICIPATION"] = users_selling_details[ [f"SUPERO_CUOTA_OBJETIVO_MES_{month}_check" for month in months] ].sum( axis=1 )
-    
-    users_selling_details.loc[:,"(Promedio) PORCENTAJE_DE_CUMPLIMIENTO"] = 100 * users_selling_details["VENTA_TOT"] / (3*users_selling_details["CUOTA_OBJETIVO"])
-    
-    wb = Workbook()
-    
+
+    users_selling_details.loc[:,"(Promedio) PORCENTAJE_DE_CUMPLIMIENTO"] = 100 * users_selling_details["VENTA_TOT"] / (len(months)*users_selling_details["CUOTA_OBJETIVO"])
+
+    sheets = []
     levels = users_selling_details["NIVEL"].unique()
     for nivel in sorted(levels):
-        ws_level = wb.create_sheet(f"TOP_NIVEL_{int(nivel)}")
-        top_users = users_selling_details[ (users_selling_details["NIVEL"]==nivel) & (users_selling_details["TOT_PARTICIPATION"]>0) & (users_selling_details["VENTA_TOT"]>0) ].sort_values(by=["TOT_PARTICIPATION","(Promedio) PORCENTAJE_DE_CUMPLIMIENTO"], ascending=False).reset_index().head(10)
-        for row_idx, row in enumerate( dataframe_to_rows( top_users, header=True, index=False ) ):
-            for column_idx, value in enumerate(row):
-                ws_level.cell(row = row_idx + 1, column=column_idx + 1, value=value)     
-
-    wb.remove(wb['Sheet'])
-    wb.save(f'Top_users_months_{"_".join(months)}.xlsx')
-    
+        top_users = users_selling_details[ (users_selling_details["NIVEL"]==nivel) & (users_selling_details["TOT_PARTICIPATION"]>0) & (users_selling_details["VENTA_TOT"]>0) ].sort_values(by=["TOT_PARTICIPATION","(Promedio) PORCENTAJE_DE_CUMPLIMIENTO"], ascending=False).reset_index().head(top)
+        sheets.append( (f"TOP_NIVEL_{int(nivel)}", top_users) )
+
+    return sheets, months
+
+# Genera el Excel de top usuarias a partir del almacén, sin volver a leer los CSV mensuales
+def top_usuarias_desde_almacen(almacen=None, meses=None, ultimos_meses=None, top=10, estilo_encabezado=False):
+    sheets, months = calcular_top_usuarias(cargar_almacen_top_usuarias(almacen), meses=meses, ultimos_meses=ultimos_meses, top=top)
+    exportar_excel(sheets, f'Top_users_months_{"_".join(months)}.xlsx', estilo_encabezado=estilo_encabezado)
+    return None
+
+# Con un executor de crear_executor los archivos mensuales se leen en paralelo. Con almacen, los meses leídos
+# también se agregan al almacén para las siguientes corridas (ver top_usuarias_desde_almacen).
+@con_perfilado("top usuarias")
+def top_usuarias(every_csv_file, motor="c", executor=None, estilo_encabezado=False, top=10, almacen=None):
+    start = time()
+
+    # Con dos archivos del mismo mes cuenta el último, igual que en el almacén
+    if almacen is not None:
+        store, periodos = _actualizar_almacen_top_usuarias(every_csv_file, almacen=almacen, motor=motor, executor=executor)
+        periodos = list(dict.fromkeys(periodos))
+    else:
+        summaries = {}
+        for report in _leer_meses_top_usuarias(every_csv_file, motor=motor, executor=executor):
+            summaries[(int(report.attrs["AÑO"]), int(report.attrs["MES"]))] = _resumir_mes_top_usuarias(report)
+        store = pd.concat(summaries.values())
+        periodos = list(summaries)
+
+    sheets, months = calcular_top_usuarias(store, meses=periodos, top=top)
+    exportar_excel(sheets, f'Top_users_months_{"_".join(months)}.xlsx', estilo_encabezado=estilo_encabezado)
+
     end = time()
     duration = end-start
     print(F"\nElapsed Time {duration//60} min {duration%60:0.2f} sec")
 
-    return None
\ No newline at end of file
+    return None
+
+## Línea de comandos
+
+# Ejecuta el bloque en directorio (para que los archivos de salida de procesar_datos y top_usuarias queden ahí)
+@contextlib.contextmanager
+def _en_directorio(directorio):
+    if directorio is None:
+        yield
+        return
+    anterior = os.getcwd()
+    Path(directorio).mkdir(parents=True, exist_ok=True)
+    os.chdir(directorio)
+    try:
+        yield
+    finally:
+        os.chdir(anterior)
+
+# Activa EXPORTACION_EN_SEGUNDO_PLANO solo mientras corre el bloque (un comando de lote no la deja prendida para los
+# siguientes); con activa=False se conserva el valor que ya tenía
+@contextlib.contextmanager
+def _exportacion_en_segundo_plano(activa):
+    global EXPORTACION_EN_SEGUNDO_PLANO
+    anterior = EXPORTACION_EN_SEGUNDO_PLANO
+    EXPORTACION_EN_SEGUNDO_PLANO = anterior or activa
+    try:
+        yield
+    finally:
+        EXPORTACION_EN_SEGUNDO_PLANO = anterior
+
+def _parser_comandos():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="data_preprocessing", description="Procesamiento de los reportes de Andrea Premia")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    procesar = comandos.add_parser("procesar", help="procesar_datos sobre los tres reportes y guarda los reportes procesados")
+    procesar.add_argument("reporte_general_de_usuarios")
+    procesar.add_argument("reporte_de_metas_y_resultados")
+    procesar.add_argument("reporte_SL")
+    procesar.add_argument("--sin-filtro", action="store_true", help="no filtra las usuarias Estrella/Mayorista")
+    procesar.add_argument("--formato", default="csv", choices=[ extension[1:] for extension in EXTENSIONES_EXPORTACION if extension != ".xlsx" ])
+    procesar.add_argument("--motor", default="c", choices=MOTORES_LECTURA)
+    procesar.add_argument("--tamano-bloque", type=int, default=None)
+    procesar.add_argument("--usar-cache", action="store_true")
+    procesar.add_argument("--categoricas", action="store_true")
+    procesar.add_argument("--paralelo", action="store_true")
+
+    top = comandos.add_parser("top-usuarias", help="top_usuarias sobre los reportes mensuales de metas y resultados")
+    top.add_argument("archivos", nargs="+")
+    top.add_argument("--top", type=int, default=10)
+    top.add_argument("--almacen", default=None)
+    top.add_argument("--motor", default="c", choices=MOTORES_LECTURA)
+    top.add_argument("--estilo-encabezado", action="store_true")
+    top.add_argument("--paralelo", action="store_true", help="lee los archivos mensuales en paralelo")
+
+    lote = comandos.add_parser("lote", help="ejecuta los comandos de un archivo (uno por línea) en este mismo proceso")
+    lote.add_argument("archivo")
+
+    campanas = comandos.add_parser("campanas", help="procesar_lote sobre un manifiesto (.csv o .json) de campañas")
+    campanas.add_argument("manifiesto")
+    campanas.add_argument("--sin-filtro", action="store_true", help="no filtra las usuarias Estrella/Mayorista")
+    campanas.add_argument("--formato", default="csv", choices=[ extension[1:] for extension in EXTENSIONES_EXPORTACION if extension != ".xlsx" ])
+    campanas.add_argument("--motor", default="c", choices=MOTORES_LECTURA)
+    campanas.add_argument("--tamano-bloque", type=int, default=None)
+    campanas.add_argument("--usar-cache", action="store_true")
+    campanas.add_argument("--categoricas", action="store_true")
+    campanas.add_argument("--max-workers", type=int, default=None)
+
+    for subparser in (procesar, top, lote, campanas):
+        subparser.add_argument("--salida", default=None, help="directorio donde se guardan los resultados")
+        subparser.add_argument("--segundo-plano", action="store_true", help="exporta en segundo plano (ver EXPORTACION_EN_SEGUNDO_PLANO)")
+    return parser
+
+# Ejecuta un comando ya interpretado; las rutas de entrada se resuelven antes de cambiar al directorio de salida.
+# El executor solo se usa en los comandos con --paralelo.
+def _ejecutar_comando(args, executor=None) -> int:
+    with _exportacion_en_segundo_plano(args.segundo_plano):
+        return _correr_comando(args, executor)
+
+def _correr_comando(args, executor=None) -> int:
+    if args.comando == "lote":
+        return _ejecutar_lote(args.archivo, args.salida, executor)
+    if args.comando == "campanas":
+        resultados = procesar_lote(args.manifiesto, filtrar_default=not args.sin_filtro, guardar=args.formato, salida=args.salida, conservar_tablas=False,
+                                   usar_cache=args.usar_cache, motor=args.motor, tamano_bloque=args.tamano_bloque, categoricas=args.categoricas,
+                                   max_workers=args.max_workers, executor=executor)
+        mostrar_tabla(resumen_lote(resultados))
+        return 1 if any(resultado["error"] is not None for resultado in resultados) else 0
+    executor = executor if args.paralelo else None
+
+    if args.comando == "procesar":
+        rutas = [ Path(ruta).resolve() for ruta in (args.reporte_general_de_usuarios, args.reporte_de_metas_y_resultados, args.reporte_SL) ]
+        with _en_directorio(args.salida):
+            procesar_datos(*rutas, filtrar_default=not args.sin_filtro, guardar=args.formato, usar_cache=args.usar_cache, motor=args.motor,
+                           tamano_bloque=args.tamano_bloque, categoricas=args.categoricas, paralelo=args.paralelo, executor=executor)
+    else:
+        archivos = [ Path(archivo).resolve() for archivo in args.archivos ]
+        almacen = None if args.almacen is None else Path(args.almacen).resolve()
+        with _en_directorio(args.salida):
+            top_usuarias(archivos, motor=args.motor, executor=executor, estilo_encabezado=args.estilo_encabezado, top=args.top, almacen=almacen)
+    return 0
+
+# Cada línea del archivo es un comando como los de la línea de comandos (las vacías y las que empiezan con # se
+# ignoran). Un comando que falla se reporta y el lote sigue con el siguiente.
+def _ejecutar_lote(archivo, salida=None, executor=None) -> int:
+    import shlex
+    import traceback
+
+    parser = _parser_comandos()
+    codigo = 0
+    for numero, linea in enumerate(Path(archivo).read_text(encoding="utf-8").splitlines(), start=1):
+        if not linea.strip() or linea.lstrip().startswith("#"):
+            continue
+        try:
+            args = parser.parse_args(shlex.split(linea))
+            if args.salida is None:
+                args.salida = salida
+            codigo = max(codigo, _ejecutar_comando(args, executor))
+        except (Exception, SystemExit):
+            print(f"Falló la línea {numero} de {archivo}: {linea}")
+            traceback.print_exc()
+            codigo = 1
+    return codigo
+
+# Punto de entrada de la línea de comandos:
+#   python data_preprocessing.py procesar Reportegeneraldeusuarios.csv Reportedemetasyresultados.csv v_sl.csv --formato parquet
+#   python data_preprocessing.py top-usuarias metas_enero.csv metas_febrero.csv --almacen almacen_top_usuarias.feather
+#   python data_preprocessing.py lote comandos.txt --salida resultados
+#   python data_preprocessing.py campanas manifiesto.csv --formato parquet --salida resultados
+# Con lote todos los comandos corren en el mismo proceso, así las importaciones, los esquemas compilados y el pool de
+# procesos (con --paralelo) se cargan una sola vez.
+def main(argv=None) -> int:
+    args = _parser_comandos().parse_args(argv)
+    # el pool no arranca procesos hasta que un comando con --paralelo lo usa
+    executor = crear_executor() if (args.comando == "lote") or (getattr(args, "paralelo", False) and args.comando == "top-usuarias") else None
+    try:
+        codigo = _ejecutar_comando(args, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    for destino, error in esperar_exportaciones():
+        print(f"No se pudo exportar {destino}: {error!r}")
+        codigo = 1
+    return codigo
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(main())
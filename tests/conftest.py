@@ -0,0 +1,13 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+# Reportes sintéticos chicos (RGU, tres meses de RMR y SL) compartidos por las pruebas de lectura y caché
+@pytest.fixture(scope="session")
+def datos(tmp_path_factory):
+    from datos_sinteticos import generar_datos
+    return generar_datos(300, tmp_path_factory.mktemp("datos"), semilla=1)
@@ -0,0 +1,40 @@
+# Caché de los procesar_*: llave con parámetros posicionales y esquema, y nulos restaurados al leer la entrada.
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_preprocessing as dp
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(dp, "CACHE_DIR", tmp_path / "cache")
+    return tmp_path / "cache"
+
+def _entradas(cache):
+    return sorted(archivo.name for archivo in cache.iterdir() if archivo.suffix in (".feather", ".pkl"))
+
+def test_posicionales_y_con_nombre_comparten_entrada(datos, cache):
+    dp.procesar_shipping_list(datos["SL"], "pyarrow", usar_cache=True)
+    entradas = _entradas(cache)
+    dp.procesar_shipping_list(datos["SL"], motor="pyarrow", usar_cache=True)
+    assert _entradas(cache) == entradas
+    dp.procesar_shipping_list(datos["SL"], "c", usar_cache=True)
+    assert len(_entradas(cache)) == len(entradas) + 1
+
+def test_cambio_de_esquema_invalida_la_entrada(datos, cache, monkeypatch):
+    dp.procesar_reporte_metas_y_resultados(datos["RMR"][0], usar_cache=True)
+    assert len(_entradas(cache)) == 1
+    monkeypatch.setitem(dp.NA_VALUES_REPORTES, "RMR", dp.NA_VALUES_REPORTES.get("RMR", []) + ["__otro_nulo__"])
+    dp.procesar_reporte_metas_y_resultados(datos["RMR"][0], usar_cache=True)
+    assert len(_entradas(cache)) == 2
+
+def test_entrada_conserva_nulos_como_nan(datos, cache):
+    directo = dp.procesar_reporte_general_de_usuarios(datos["RGU"])
+    dp.procesar_reporte_general_de_usuarios(datos["RGU"], usar_cache=True)
+    guardado = dp.procesar_reporte_general_de_usuarios(datos["RGU"], usar_cache=True)
+    objetos = directo.columns[directo.dtypes == object]
+    assert any(directo[columna].isna().any() for columna in objetos)
+    for columna in objetos:
+        nulos = guardado[columna][guardado[columna].isna()]
+        assert all(isinstance(valor, float) and np.isnan(valor) for valor in nulos)
+        pd.testing.assert_series_equal(guardado[columna].isin([np.nan]), directo[columna].isin([np.nan]))
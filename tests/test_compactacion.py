@@ -0,0 +1,49 @@
+# Reportes con categoricas=True: mismas tablas que con texto y float64, y categorías sin uso fuera tras los filtros.
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_preprocessing as dp
+
+IGUALES = {"check_dtype": False, "check_index_type": False, "check_column_type": False, "check_categorical": False}
+
+@pytest.fixture(scope="module")
+def RGU(datos):
+    return dp.procesar_reporte_general_de_usuarios(datos["RGU"]), dp.procesar_reporte_general_de_usuarios(datos["RGU"], categoricas=True)
+
+def test_tabla_pivote_con_float32(RGU):
+    texto, compacto = RGU
+    assert compacto["NIVEL"].dtype == np.float32
+    for columnas in (None, "PERFIL"):
+        esperado = dp.tabla_pivote(texto, "ESTADO", "NIVEL", columnas)
+        pd.testing.assert_frame_equal(dp.tabla_pivote(compacto, "ESTADO", "NIVEL", columnas), esperado, **IGUALES)
+
+@pytest.mark.parametrize("aggfunc", ["sum", "count", "nunique"])
+def test_categorias_compactadas_como_texto(RGU, aggfunc):
+    texto, compacto = RGU
+    filtro = ("PERFIL", "=", "Estrella"), ("PERFIL", "=", "Mayorista")
+    texto, compacto = dp.filtrar_O(texto, *filtro), dp.filtrar_O(compacto, *filtro)
+    assert len(compacto["PERFIL"].cat.categories) > 2
+    esperado = dp.tabla_pivote(texto, "ESTADO", "NIVEL", "PERFIL", aggfunc=aggfunc)
+    pd.testing.assert_frame_equal(dp.tabla_pivote(compacto, "ESTADO", "NIVEL", "PERFIL", aggfunc=aggfunc), esperado, **IGUALES)
+
+@pytest.mark.parametrize("categoricas", [False, True])
+def test_generacion_conserva_sus_categorias(RGU, categoricas):
+    reporte = RGU[categoricas]
+    reporte = reporte[reporte["generación"] != "Baby boomer"]
+    for columnas in (None, "PERFIL"):
+        tabla = dp.tabla_pivote(reporte, "generación", "NIVEL", columnas)
+        assert "Baby boomer" in tabla.index
+        esperado = pd.pivot_table(reporte.astype({"PERFIL": object}), index="generación", values="NIVEL", columns=columnas, aggfunc="sum", margins=True, margins_name="Total", observed=False)
+        pd.testing.assert_frame_equal(tabla, esperado, **IGUALES)
+    tabla = dp.tabla_pivote(reporte, "generación", None, "PERFIL")
+    assert "Baby boomer" in tabla.index
+
+def test_procesar_datos_quita_categorias_filtradas(datos):
+    RGU, RMR, SL = dp.procesar_datos(datos["RGU"], datos["RMR"][0], datos["SL"], categoricas=True)
+    for reporte in (RGU, RMR):
+        assert set(reporte["PERFIL"].cat.categories) == {"Estrella", "Mayorista"}
+    for reporte in (RGU, RMR, SL):
+        for columna in reporte.columns[reporte.dtypes == "category"].drop("generación", errors="ignore"):
+            assert (reporte[columna].value_counts() > 0).all()
+    assert len(RGU["generación"].cat.categories) == 4
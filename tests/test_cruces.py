@@ -0,0 +1,119 @@
+# Cruces con el índice de llaves (cruzar, filtrar_cruzado, left_compare) contra merge e isin de pandas.
+import gc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_preprocessing as dp
+
+LLAVE = dp.LLAVE_USUARIA
+COMO = {"ambas": "inner", "izquierda": "left", "derecha": "right", "izq-der": "outer"}
+
+def _frames(rng, nulos):
+    llaves = np.array(["a", "b", "c", "d", "e"] + ([None, np.nan] if nulos else []), dtype=object)
+    izquierda = pd.DataFrame({
+        LLAVE: rng.choice(llaves, int(rng.integers(0, 12))),
+    })
+    izquierda["X"] = rng.integers(0, 9, izquierda.shape[0])
+    izquierda["Z"] = rng.choice(np.array(["p", "q"], dtype=object), izquierda.shape[0])
+    derecha = pd.DataFrame({LLAVE: rng.choice(llaves, int(rng.integers(0, 12)))})
+    derecha["Y"] = rng.random(derecha.shape[0])
+    derecha["Z"] = rng.choice(np.array(["r", "s"], dtype=object), derecha.shape[0])
+    derecha["OTRA"] = rng.choice(llaves, derecha.shape[0])
+    return izquierda, derecha
+
+@pytest.fixture(autouse=True)
+def indice_limpio():
+    dp.limpiar_indices_llaves()
+    yield
+    dp.limpiar_indices_llaves()
+
+# Orden de filas, llaves repetidas, llaves nulas (None y NaN) y sufijos de columnas repetidas, como merge
+@pytest.mark.parametrize("semilla", range(4))
+@pytest.mark.parametrize("metodo_cruce", list(COMO))
+@pytest.mark.parametrize("nulos", [False, True])
+@pytest.mark.parametrize("sufijos", [None, ("_izq", "_der")])
+@pytest.mark.parametrize("con_indice", [False, True])
+def test_cruzar_igual_a_merge(semilla, metodo_cruce, nulos, sufijos, con_indice):
+    rng = np.random.default_rng(semilla)
+    indice = dp.indice_llaves() if con_indice else None
+    for _ in range(25):
+        izquierda, derecha = _frames(rng, nulos)
+        for columna_derecha in (LLAVE, "OTRA"):
+            obtenido = dp.cruzar(izquierda, derecha, LLAVE, columna_derecha, sufijos=sufijos, metodo_cruce=metodo_cruce, indice=indice)
+            opciones = {} if sufijos is None else {"suffixes": sufijos}
+            esperado = izquierda.merge(derecha, left_on=LLAVE, right_on=columna_derecha, how=COMO[metodo_cruce], **opciones)
+            pd.testing.assert_frame_equal(obtenido.reset_index(drop=True), esperado.reset_index(drop=True))
+
+@pytest.mark.parametrize("semilla", range(4))
+@pytest.mark.parametrize("nulos", [False, True])
+@pytest.mark.parametrize("con_indice", [False, True])
+def test_filtrar_cruzado_igual_a_isin(semilla, nulos, con_indice):
+    rng = np.random.default_rng(semilla)
+    indice = dp.indice_llaves() if con_indice else None
+    for _ in range(25):
+        izquierda, derecha = _frames(rng, nulos)
+        for columna_derecha in (LLAVE, "OTRA"):
+            obtenido = dp.filtrar_cruzado(izquierda, LLAVE, derecha, columna_derecha, indice=indice)
+            pd.testing.assert_frame_equal(obtenido, izquierda[izquierda[LLAVE].isin(derecha[columna_derecha])])
+
+@pytest.mark.parametrize("semilla", range(4))
+@pytest.mark.parametrize("con_indice", [False, True])
+def test_left_compare_igual_a_merge(semilla, con_indice):
+    rng = np.random.default_rng(semilla)
+    indice = dp.indice_llaves() if con_indice else None
+    for _ in range(25):
+        izquierda, derecha = _frames(rng, False)
+        izquierda = izquierda.drop_duplicates(LLAVE)
+        derecha = derecha.drop_duplicates(LLAVE)
+        obtenido = dp.left_compare(izquierda, LLAVE, derecha, LLAVE, indicator_name="Participa", indice=indice)
+        esperado = pd.merge(pd.DataFrame(izquierda[LLAVE].unique(), columns=[LLAVE]), derecha[LLAVE], on=LLAVE, how="left", indicator="Participa")
+        esperado["Participa"] = esperado["Participa"].map({"left_only": False, "both": True})
+        pd.testing.assert_frame_equal(obtenido, esperado.set_index(LLAVE))
+
+# Sin índice cada cruce ve el contenido actual de las columnas
+def test_escritura_en_el_mismo_arreglo():
+    izquierda = pd.DataFrame({LLAVE: ["a", "b", "c"], "X": [1, 2, 3]})
+    derecha = pd.DataFrame({LLAVE: ["a", "z"]})
+    assert dp.filtrar_cruzado(izquierda, LLAVE, derecha).shape[0] == 1
+    derecha.loc[1, LLAVE] = "b"
+    assert dp.filtrar_cruzado(izquierda, LLAVE, derecha)[LLAVE].tolist() == ["a", "b"]
+    izquierda.loc[2, LLAVE] = "a"
+    assert dp.cruzar(izquierda, derecha, LLAVE, LLAVE)[LLAVE].tolist() == ["a", "b", "a"]
+    assert len(dp.indice_llaves()) == 0
+
+# Con índice los códigos se reutilizan hasta que la columna se reasigna o se olvidan explícitamente
+def test_indice_reutiliza_codigos_hasta_olvidarlos():
+    indice = dp.indice_llaves()
+    izquierda = pd.DataFrame({LLAVE: ["a", "b", "c"], "X": [1, 2, 3]})
+    derecha = pd.DataFrame({LLAVE: ["a", "z"]})
+    codigos = indice.codigos(izquierda, LLAVE)
+    assert indice.codigos(izquierda, LLAVE) is codigos
+    assert dp.filtrar_cruzado(izquierda, LLAVE, derecha, indice=indice).shape[0] == 1
+    derecha[LLAVE] = ["a", "b"]
+    assert dp.filtrar_cruzado(izquierda, LLAVE, derecha, indice=indice)[LLAVE].tolist() == ["a", "b"]
+    izquierda.loc[2, LLAVE] = "a"
+    indice.olvidar(izquierda)
+    assert indice.codigos(izquierda, LLAVE) is not codigos
+    assert dp.cruzar(izquierda, derecha, LLAVE, LLAVE, indice=indice)[LLAVE].tolist() == ["a", "b", "a"]
+    indice.olvidar()
+    assert not indice._codigos and len(indice) == 4
+
+def test_indice_compartido_se_reinicia():
+    izquierda = pd.DataFrame({LLAVE: ["a", "b"]})
+    derecha = pd.DataFrame({LLAVE: ["b", "c"]})
+    dp.filtrar_cruzado(izquierda, LLAVE, derecha, indice=dp.indice_llaves())
+    indice = dp.indice_llaves()
+    assert len(indice) == 3
+    del izquierda, derecha
+    gc.collect()
+    assert len(dp.indice_llaves()) == 0
+
+def test_indice_compartido_acotado(monkeypatch):
+    monkeypatch.setattr(dp, "MAX_LLAVES_INDICE", 4)
+    izquierda = pd.DataFrame({LLAVE: ["a", "b", "c"]})
+    derecha = pd.DataFrame({LLAVE: ["c", "d", "e"]})
+    assert dp.filtrar_cruzado(izquierda, LLAVE, derecha, indice=dp.indice_llaves())[LLAVE].tolist() == ["c"]
+    assert len(dp.indice_llaves()) == 0
+    assert dp.filtrar_cruzado(izquierda, LLAVE, derecha, indice=dp.indice_llaves())[LLAVE].tolist() == ["c"]
@@ -0,0 +1,36 @@
+# Esquemas de lectura: lo que se aplica sobre el mapeo compilado y dónde se guarda el mapeo compilado.
+import pytest
+
+import data_preprocessing as dp
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(dp, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(dp, "_MAPEOS", {})
+    return tmp_path / "cache"
+
+def test_formatos_fecha_se_aplican_con_el_mapeo_compilado(datos, cache):
+    dp.cargar_mapeos()
+    assert dp.procesar_reporte_general_de_usuarios(datos["RGU"])["FECHA_DE_NACIMIENTO"].dtype.kind == "M"
+    with pytest.MonkeyPatch.context() as parche:
+        parche.setitem(dp.FORMATOS_FECHA, "RGU", {"FECHA_DE_NACIMIENTO": "%d/%m/%Y"})
+        assert dp.esquema_reporte("RGU")["formatos_fecha"] == {"FECHA_DE_NACIMIENTO": "%d/%m/%Y"}
+        with pytest.raises(ValueError):
+            dp.procesar_reporte_general_de_usuarios(datos["RGU"])
+
+def test_limpieza_y_nulos_se_aplican_con_el_mapeo_compilado(cache, monkeypatch):
+    dp.cargar_mapeos()
+    monkeypatch.setitem(dp.LIMPIEZA_COLUMNAS, "RGU", {"ESTADO": "#"})
+    monkeypatch.setitem(dp.NA_VALUES_REPORTES, "RGU", ["-"])
+    esquema = dp.esquema_reporte("RGU")
+    assert esquema["limpieza"] == {"ESTADO": "#"}
+    assert esquema["dtype"]["ESTADO"] == "object"
+    assert esquema["na_values"][0] == "-"
+
+def test_sin_usar_cache_no_se_crea_la_carpeta(datos, cache):
+    dp.procesar_reporte_general_de_usuarios(datos["RGU"])
+    assert not cache.exists()
+    cache.mkdir()
+    dp._MAPEOS.clear()
+    dp.cargar_mapeos()
+    assert [ archivo.name for archivo in cache.iterdir() ] == [f"mapeo_{dp.hash_archivo(dp.ARCHIVO_MAPEO)}_{dp.VERSION_PROCESAMIENTO}.json"]
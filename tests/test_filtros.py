@@ -0,0 +1,31 @@
+# filtrar_Y / filtrar_O sobre un FrameIndexado contra los mismos filtros sobre el dataframe.
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_preprocessing as dp
+
+@pytest.fixture(scope="module")
+def reporte():
+    rng = np.random.default_rng(3)
+    return pd.DataFrame({
+        "PERFIL": rng.choice(np.array(["Estrella", "Mayorista", "Invitada", None], dtype=object), 200),
+        "NIVEL": rng.choice([1.0, 2.0, 3.0, np.nan], 200),
+        "FECHA": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 60, 200), unit="D"),
+    })
+
+CONDICIONES = [
+    (),
+    (("PERFIL", "~", "Estrella"),),
+    (("PERFIL", "=", "Estrella"),),
+    (("PERFIL", "=", "Estrella"), ("PERFIL", "=", "Mayorista")),
+    (("NIVEL", ">=", 2), ("FECHA", "<", "2025-01-20")),
+    (("PERFIL", "=", "Invitada"), ("NIVEL", "notnull")),
+    (("PERFIL", "=", "Nadie"), ("NIVEL", "<>", 1)),
+]
+
+@pytest.mark.parametrize("condiciones", CONDICIONES)
+@pytest.mark.parametrize("filtrar", [dp.filtrar_Y, dp.filtrar_O])
+def test_frame_indexado_igual_al_dataframe(reporte, condiciones, filtrar):
+    esperado = filtrar(reporte, *condiciones)
+    pd.testing.assert_frame_equal(filtrar(dp.FrameIndexado(reporte), *condiciones), esperado)
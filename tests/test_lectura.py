@@ -0,0 +1,56 @@
+# Lectura de CSV: encoding detectado con una muestra, relectura en latin-1 y validación de tipos.
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_preprocessing as dp
+
+ENCABEZADO = ["AÑO", "DESCRIPCIÓN", "MONTO"]
+
+# Encabezado y primeras filas en UTF-8 válido; la fila final trae un byte latin-1 fuera de la muestra
+@pytest.fixture
+def mixto(tmp_path, monkeypatch):
+    monkeypatch.setattr(dp, "BYTES_MUESTRA_ENCODING", 64)
+    filas = [ f"{2000 + fila},texto {fila},{fila}.5" for fila in range(40) ] + ["2040,cami\xf3n,40.5"]
+    archivo = tmp_path / "mixto.csv"
+    archivo.write_bytes((",".join(ENCABEZADO) + "\n").encode("utf-8") + "\n".join(filas).encode("latin-1") + b"\n")
+    return archivo
+
+def test_relectura_latin1_conserva_el_encabezado(mixto):
+    dataframe = dp.leer_csv(mixto, usecols=["DESCRIPCIÓN", "MONTO"], dtype={"MONTO": np.float64})
+    assert list(dataframe.columns) == ["DESCRIPCIÓN", "MONTO"]
+    assert dataframe.shape[0] == 41
+    assert dataframe["DESCRIPCIÓN"].iloc[-1] == "camión"
+    assert dp.detectar_encoding(mixto) == "latin-1"
+
+def test_validate_dtypes_falla_sin_columna_esperada():
+    dtypes = pd.DataFrame({"A": [1.0], "B": ["x"]}).dtypes
+    assert dp.validate_dtypes(dtypes, {"A": np.float64, "B": np.object_})[0]
+    assert not dp.validate_dtypes(dtypes, {"A": np.float64, "C": np.float64})[0]
+    assert not dp.validate_dtypes(dtypes, {"A": np.float64}, ["FECHA"])[0]
+
+# Archivo más grande que el búfer del parser, así el byte inválido aparece después de entregar algunos bloques
+@pytest.fixture
+def mixto_largo(tmp_path, monkeypatch):
+    monkeypatch.setattr(dp, "BYTES_MUESTRA_ENCODING", 64)
+    filas = [ f"{fila},texto {fila},{fila}.5" for fila in range(60_000) ] + ["60000,cami\xf3n,60000.5"]
+    archivo = tmp_path / "mixto_largo.csv"
+    archivo.write_bytes((",".join(ENCABEZADO) + "\n").encode("utf-8") + "\n".join(filas).encode("latin-1") + b"\n")
+    return archivo
+
+def test_bloques_continuan_en_latin1_desde_la_fila_leida(mixto_largo, monkeypatch):
+    lecturas = []
+    read_csv = pd.read_csv
+    def registrar(*args, **kwargs):
+        lecturas.append(kwargs)
+        return read_csv(*args, **kwargs)
+    with monkeypatch.context() as parche:
+        parche.setattr(dp.pd, "read_csv", registrar)
+        bloques = list(dp.leer_csv_en_bloques(mixto_largo, 1000, usecols=["AÑO", "DESCRIPCIÓN"]))
+
+    assert [ lectura["encoding"] for lectura in lecturas ] == ["utf-8", "latin-1"]
+    assert isinstance(lecturas[1]["skiprows"], int) and lecturas[1]["skiprows"] > 1
+    leido = pd.concat(bloques)
+    esperado = pd.read_csv(mixto_largo, encoding="latin-1", header=0, names=ENCABEZADO, usecols=["AÑO", "DESCRIPCIÓN"])
+    pd.testing.assert_frame_equal(leido, esperado)
+    assert leido["DESCRIPCIÓN"].iloc[-1] == "camión"
@@ -0,0 +1,26 @@
+# Comandos de lote: --segundo-plano solo aplica al comando que lo lleva.
+import data_preprocessing as dp
+
+def test_segundo_plano_solo_durante_su_comando(tmp_path, monkeypatch):
+    vistos = []
+    monkeypatch.setattr(dp, "_correr_comando", lambda args, executor=None: vistos.append((args.archivos[0], dp.EXPORTACION_EN_SEGUNDO_PLANO)) or 0)
+    lote = tmp_path / "comandos.txt"
+    lote.write_text("top-usuarias a.csv --segundo-plano\ntop-usuarias b.csv\n", encoding="utf-8")
+    assert dp._ejecutar_lote(lote) == 0
+    assert vistos == [("a.csv", True), ("b.csv", False)]
+    assert dp.EXPORTACION_EN_SEGUNDO_PLANO is False
+
+def test_segundo_plano_del_lote_aplica_a_sus_lineas(tmp_path, monkeypatch):
+    vistos = []
+    correr = dp._correr_comando
+    def falso(args, executor=None):
+        if args.comando == "lote":
+            return correr(args, executor)
+        vistos.append((args.archivos[0], dp.EXPORTACION_EN_SEGUNDO_PLANO))
+        return 0
+    monkeypatch.setattr(dp, "_correr_comando", falso)
+    lote = tmp_path / "comandos.txt"
+    lote.write_text("top-usuarias a.csv\ntop-usuarias b.csv\n", encoding="utf-8")
+    assert dp.main(["lote", str(lote), "--segundo-plano"]) == 0
+    assert vistos == [("a.csv", True), ("b.csv", True)]
+    assert dp.EXPORTACION_EN_SEGUNDO_PLANO is False
@@ -0,0 +1,24 @@
+# procesar_datos en paralelo (los reportes regresan del pool como Arrow IPC) contra el procesamiento secuencial.
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_preprocessing as dp
+
+@pytest.fixture(scope="module")
+def executor():
+    executor = dp.crear_executor(max_workers=2)
+    yield executor
+    executor.shutdown()
+
+def test_paralelo_igual_a_secuencial(datos, executor):
+    secuencial = dp.procesar_datos(datos["RGU"], datos["RMR"][0], datos["SL"])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", FutureWarning)
+        paralelo = dp.procesar_datos(datos["RGU"], datos["RMR"][0], datos["SL"], executor=executor)
+        for esperado, obtenido in zip(secuencial, paralelo):
+            pd.testing.assert_frame_equal(obtenido.reset_index(drop=True), esperado.reset_index(drop=True))
+            for columna in esperado.columns[esperado.dtypes == object]:
+                assert obtenido[columna].isin([np.nan]).equals(esperado[columna].isin([np.nan]))
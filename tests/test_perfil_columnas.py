@@ -0,0 +1,57 @@
+# perfilar_columnas y los conteos que conteo_distintivo y porcentaje_valores_dist toman del perfil.
+import numpy as np
+import pandas as pd
+
+import data_preprocessing as dp
+
+def _frame():
+    rng = np.random.default_rng(0)
+    dataframe = pd.DataFrame({
+        "P": rng.choice(np.array(["x", "y", "z", None], dtype=object), 500),
+        "N": rng.integers(0, 5, 500).astype(np.float64),
+        "ID": np.char.add("A", np.arange(500).astype(str)).astype(object)
+    })
+    dataframe.loc[::7, "N"] = np.nan
+    return dataframe
+
+def test_perfil_igual_al_calculo_directo(capsys):
+    dataframe = _frame()
+    esperado = { columna: (dataframe[columna].nunique(), round(dataframe[columna].value_counts(1) * 100, 3)) for columna in dataframe }
+    perfil = dp.perfilar_columnas(dataframe)
+    for columna, (distintos, porcentajes) in esperado.items():
+        assert perfil.nulos[columna] == dataframe[columna].isna().sum()
+        assert dp.conteo_distintivo(dataframe, columna).iloc[0, 0] == distintos
+        pd.testing.assert_series_equal(dp.porcentaje_valores_dist(dataframe, columna, decimals=3), porcentajes.rename("Porcentaje %"))
+
+# Escribir en la columna después de perfilar no debe dar los conteos viejos
+def test_escritura_en_el_mismo_arreglo(capsys):
+    dataframe = pd.DataFrame({"P": ["x", "y", "y"]})
+    dp.perfilar_columnas(dataframe)
+    dataframe.loc[0, "P"] = "y"
+    assert dp.conteo_distintivo(dataframe, "P").iloc[0, 0] == 1
+    assert dp.porcentaje_valores_dist(dataframe, "P").tolist() == [100.0]
+
+def test_modo_aproximado():
+    dataframe = _frame()
+    perfil = dp.perfilar_columnas(dataframe, aproximado=True)
+    assert perfil.aproximadas == {"ID"}
+    assert perfil.conteos["ID"] is None
+    assert abs(perfil.distintos["ID"] - 500) <= 25
+    assert perfil.distintos["P"] == dataframe["P"].nunique()
+
+# Solo las columnas en que revisar la huella cuesta menos que volver a contar se toman del perfil
+def test_solo_alta_cardinalidad_se_toma_del_perfil():
+    dataframe = _frame()
+    perfil = dp.perfilar_columnas(dataframe)
+    assert not perfil.vigente(dataframe, "P") and not perfil.vigente(dataframe, "N")
+    assert perfil.vigente(dataframe, "ID")
+    compactado = dataframe.assign(P=dataframe["P"].astype("category"), ID=dataframe["ID"].astype("string[pyarrow]"))
+    assert not dp.perfilar_columnas(compactado).vigente(compactado, "ID")
+
+def test_alta_cardinalidad_detecta_escritura_en_el_mismo_arreglo(capsys):
+    dataframe = pd.DataFrame({"V": np.arange(100, dtype=np.float64)})
+    perfil = dp.perfilar_columnas(dataframe)
+    assert perfil.vigente(dataframe, "V")
+    dataframe.loc[0, "V"] = 1.0
+    assert not perfil.vigente(dataframe, "V")
+    assert dp.conteo_distintivo(dataframe, "V").iloc[0, 0] == 99
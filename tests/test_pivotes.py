@@ -0,0 +1,104 @@
+# _pivote_nunique contra pd.pivot_table(aggfunc="nunique", observed=True) y la memorización de tabla_pivote.
+import gc
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_preprocessing as dp
+
+def _frame_aleatorio(rng, filas, nulos=0.3):
+    valores = np.array(["u", "w", "z", None, np.nan], dtype=object)
+    probabilidades = np.array([(1 - nulos) / 3] * 3 + [nulos / 2] * 2)
+    return pd.DataFrame({
+        "F": rng.choice(np.array(["b", "a", "c", None], dtype=object), filas, p=[0.4, 0.3, 0.2, 0.1]),
+        "G": rng.choice(np.array(["q", "p"], dtype=object), filas),
+        "C": rng.choice(np.array(["y", "x", "w", None], dtype=object), filas, p=[0.4, 0.3, 0.2, 0.1]),
+        "V": rng.choice(valores, filas, p=probabilidades),
+        "N": rng.integers(0, 4, filas).astype(np.float64)
+    })
+
+def _esperado(dataframe, filas, valores, columnas, margins):
+    if valores is None:
+        dataframe = dataframe.assign(aux_column=np.arange(dataframe.shape[0]))
+        valores = "aux_column"
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return pd.pivot_table(dataframe, index=filas, values=valores, columns=columnas, aggfunc="nunique", margins=margins, margins_name="Total", observed=True)
+
+# Nulos en llaves y valores (None y NaN), orden de filas y columnas, márgenes y tipos de cada celda
+@pytest.mark.parametrize("semilla", range(5))
+@pytest.mark.parametrize("filas", ["F", ["F", "G"]])
+@pytest.mark.parametrize("columnas", [None, "C"])
+@pytest.mark.parametrize("margins", [True, False])
+@pytest.mark.parametrize("valores", ["V", "N"])
+def test_nunique_igual_a_pivot_table(semilla, filas, columnas, margins, valores):
+    rng = np.random.default_rng(semilla)
+    comparadas = 0
+    for _ in range(40):
+        dataframe = _frame_aleatorio(rng, int(rng.integers(1, 15)), nulos=float(rng.choice([0.0, 0.3, 0.8])))
+        try:
+            esperado = _esperado(dataframe, filas, valores, columnas, margins)
+        except (ValueError, KeyError, TypeError):
+            continue
+        obtenido = dp._pivote_nunique(dataframe, filas, valores, columnas, margins, "Total")
+        if obtenido is None:
+            continue
+        pd.testing.assert_frame_equal(obtenido, esperado)
+        comparadas += 1
+    assert comparadas > 0
+
+def test_nunique_sin_valores_cuenta_filas():
+    dataframe = _frame_aleatorio(np.random.default_rng(7), 30)
+    pd.testing.assert_frame_equal(dp.tabla_pivote(dataframe, "F", columnas="C"), _esperado(dataframe, "F", None, "C", True))
+
+def test_nunique_categoricas_y_fechas():
+    rng = np.random.default_rng(3)
+    dataframe = _frame_aleatorio(rng, 200)
+    dataframe["F"] = dataframe["F"].astype("category")
+    dataframe["D"] = pd.to_datetime("2025-01-01") + pd.to_timedelta(rng.integers(0, 5, 200), unit="D")
+    for filas, valores, columnas in [("F", "V", "C"), ("D", "V", None), (["F", "G"], "D", "C")]:
+        pd.testing.assert_frame_equal(dp._pivote_nunique(dataframe, filas, valores, columnas, True, "Total"), _esperado(dataframe, filas, valores, columnas, True))
+
+# Un grupo cuyos valores son todos nulos: las celdas del margen conservan su tipo entero
+def test_nunique_margen_con_columna_sin_valores():
+    dataframe = pd.DataFrame({"F": list("abab"), "C": list("xxyy"), "V": ["u", "w", None, None]})
+    obtenido = dp._pivote_nunique(dataframe, "F", "V", "C", True, "Total")
+    pd.testing.assert_frame_equal(obtenido, _esperado(dataframe, "F", "V", "C", True))
+    assert obtenido["x"].dtype == np.int64
+
+def test_sin_memorizar_ve_escrituras_en_el_mismo_arreglo():
+    dataframe = pd.DataFrame({"P": list("aab"), "V": [1.0, 2.0, 3.0], "S": list("xyx")})
+    assert dp.tabla_pivote(dataframe, "P", "V")["V"].tolist() == [3.0, 3.0, 6.0]
+    dataframe.loc[0, "V"] = 100.0
+    assert dp.tabla_pivote(dataframe, "P", "V")["V"].tolist() == [102.0, 3.0, 105.0]
+    dataframe.loc[1, "S"] = "z"
+    assert dp.tabla_pivote(dataframe, "P", columnas="S").columns.tolist() == ["x", "z", "Total"]
+    assert not dp._PIVOTES_MEMORIZADOS
+
+def test_memo_detecta_columnas_reasignadas_y_se_olvida():
+    dataframe = pd.DataFrame({"P": list("aab"), "V": [1.0, 2.0, 3.0], "S": list("xyx")})
+    assert dp.tabla_pivote(dataframe, "P", "V", memorizar=True)["V"].tolist() == [3.0, 3.0, 6.0]
+    dataframe["V"] = [10.0, 2.0, 3.0]
+    assert dp.tabla_pivote(dataframe, "P", "V", memorizar=True)["V"].tolist() == [12.0, 3.0, 15.0]
+    dataframe["S"] = dataframe["S"].astype("category")
+    dp.tabla_pivote(dataframe, "P", columnas="S", memorizar=True)
+    dataframe.loc[0, "V"] = 100.0
+    dp.olvidar_pivotes(dataframe)
+    assert dp.tabla_pivote(dataframe, "P", "V", memorizar=True)["V"].tolist() == [102.0, 3.0, 105.0]
+    dataframe["S"] = dataframe["S"].cat.add_categories("z")
+    dataframe.loc[1, "S"] = "z"
+    dp.olvidar_pivotes()
+    assert dp.tabla_pivote(dataframe, "P", columnas="S", memorizar=True).columns.tolist() == ["x", "z", "Total"]
+
+def test_memo_regresa_copias_y_libera_el_dataframe():
+    dataframe = pd.DataFrame({"P": list("aab"), "V": [1.0, 2.0, 3.0]})
+    primera = dp.tabla_pivote(dataframe, "P", "V", memorizar=True)
+    primera.iloc[0, 0] = -1
+    assert dp.tabla_pivote(dataframe, "P", "V", memorizar=True).iloc[0, 0] == 3.0
+    llaves = [ llave for llave in dp._PIVOTES_MEMORIZADOS if llave[0] == id(dataframe) ]
+    assert llaves
+    del dataframe
+    gc.collect()
+    assert not any(llave in dp._PIVOTES_MEMORIZADOS for llave in llaves)
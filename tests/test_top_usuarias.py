@@ -0,0 +1,52 @@
+# Top usuarias desde los CSV mensuales y desde el almacén, con dos archivos del mismo mes.
+import pandas as pd
+import pytest
+
+import data_preprocessing as dp
+
+VENTA = "MONTO_DE_VENTA_NETA_ACUMULADA_AL_CIERRE_DE_MES"
+
+# Otro archivo del mes 1 con ventas distintas
+@pytest.fixture
+def mes_repetido(datos, tmp_path):
+    reporte = pd.read_csv(datos["RMR"][0], dtype=str, keep_default_na=False)
+    reporte[VENTA] = (pd.to_numeric(reporte[VENTA], errors="coerce").fillna(0) * 3 + 1).astype(str)
+    archivo = tmp_path / "Reportedemetasyresultados_1b.csv"
+    reporte.to_csv(archivo, index=False)
+    return archivo
+
+@pytest.fixture
+def hojas(monkeypatch, tmp_path):
+    exportadas = []
+    monkeypatch.setattr(dp, "exportar_excel", lambda sheets, nombre, **opciones: exportadas.append((nombre, sheets)))
+    monkeypatch.chdir(tmp_path)
+    return exportadas
+
+def _iguales(obtenidas, esperadas):
+    assert obtenidas[0] == esperadas[0]
+    assert [ nombre for nombre, _ in obtenidas[1] ] == [ nombre for nombre, _ in esperadas[1] ]
+    for (_, obtenida), (_, esperada) in zip(obtenidas[1], esperadas[1]):
+        pd.testing.assert_frame_equal(obtenida, esperada)
+
+@pytest.mark.parametrize("con_almacen", [False, True])
+def test_dos_archivos_del_mismo_mes_cuenta_el_ultimo(datos, mes_repetido, hojas, tmp_path, con_almacen):
+    almacen = tmp_path / "almacen.feather" if con_almacen else None
+    dp.top_usuarias([datos["RMR"][0], mes_repetido, datos["RMR"][1]], almacen=almacen)
+    dp.top_usuarias([mes_repetido, datos["RMR"][1]])
+    assert hojas[0][0] == "Top_users_months_1_2.xlsx"
+    _iguales(hojas[0], hojas[1])
+
+def test_almacen_reemplaza_el_mes(datos, mes_repetido, tmp_path):
+    almacen = tmp_path / "almacen.feather"
+    dp.actualizar_almacen_top_usuarias([datos["RMR"][0], datos["RMR"][1]], almacen=almacen)
+    store = dp.actualizar_almacen_top_usuarias([mes_repetido], almacen=almacen)
+    assert sorted(set(zip(store["AÑO"], store["MES"]))) == [(2025, 1), (2025, 2)]
+    esperado = dp._resumir_mes_top_usuarias(dp._leer_mes_top_usuarias(mes_repetido))
+    obtenido = store[store["MES"] == 1].reset_index(drop=True)
+    pd.testing.assert_frame_equal(obtenido, esperado.sort_values("ID_UNICO_ANDREA").reset_index(drop=True), check_dtype=False)
+    assert len(dp.cargar_almacen_top_usuarias(almacen).attrs["archivos"]) == 2
+
+def test_el_mes_repetido_cambia_las_hojas(datos, mes_repetido, hojas):
+    dp.top_usuarias([datos["RMR"][0], datos["RMR"][1]])
+    dp.top_usuarias([mes_repetido, datos["RMR"][1]])
+    assert not all(obtenida.equals(esperada) for (_, obtenida), (_, esperada) in zip(hojas[0][1], hojas[1][1]))